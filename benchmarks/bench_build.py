@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# bench_build.py
+
+"""
+Benchmarks the build pipeline on a synthetic corpus (see corpus.py): the site is built from the corpus in a scratch
+directory, in three scenarios, each run in a fresh process:
+
+    cold    no caches and no output (a first build)
+    warm    nothing has changed since the previous build (a no-op rebuild)
+    edit    one post has been edited since the previous build
+
+Each build is timed with the build metrics (see sitegen.metrics), and the time of each stage (post database, markdown
+transforms, image compression, template rendering, sitemap, post cache, ...) is reported, as the median of --repeat
+runs. Results are saved as JSON; if a baseline is given, results are compared with it, and the benchmark fails if any
+timing has regressed by more than --threshold (and by more than --min-delta, so that noise in very short timings is
+ignored). Run from the repo root, e.g.:
+
+    python3 benchmarks/bench_build.py --posts 200 --images 40 --output bench.json
+    python3 benchmarks/bench_build.py --save-baseline benchmarks/baseline.json
+    python3 benchmarks/bench_build.py --baseline benchmarks/baseline.json --threshold 0.15
+"""
+
+import argparse
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitegen import *
+from corpus import CorpusSpec, generate_corpus, corpus_spec
+
+SCENARIOS = ['cold', 'warm', 'edit']
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_timings() -> Dict[str, float]:
+    """Builds the site in the current directory with metrics enabled, and returns the timings of the build (units: s):
+    'build' (the whole build), 'stage.<name>' for each stage, and the totals of posts, markdown, transforms, images and
+    templates (summed over all posts, images or pages), along with the counters of the build (prefixed with 'count.')."""
+    metrics.enabled = True
+    post_cache = PostCache(Params.POST_CACHE_PATH)
+    build_site(post_cache, log=lambda message: None)
+    post_cache.close()
+
+    timings: Dict[str, float] = {}
+    for total in metrics.report()['totals']:
+        if total['category'] in ['build', 'stage']:
+            timings[f'{total["category"]}.{total["name"]}'.replace('build.build', 'build')] = total['total_s']
+        else:
+            timings[total['category']] = timings.get(total['category'], 0.0) + total['total_s']
+    timings.update({f'count.{name}': n for name, n in metrics.counters.items()})
+
+    return timings
+
+
+def run_build(site_dir: str) -> Dict[str, float]:
+    """Runs build_timings() in a fresh process in 'site_dir' (so that no in-process cache carries over from one build to
+    the next)."""
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--build-in', site_dir],
+                            stdout=subprocess.PIPE, check=True, text=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def prepare_site(site_dir: str, spec: CorpusSpec) -> List[str]:
+    """Sets up a site in 'site_dir': the repo's templates, and a generated corpus as its posts."""
+    shutil.copytree(os.path.join(REPO_PATH, Params.TEMPLATE_PATH), os.path.join(site_dir, Params.TEMPLATE_PATH))
+    return generate_corpus(os.path.join(site_dir, Params.POSTS_PATH), spec)
+
+
+def clear_build(site_dir: str) -> None:
+    """Removes the output and caches of previous builds."""
+    for path in [Params.OUTPUT_PATH, Params.CACHE_PATH]:
+        shutil.rmtree(os.path.join(site_dir, path), ignore_errors=True)
+
+
+def edit_post(site_dir: str, filename: str, n: int) -> None:
+    """Appends a (different, each time) paragraph to a post."""
+    with open(os.path.join(site_dir, Params.POSTS_PATH, filename), 'a') as f:
+        f.write(f'\nEdited paragraph {n}: lorem ipsum dolor sit amet.\n')
+
+
+def run_benchmark(spec: CorpusSpec, repeat: int) -> dict:
+    """Runs every scenario 'repeat' times on a corpus, and returns the median timings of each."""
+    runs: Dict[str, List[Dict[str, float]]] = {scenario: [] for scenario in SCENARIOS}
+
+    with tempfile.TemporaryDirectory(prefix='sitegen-bench-') as site_dir:
+        print(f'Generating corpus ({spec.posts} posts, {spec.images} images)...')
+        filenames = prepare_site(site_dir, spec)
+
+        for i in range(repeat):
+            clear_build(site_dir)
+            runs['cold'].append(run_build(site_dir))
+            runs['warm'].append(run_build(site_dir))
+            edit_post(site_dir, filenames[len(filenames) // 2], i)
+            runs['edit'].append(run_build(site_dir))
+            print(f'[{i + 1}/{repeat}] ' + ', '.join(f'{scenario} {runs[scenario][-1]["build"]:.2f} s'
+                                                     for scenario in SCENARIOS))
+
+    results = {}
+    for scenario, scenario_runs in runs.items():
+        keys = sorted({key for run in scenario_runs for key in run})
+        results[scenario] = {key: statistics.median(run.get(key, 0) for run in scenario_runs) for key in keys}
+
+    return {'corpus': json.loads(json.dumps(spec._asdict())), 'repeat': repeat, 'python': platform.python_version(),
+            'machine': platform.machine(), 'cpus': os.cpu_count(), 'results': results}
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> List[str]:
+    """Prints a comparison of the timings of 'results' with those of 'baseline', and returns the regressions (timings
+    that are slower by more than 'threshold', as a fraction, and by more than 'min_delta' seconds)."""
+    if results['corpus'] != baseline['corpus']:
+        print('WARNING: the baseline was run on a different corpus.')
+
+    regressions = []
+    print(f'{"timing":<34} {"baseline (s)":>13} {"current (s)":>12} {"change":>8}')
+    for scenario in SCENARIOS:
+        for key, current in results['results'][scenario].items():
+            previous = baseline['results'].get(scenario, {}).get(key)
+            if key.startswith('count.') or previous is None:
+                continue
+            change = (current - previous) / previous if previous > 0 else 0.0
+            regressed = (change > threshold) and (current - previous > min_delta)
+            print(f'{scenario + " " + key:<34} {previous:>13.3f} {current:>12.3f} {change:>+8.1%}'
+                  f'{"  REGRESSION" if regressed else ""}')
+            if regressed:
+                regressions.append(f'{scenario} {key}')
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for field, default in CorpusSpec._field_defaults.items():
+        if field != 'image_sizes':
+            parser.add_argument(f'--{field.replace("_", "-")}', type=int, default=default)
+    parser.add_argument('--image-sizes', default=','.join(f'{w}x{h}' for w, h in CorpusSpec().image_sizes),
+                        help='comma-separated image sizes (e.g. 800x600,1600x1200), used in turn')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each scenario')
+    parser.add_argument('--output', help='path to which the results are saved (JSON)')
+    parser.add_argument('--baseline', help='path of the results to compare with')
+    parser.add_argument('--save-baseline', help='path to which the results are saved as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='largest allowed slowdown of any timing, as a fraction of the baseline')
+    parser.add_argument('--min-delta', type=float, default=0.02,
+                        help='smallest slowdown (units: s) that counts as a regression')
+    parser.add_argument('--build-in', help=argparse.SUPPRESS)  # (runs a single build; see run_build())
+    args = parser.parse_args()
+
+    if args.build_in is not None:
+        os.chdir(args.build_in)
+        print(json.dumps(build_timings()))
+        return
+
+    results = run_benchmark(corpus_spec(args), args.repeat)
+
+    print(f'\n{"timing":<34} ' + ' '.join(f'{scenario + " (s)":>10}' for scenario in SCENARIOS))
+    for key in sorted({key for scenario in SCENARIOS for key in results['results'][scenario]}):
+        if not key.startswith('count.'):
+            print(f'{key:<34} ' + ' '.join(f'{results["results"][scenario].get(key, 0):>10.3f}' for scenario in SCENARIOS))
+
+    for path in [args.output, args.save_baseline]:
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=1, sort_keys=True)
+            print(f'Results saved to {path}.')
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            raise SystemExit(f'{len(regressions)} timings regressed: {", ".join(regressions)}')
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# bench_transforms.py
+
+"""
+Compares the single-pass html transformation of md_to_post_html() with the chained passes it replaced (one find_all()
+scan per transformation, custom tags replaced by parsing new markup, and two more parses of the result to build the
+table of contents), checking that both produce identical output for each post.
+
+Run from the repo root (so that the paths in Params resolve), e.g.:
+
+    python3 benchmarks/bench_transforms.py --repeat 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitegen import *
+
+
+def chained_post_html(text: str, post_title: str, slug: str) -> Tuple[str, list]:
+    """The chained passes, as md_to_html(), build_toc_list() and add_toc_id_tags() used to run them."""
+    renderer = HighlighterRenderer()
+    converter = m.Markdown(renderer, extensions=MARKDOWN_EXTENSIONS)
+    soup = BeautifulSoup(converter(downgrade_md_headings(text)), features='html.parser')
+
+    soup = add_table_tags(soup)
+    soup = set_table_col_widths(soup)
+    soup = add_blockquote_class(soup)
+    soup = render_checkbox_list(soup)
+    soup = compress_blog_images(soup)
+    soup = render_image_float_center(soup)
+    soup = render_image_float_left(soup)
+    soup = render_image_float_right(soup)
+    soup = render_image_carousels(soup)
+    soup = render_youtube_embeds(soup)
+
+    post = {'post_title': post_title, 'slug': slug, 'post_body': str(soup)}
+    post['toc_list'] = build_toc_list(post)
+    post = add_toc_id_tags(post)
+
+    return post['post_body'], post['toc_list']
+
+
+def time_per_call(function: Callable, repeat: int, *args) -> float:
+    st = time.perf_counter()
+    for _ in range(repeat):
+        function(*args)
+    return (time.perf_counter() - st) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', default=Params.POSTS_PATH, help='directory of markdown-formatted posts')
+    parser.add_argument('--repeat', type=int, default=10, help='number of timed runs per post')
+    args = parser.parse_args()
+
+    posts = sorted(post for post in os.listdir(args.posts) if is_markdown(post))
+
+    print(f'{"post":<24} {"chained (ms)":>14} {"single-pass (ms)":>18} {"speedup":>9}')
+    total_chained, total_single = 0.0, 0.0
+    for post in posts:
+        meta = read_post_metadata(post, args.posts)
+        text = read_post_text(post, args.posts, output_format='md')
+        call_args = (text, meta['post_title'], meta['slug'])
+
+        # the first calls also compress any images, so they are run (and compared) before timing
+        chained_html, chained_toc = chained_post_html(*call_args)
+        single_html, single_toc = md_to_post_html(*call_args)
+        if (chained_html != single_html) or (chained_toc != single_toc):
+            raise SystemExit(f'Output of the single pass differs from that of the chained passes for {post}.')
+
+        chained = time_per_call(chained_post_html, args.repeat, *call_args)
+        single = time_per_call(md_to_post_html, args.repeat, *call_args)
+        total_chained += chained
+        total_single += single
+        print(f'{post:<24} {chained * 1000:>14.2f} {single * 1000:>18.2f} {chained / single:>8.2f}x')
+
+    print(f'{"total":<24} {total_chained * 1000:>14.2f} {total_single * 1000:>18.2f} {total_chained / total_single:>8.2f}x')
+    print('Output identical for all posts.')
+
+
+if __name__ == '__main__':
+    main()
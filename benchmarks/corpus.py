@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# corpus.py
+
+"""
+Generates a synthetic corpus of posts (and the images they link to) for benchmarking builds. The corpus is fully
+determined by its parameters and seed, so that the same corpus can be regenerated to compare builds over time.
+
+Each post has a YAML header like those of the example posts, paragraphs of lorem ipsum, and the requested number of
+headings (which make up its table of contents), tables, fenced code blocks, checkbox lists and custom image tags
+(<float-left>, <float-right>, <float-center> and <carousel>, in turn). Images are generated in each of the given sizes,
+and linked from posts in turn. Run from the repo root, e.g.:
+
+    python3 benchmarks/corpus.py /tmp/corpus --posts 200 --images 40
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitegen import *
+
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+         'magna aliqua nullam vehicula arcu cursus vitae congue est ullamcorper eget nulla facilisi auctor augue lectus '
+         'bibendum tortor risus viverra pretium vulputate sapien nec sagittis aliquam malesuada netus fames turpis '
+         'egestas accumsan nisl nisi scelerisque').split()
+TOPICS = ['images', 'toc', 'tables', 'code', 'lists', 'carousel', 'travel', 'notes', 'reviews', 'python']
+CODE_LANGUAGES = ['python', 'javascript', 'c', 'bash']
+CUSTOM_TAGS = ['float-left', 'float-right', 'float-center', 'carousel']
+
+
+class CorpusSpec(NamedTuple):
+    """Parameters of a synthetic corpus (the amounts of each kind of content are per post)."""
+    posts: int = 50
+    paragraphs: int = 8
+    headings: int = 6
+    tables: int = 1
+    code_blocks: int = 2
+    checklists: int = 1
+    custom_tags: int = 2
+    images: int = 12  # distinct images in the corpus, linked from posts in turn
+    image_sizes: Tuple[Tuple[int, int], ...] = ((800, 600), (1600, 1200), (3000, 2000))
+    seed: int = 0
+
+
+def generate_corpus(directory: str, spec: CorpusSpec = CorpusSpec()) -> List[str]:
+    """Writes the posts of a corpus to 'directory' and its images to 'directory/images/'.
+
+    Returns:
+        filenames of the posts
+    """
+    rng = random.Random(spec.seed)
+    os.makedirs(os.path.join(directory, 'images'), exist_ok=True)
+
+    images = []
+    for i in range(spec.images):
+        width, height = spec.image_sizes[i % len(spec.image_sizes)]
+        image = f'image_{i:04d}.jpg'
+        generate_image(os.path.join(directory, 'images', image), width, height, rng)
+        images.append(image)
+
+    filenames = []
+    n_linked = 0
+    for i in range(spec.posts):
+        filename = f'post_{i:05d}.md'
+        text, n_linked = generate_post(i, spec, images, n_linked, rng)
+        with open(os.path.join(directory, filename), 'w') as f:
+            f.write(text)
+        filenames.append(filename)
+
+    return filenames
+
+
+def generate_image(path: str, width: int, height: int, rng: random.Random) -> None:
+    """Writes a jpeg of smooth random colour (upscaled noise), which compresses more like a photo than noise does."""
+    small = Image.frombytes('RGB', (max(width // 32, 1), max(height // 32, 1)),
+                            rng.randbytes(max(width // 32, 1) * max(height // 32, 1) * 3))
+    small.resize((width, height), Image.BICUBIC).save(path, 'JPEG', quality=95)
+
+
+def generate_post(i: int, spec: CorpusSpec, images: List[str], n_linked: int, rng: random.Random) -> Tuple[str, int]:
+    """Returns the text of the i-th post of a corpus, and the number of images linked so far (images are linked in
+    turn, continuing from 'n_linked')."""
+    def sentence(n_words: int) -> str:
+        words = [rng.choice(WORDS) for _ in range(n_words)]
+        return ' '.join(words).capitalize() + '.'
+
+    def paragraph() -> str:
+        return ' '.join(sentence(rng.randint(6, 16)) for _ in range(rng.randint(3, 7)))
+
+    def next_images(n: int) -> List[str]:
+        nonlocal n_linked
+        linked = [images[(n_linked + j) % len(images)] for j in range(n)] if images else []
+        n_linked += n
+        return [f'![{os.path.splitext(image)[0]}](images/{image})' for image in linked]
+
+    date = datetime(2015, 1, 1) + timedelta(days=i, hours=rng.randint(0, 23))
+    blocks = []
+    for j in range(spec.tables):
+        n_cols = rng.randint(2, 5)
+        rows = [' | '.join(sentence(2)[:-1] for _ in range(n_cols)) for _ in range(rng.randint(3, 10))]
+        blocks.append('\n'.join([rows[0], ' | '.join(['---'] * n_cols)] + rows[1:]))
+    for j in range(spec.code_blocks):
+        language = rng.choice(CODE_LANGUAGES)
+        lines = [f'{"    " * rng.randint(0, 2)}{rng.choice(WORDS)}_{k} = {rng.choice(WORDS)}({rng.randint(0, 99)})'
+                 for k in range(rng.randint(5, 30))]
+        blocks.append(f'```{language}\n' + '\n'.join(lines) + '\n```')
+    for j in range(spec.checklists):
+        blocks.append('\n'.join(f' - [{rng.choice([" ", "x"])}] {sentence(rng.randint(2, 6))}'
+                                for _ in range(rng.randint(3, 8))))
+    for j in range(spec.custom_tags):
+        tag = CUSTOM_TAGS[(i + j) % len(CUSTOM_TAGS)]
+        if not images:
+            break
+        if tag == 'carousel':
+            blocks.append('<carousel>\n' + '\n'.join(next_images(3)) + '\n</carousel>')
+        elif tag == 'float-center':
+            blocks.append(f'<float-center caption="{sentence(4)}">\n{next_images(1)[0]}\n</float-center>')
+        else:
+            blocks.append(f'<{tag} width="40%">\n{next_images(1)[0]}\n</{tag}>')
+
+    # headings and other blocks are spread between the paragraphs
+    body = [paragraph() for _ in range(spec.paragraphs)]
+    for j in range(spec.headings):
+        level = '#' if (j == 0) or (rng.random() < 0.4) else '##'
+        body.insert(rng.randint(0, len(body)), f'{level} {sentence(rng.randint(1, 4))[:-1]}')
+    for block in blocks:
+        body.insert(rng.randint(0, len(body)), block)
+
+    header = ['---',
+              f'post_title: {sentence(rng.randint(3, 8))[:-1]}',
+              f'post_description: {sentence(rng.randint(8, 14))}',
+              'author: Author',
+              f'date: {date:%Y-%m-%d %H:%M:%S}',
+              f'slug: post_{i:05d}',
+              'topics:'] + \
+             [f'- {topic}' for topic in rng.sample(TOPICS, rng.randint(1, 3))] + \
+             ['related_posts:',
+              f'render_toc: {spec.headings > 0}',
+              'enable_comments: True',
+              '---']
+
+    return '\n'.join(header) + '\n\n' + '\n\n'.join(body) + '\n', n_linked
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='directory to which the posts are written (images go to its images/)')
+    for field, default in CorpusSpec._field_defaults.items():
+        if field != 'image_sizes':
+            parser.add_argument(f'--{field.replace("_", "-")}', type=int, default=default)
+    parser.add_argument('--image-sizes', default=','.join(f'{w}x{h}' for w, h in CorpusSpec().image_sizes),
+                        help='comma-separated image sizes (e.g. 800x600,1600x1200), used in turn')
+    args = parser.parse_args()
+
+    spec = corpus_spec(args)
+    filenames = generate_corpus(args.directory, spec)
+    print(f'{len(filenames)} posts and {spec.images} images written to {args.directory}.')
+
+
+def corpus_spec(args: argparse.Namespace) -> CorpusSpec:
+    """Returns the CorpusSpec of parsed command-line arguments (see main())."""
+    image_sizes = tuple(tuple(int(n) for n in size.split('x')) for size in args.image_sizes.split(','))
+    return CorpusSpec(**{field: getattr(args, field) for field in CorpusSpec._fields if field != 'image_sizes'},
+                      image_sizes=image_sizes)
+
+
+if __name__ == '__main__':
+    main()
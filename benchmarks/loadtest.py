@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# loadtest.py
+
+"""
+Load-tests the preview server against the built site: a number of concurrent clients request every file in the output
+directory in turn, for a fixed duration, and the request rate and latency percentiles are reported.
+
+Unless --url is given, the preview server is started (in a separate process, so that it does not compete with the
+clients for the GIL) on the output directory. Build the site first, then run from the repo root, e.g.:
+
+    python3 benchmarks/loadtest.py --concurrency 8 --duration 10
+    python3 benchmarks/loadtest.py --conditional --gzip
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitegen import *
+
+
+def site_paths(directory: str) -> List[str]:
+    """Returns the url path of every file in 'directory'."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            paths.append('/' + quote(os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/')))
+    return paths
+
+
+def start_server(directory: str, port: int) -> subprocess.Popen:
+    """Starts the preview server in a separate process, and waits until it accepts connections."""
+    serve_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sitegen', 'serve.py')
+    server = subprocess.Popen([sys.executable, serve_script, directory, str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('localhost', port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    raise SystemExit(f'The preview server did not start on port {port}.')
+
+
+def run_client(host: str, port: int, paths: List[str], offset: int, deadline: float, args: argparse.Namespace, results: list) -> None:
+    """Requests 'paths' in turn (starting at 'offset') until 'deadline', appending (status, latency, bytes) to 'results'."""
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    etags: Dict[str, str] = {}
+    local_results = []
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {}
+        if args.gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        if args.conditional and (path in etags):
+            headers['If-None-Match'] = etags[path]
+        if args.no_keepalive:
+            headers['Connection'] = 'close'
+
+        st = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            local_results.append((None, time.perf_counter() - st, 0))
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=10)
+            continue
+        local_results.append((response.status, time.perf_counter() - st, len(body)))
+
+        if response.getheader('ETag') is not None:
+            etags[path] = response.getheader('ETag')
+        if args.no_keepalive or (response.getheader('Connection', '').lower() == 'close'):
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=10)
+
+    connection.close()
+    results.extend(local_results)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=Params.OUTPUT_PATH, help='built site directory (files to request)')
+    parser.add_argument('--url', default=None, help='url of an already-running server (default: start one)')
+    parser.add_argument('--port', type=int, default=8765, help='port on which to start the server')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='duration of the test (units: s)')
+    parser.add_argument('--conditional', action='store_true', help='revalidate with If-None-Match after the first fetch')
+    parser.add_argument('--gzip', action='store_true', help='accept gzip-encoded responses')
+    parser.add_argument('--no-keepalive', action='store_true', help='open a new connection for every request')
+    args = parser.parse_args()
+
+    paths = site_paths(args.dir)
+    if not paths:
+        raise SystemExit(f'No files found in {args.dir}; build the site first.')
+
+    server = None
+    if args.url is None:
+        host, port = 'localhost', args.port
+        server = start_server(args.dir, port)
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+
+    try:
+        results: List[tuple] = []
+        deadline = time.perf_counter() + args.duration
+        clients = [threading.Thread(target=run_client, args=(host, port, paths, i * len(paths) // args.concurrency,
+                                                             deadline, args, results))
+                   for i in range(args.concurrency)]
+        st = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - st
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(latency * 1000 for _, latency, _ in results)
+    statuses = Counter('error' if status is None else status for status, _, _ in results)
+    print(f'{len(paths)} files, {args.concurrency} clients, {elapsed:.1f} s'
+          f'{", conditional" if args.conditional else ""}{", gzip" if args.gzip else ""}'
+          f'{", no keep-alive" if args.no_keepalive else ""}')
+    print(f'requests:     {len(results)} ({", ".join(f"{status}: {n}" for status, n in sorted(statuses.items(), key=str))})')
+    print(f'requests/s:   {len(results) / elapsed:.1f}')
+    print(f'transfer:     {sum(size for _, _, size in results) / elapsed / 1024:.1f} KiB/s')
+    print(f'latency (ms): p50 {percentile(latencies, 0.5):.2f}, p90 {percentile(latencies, 0.9):.2f}, '
+          f'p99 {percentile(latencies, 0.99):.2f}, max {latencies[-1]:.2f}')
+
+
+if __name__ == '__main__':
+    main()
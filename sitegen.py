@@ -3,121 +3,80 @@
 
 # sitegen.py
 
-print('\nGenerating site.\n---------------')
-
 # Time site generation
 import time
 st = time.time()
 elapsed_time = lambda: time.time() - st
 
 # Module Import
+import argparse
+import traceback
 from sitegen import *
 
-# Empty output directory if it already exists
-if os.path.exists(Params.OUTPUT_PATH):
-    shutil.rmtree(Params.OUTPUT_PATH)
-
-# Copy site assets from the template directory that that will not be modified by this program (e.g. the 'Resume' page)
-shutil.copytree(Params.TEMPLATE_PATH, Params.OUTPUT_PATH, ignore=shutil.ignore_patterns('index.html', 'all-topics.html', 'all-posts.html', 'blog-post.html'))
-
-# Move image assets that have already been processed (in previous builds) to the output directory (so we don't waste
-# time repeating the process)
-if os.path.exists(Params.IMAGE_CACHE_PATH):
-    print(f'[{elapsed_time():5.2f} s] Copying cached images to output directory...')
-    for image in os.listdir(Params.IMAGE_CACHE_PATH):
-        shutil.copy(Params.IMAGE_CACHE_PATH + image, Params.OUTPUT_PATH + Params.BLOG_IMAGE_PATH)
-
-# Move additional (non-image) files, if they exist, from the ADDITIONAL_FILES_PATH to the BLOG_ADDITIONAL_FILES_PATH
-if os.path.exists(Params.ADDITIONAL_FILES_PATH):
-    if not os.path.exists(Params.BLOG_ADDITIONAL_FILES_PATH):
-        os.makedirs(Params.OUTPUT_PATH + Params.BLOG_ADDITIONAL_FILES_PATH)
-    for file in os.listdir(Params.ADDITIONAL_FILES_PATH):
-        shutil.copy(Params.ADDITIONAL_FILES_PATH + file, Params.OUTPUT_PATH + Params.BLOG_ADDITIONAL_FILES_PATH)
-
-# Load cached 'post_db' (if it exists) to avoid re-processing all assets on every build
-if os.path.exists(f'{Params.CACHE_PATH}post_cache.json'):
-    print(f'[{elapsed_time():5.2f} s] Loading cached post database...')
-    with open(f'{Params.CACHE_PATH}post_cache.json', 'r') as post_cache:
-        cached_post_db = json.load(post_cache)
-else:
-    print(f'[{elapsed_time():5.2f} s] Cached post database not found. Initializing post database...')
-    cached_post_db = None
-
-# Gather and process posts
-print(f'[{elapsed_time():5.2f} s] Updating post database...')
-post_db = build_post_db(Params.POSTS_PATH, Params.BLOG_PATH, cached_post_db)
-pagination_dict = build_blog_pagination_dict(post_db, posts_per_page=Params.POSTS_PER_PAGE)
-topic_posts_dict = build_topic_dict(post_db, 'date')
-
-print(f'[{elapsed_time():5.2f} s] Creating output directories...')
-make_output_dirs(post_db, pagination_dict, Params.OUTPUT_PATH)
-
-# Render all individual blog post pages
-print(f'[{elapsed_time():5.2f} s] Generating pages for each post...')
-for post in pagination_dict['all_posts']:
-    html = render_from_template(Params.TEMPLATE_PATH, 'blog-post.html', **post_db[post], post_db=post_db)
-
-    with open(Params.OUTPUT_PATH + post_db[post]['url'], 'w') as f:
-        f.write(html)
-
-# Render 'all-topics' page, listing all topics and all posts in each
-print(f'[{elapsed_time():5.2f} s] Generating "all-topics" page...')
-with open(Params.OUTPUT_PATH + Params.BLOG_PATH + 'all-topics.html', 'w') as f:
-    html = render_from_template(Params.TEMPLATE_PATH, 'all-topics.html', topic_posts_dict=topic_posts_dict, post_db=post_db)
-    f.write(html)
-
-# Render 'all-posts' page
-print(f'[{elapsed_time():5.2f} s] Generating "all-posts" page...')
-with open(Params.OUTPUT_PATH + Params.BLOG_PATH + 'all-posts.html', 'w') as f:
-    newest_posts = get_newest_posts(post_db)
-    html = render_from_template(Params.TEMPLATE_PATH, 'all-posts.html', newest_posts=newest_posts, post_db=post_db)
-    f.write(html)
-
-# Render blog index
-print(f'[{elapsed_time():5.2f} s] Generating blog index...')
-for page_number in range(pagination_dict['n_pages'] + 1)[1:]:
-    # rel and prev links to add to page <head>
-    if pagination_dict['n_pages'] > 1:
-        if page_number == 1:
-            rel_links = f'<link rel="next" href="{pagination_dict[page_number + 1]["url"]}"/>'
-        elif page_number == pagination_dict['n_pages']:
-            rel_links = f'<link rel="prev" href="{pagination_dict[page_number - 1]["url"]}"/>'
-        else:
-            rel_links = f'<link rel="next" href="{pagination_dict[page_number + 1]["url"]}"/>\n<link rel="prev" href="{pagination_dict[page_number - 1]["url"]}"/>'
-    else:
-        rel_links = ''
-
-    html = render_from_template(Params.TEMPLATE_PATH, 'index.html', post_db=post_db, pagination_dict=pagination_dict, current_page=page_number, rel_links=rel_links)
-
-    with open(Params.OUTPUT_PATH + pagination_dict[page_number]['url'] + 'index.html', 'w') as f:
-        f.write(html)
-
-# Generate sitemap
-generate_sitemap(post_db)
 
-# Cache 'post_db' so that we can keep track of what has changed from build-to-build
-print(f'[{elapsed_time():5.2f} s] Caching posts...')
-if not os.path.exists(Params.CACHE_PATH):
-    os.makedirs(Params.CACHE_PATH)
+def main() -> None:
+    global st
+    print('\nGenerating site.\n---------------')
 
-with open(f'{Params.CACHE_PATH}post_cache.json', 'w') as post_cache:
-    json.dump(post_db, post_cache, default=str) # 'default=str' used as datetime is not serializable by default
+    parser = argparse.ArgumentParser(description='Builds the site, then serves a preview of it (if Params.PREVIEW).')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running after the build, rebuilding whenever a post, image or template changes, and '
+                             'serve a preview that reloads itself after each rebuild')
+    parser.add_argument('--metrics', action='store_true',
+                        help=f'record timing spans and counters of each build, saved to {Params.METRICS_REPORT_PATH} and '
+                             f'(as a Chrome trace) to {Params.METRICS_TRACE_PATH}')
+    args = parser.parse_args()
+    metrics.enabled = Params.BUILD_METRICS or args.metrics
 
-# Cache processed images to speed up future website builds
-print(f'[{elapsed_time():5.2f} s] Caching images...')
-if not os.path.exists(Params.IMAGE_CACHE_PATH):
-    os.makedirs(Params.IMAGE_CACHE_PATH)
+    log = lambda message: print(f'[{elapsed_time():5.2f} s] {message}')
 
-cached_images = [cached_image for cached_image in os.listdir(Params.IMAGE_CACHE_PATH)]
-
-for image in os.listdir(Params.OUTPUT_PATH + Params.BLOG_IMAGE_PATH):
-    if image not in cached_images:
-        shutil.copy(Params.OUTPUT_PATH + Params.BLOG_IMAGE_PATH + image, Params.IMAGE_CACHE_PATH)
-
-# Print time taken to generate site
-print(f'[{elapsed_time():5.2f} s] Done.')
-
-# Serve the current version of the blog to localhost:8000 for previewing
-if Params.PREVIEW is True:
-    print('\nPreviewing site.\n---------------')
-    serve(Params.OUTPUT_PATH, Params.PREVIEW_PORT)
\ No newline at end of file
+    # Open the post cache (one record per post), so that only new and changed posts are processed
+    post_cache = PostCache(Params.POST_CACHE_PATH)
+    if len(post_cache) > 0:
+        log(f'Opened post cache ({len(post_cache)} posts).')
+    else:
+        log('Post cache is empty. Initializing post database...')
+
+    # Build the site
+    post_db, output = build_site(post_cache, log=log)
+
+    # Print time taken to generate site
+    log('Done.')
+
+    # Watch the inputs, rebuilding (in this process, reusing post_db, templates and caches) whenever any of them change,
+    # and serve the current version of the blog to localhost, reloading it in the browser after each rebuild
+    if args.watch:
+        print('\nWatching for changes.\n---------------')
+        live_reload = LiveReload()
+        serve(Params.OUTPUT_PATH, Params.PREVIEW_PORT, live_reload=live_reload, block=False)
+        print('Press CTRL+C to quit.')
+
+        try:
+            for changed_paths in watch_files([Params.POSTS_PATH, Params.IMAGE_PATH, Params.TEMPLATE_PATH]):
+                st = time.time()
+                print(f'\nChanged: {", ".join(os.path.relpath(path) for path in changed_paths)}')
+                try:
+                    post_db, output = build_site(post_cache, post_db, log=log)
+                except Exception:
+                    # e.g. a post saved half-way through an edit; the next change is rebuilt as usual
+                    traceback.print_exc()
+                    log('Build failed.')
+                    continue
+                if output.written or output.removed:
+                    live_reload.notify()
+                log('Done.')
+        except KeyboardInterrupt:
+            pass
+
+    post_cache.close()
+
+    # Serve the current version of the blog to localhost:8000 for previewing
+    if (Params.PREVIEW is True) and not args.watch:
+        print('\nPreviewing site.\n---------------')
+        serve(Params.OUTPUT_PATH, Params.PREVIEW_PORT)
+
+
+# (the build must only run when this script is run, not when it is imported, e.g. by the worker processes that compress
+# images, which re-import it under the 'spawn' start method)
+if __name__ == '__main__':
+    main()
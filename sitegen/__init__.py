@@ -4,39 +4,76 @@
 # __init__.py
 
 # External Imports
+import io
+import gzip
 import os
 import re
 import math
+import mimetypes
 import shutil
 import subprocess
+import threading
+import time
 import hashlib
+import uuid
 import yaml
 import json
+import sqlite3
+from collections.abc import Mapping
+from contextlib import contextmanager
 from copy import copy, deepcopy
-from datetime import datetime
-from functools import partial
-from typing import Dict, Tuple, List, Union, Optional
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
+from functools import partial, lru_cache, wraps
+from html import escape as html_escape, unescape as html_unescape
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Tuple, List, Union, Optional
 
 from PIL import Image
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
 import misaka as m  # in testing, misaka was orders of magnitude faster than python-markdown
 import houdini as h
-from pygments import highlight
+from pygments import highlight, __version__ as pygments_version
 from pygments.formatters import HtmlFormatter, ClassNotFound
 from pygments.lexers import get_lexer_by_name
 
-from jinja2 import FileSystemLoader, Environment
+from jinja2 import FileSystemLoader, FileSystemBytecodeCache, Environment
+
+try:
+    import brotli  # optional; without it, only gzip sidecars are written
+except ImportError:
+    brotli = None
+
+try:
+    import boto3  # optional; only needed to deploy (see sitegen.s3)
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+except ImportError:
+    boto3 = None
 
 
 # Internal Imports
 from .config import Params
-from .exceptions import SitegenError, ImageProcessingError, MarkdownProcessingError, ImageTagsError, CheckboxListError, PostDatabaseError
-from .utils import sanitize_string, md5_hash, sort_posts, get_newest_posts, is_markdown, make_output_dirs, compress_blog_images, compress_image
-from .toc import build_toc_list, build_toc_html, render_sidebar_toc, add_toc_id_tags
-from .md_processing import md_to_html, downgrade_md_headings, HighlighterRenderer, add_table_tags, set_table_col_widths, add_blockquote_class, render_checkbox_list, render_image_autoscale, render_image_float_center, render_image_float_left, render_image_float_right, render_image_carousels, make_images_clickable, render_youtube_embeds, youtube_embed_link
-from .core import create_new_post, read_post_metadata, read_post_text, build_post_db, build_topic_dict, build_blog_pagination_dict
-from .templating import render_from_template, get_topic_url_links, get_month_name, get_pretty_date
-from .serve import serve
-from .sitemap import generate_sitemap
-#from .s3 import sync
+from .exceptions import SitegenError, ImageProcessingError, MarkdownProcessingError, ImageTagsError, CheckboxListError, PostDatabaseError, TopicError, DeployError
+from .metrics import Span, Metrics, metrics
+from .output import OutputTree
+from .minify import Minifier, minify_html, minify_css, minify_js
+from .images import ImageJob, ImageCache, plan_image, plan_variants, add_srcset, image_sizes, srcset_html, encode_image, process_images
+from .post_index import PostIndex, PostDatabase, get_post_index
+from .utils import sanitize_string, md5_hash, file_stat, sort_posts, get_newest_posts, is_markdown, make_output_dirs, compress_blog_images, compress_blog_image, blog_image_src, compress_image
+from .toc import build_toc_list, build_toc_entries, build_toc_html, render_sidebar_toc, add_toc_id_tags, add_toc_ids, append_toc_entry
+from .transforms import HtmlTransformer
+from .highlighting import highlight_code, highlight_stats, get_lexer
+from .md_processing import md_to_html, md_to_post_html, post_transformer, custom_tag_transformer, MARKDOWN_EXTENSIONS, downgrade_md_headings, HighlighterRenderer, NativeMarkupRenderer, add_table_tags, set_table_col_widths, add_blockquote_class, render_checkbox_list, render_image_autoscale, render_image_float_center, render_image_float_left, render_image_float_right, render_image_carousels, make_images_clickable, render_youtube_embeds, youtube_embed_link
+from .templating import get_environment, render_from_template, stream_from_template, render_post_fragments, add_post_fragments, render_related_posts, topic_page_url, archive_page_url, get_topic_url_links, get_month_name, get_pretty_date
+from .post_cache import PostCache
+from .core import create_new_post, read_post_metadata, read_post_text, ingest_post, build_post_db, post_render_settings, build_topic_dict, build_archive_dict, build_blog_pagination_dict
+from .depgraph import DependencyGraph, template_digest, post_page_inputs, index_page_inputs, post_list_inputs, topic_page_inputs, shard_index_inputs
+from .serve import serve, LiveReload
+from .watch import snapshot_files, watch_files
+from .sitemap import generate_sitemap, archive_pages, generate_xml_sitemap
+from .feeds import generate_feeds, feed_entry, atom_feed, rss_feed
+from .compression import compress_file, precompress_output
+from .build import build_site
+from .s3 import sync, plan_deploy, object_headers
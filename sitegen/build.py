@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# build.py
+
+from sitegen import *
+
+
+def build_site(post_cache: PostCache, post_db_memo: Optional[Dict[str, dict]] = None, log: Callable[[str], None] = print) -> Tuple[Dict[str, dict], OutputTree]:
+    """Builds the site from Params.POSTS_PATH and Params.TEMPLATE_PATH to Params.OUTPUT_PATH. Everything that is
+    unchanged since the previous build (posts, images, pages and output files) is reused rather than regenerated, so
+    this is also what watch mode runs on every change.
+
+    Args:
+        post_cache: cache of post_db entries from previous builds; brought up to date once the site is built
+        post_db_memo: (optional) post_db of the previous build in this process, from which unchanged posts are taken
+            instead of being loaded from 'post_cache'
+        log: function called with each progress message
+
+    Returns:
+        tuple of the post database and the (finalized) output tree of the build
+    """
+    # Time the build (and each of its stages, posts, images and pages) if Params.BUILD_METRICS is enabled; counters are
+    # always kept
+    metrics.reset()
+    with metrics.span('build', 'build'):
+        post_db, output = _build_site(post_cache, post_db_memo, log)
+
+    if metrics.enabled:
+        metrics.save(Params.METRICS_REPORT_PATH, Params.METRICS_TRACE_PATH)
+        log(f'Build metrics saved to {Params.METRICS_REPORT_PATH} (trace: {Params.METRICS_TRACE_PATH}).')
+
+    return post_db, output
+
+
+def _build_site(post_cache: PostCache, post_db_memo: Optional[Dict[str, dict]], log: Callable[[str], None]) -> Tuple[Dict[str, dict], OutputTree]:
+    # Open the output directory; unless Params.INCREMENTAL_OUTPUT is disabled, files are only rewritten when their
+    # contents change, and files that are no longer produced are deleted once the build is finished (html and css are
+    # minified as they are written, if Params.MINIFY_OUTPUT is enabled)
+    with metrics.span('assets', 'stage'):
+        minifier = Minifier() if Params.MINIFY_OUTPUT else None
+        output = OutputTree(Params.OUTPUT_PATH, Params.OUTPUT_MANIFEST_PATH, incremental=Params.INCREMENTAL_OUTPUT,
+                            transform=minifier)
+
+        # Copy site assets from the template directory that that will not be modified by this program (e.g. the 'Resume' page)
+        output.copy_tree(Params.TEMPLATE_PATH, ignore=['index.html', 'all-topics.html', 'all-posts.html', 'blog-post.html', 'related-posts.html'])
+
+        # Move additional (non-image) files, if they exist, from the ADDITIONAL_FILES_PATH to the BLOG_ADDITIONAL_FILES_PATH
+        if os.path.exists(Params.ADDITIONAL_FILES_PATH):
+            for file in os.listdir(Params.ADDITIONAL_FILES_PATH):
+                output.copy(Params.ADDITIONAL_FILES_PATH + file, Params.BLOG_ADDITIONAL_FILES_PATH + file)
+
+    # Gather and process posts
+    with metrics.span('posts', 'stage'):
+        log('Updating post database...')
+        counts = dict(highlight_stats)
+        post_db = build_post_db(Params.POSTS_PATH, Params.BLOG_PATH, post_cache, workers=Params.INGEST_WORKERS,
+                                post_db_memo=post_db_memo)
+        n_hits, n_misses = (highlight_stats[key] - counts[key] for key in ['hits', 'misses'])
+        if n_hits + n_misses > 0:
+            log(f'{n_hits + n_misses} code blocks highlighted, {n_hits / (n_hits + n_misses):.0%} from cache.')
+        # the sidebar and meta-line fragments shown with each post are rendered once, and shared by all its pages
+        add_post_fragments(post_db)
+        pagination_dict = build_blog_pagination_dict(post_db, posts_per_page=Params.POSTS_PER_PAGE)
+        topic_posts_dict = build_topic_dict(post_db, 'date')
+
+    # Compress the images linked from all posts, and copy them to the output directory; images that have already been
+    # processed (in previous builds, with the same parameters) are copied from the image cache without recompressing them
+    with metrics.span('images', 'stage'):
+        log('Processing images...')
+        image_jobs = [ImageJob(*job) for post in post_db.values() for job in post.get('images', [])]
+        compressed_images = process_images(image_jobs, workers=Params.IMAGE_WORKERS, output=output)
+        log(f'{len(compressed_images)} of {len(set(job.output for job in image_jobs))} images compressed.')
+
+    with metrics.span('pages', 'stage'):
+        log('Creating output directories...')
+        make_output_dirs(post_db, pagination_dict, Params.OUTPUT_PATH)
+
+        # Record what each page reads, so that pages whose inputs (and templates, post render settings and minification)
+        # are unchanged since the previous build are kept as they are rather than re-rendered. Pages that are re-rendered
+        # are streamed to the output as they are rendered, rather than built up as a string (and only replace the previous
+        # file if their contents changed)
+        salt = template_digest(Params.TEMPLATE_PATH) + json.dumps([post_render_settings(), Params.MINIFY_OUTPUT])
+        dependency_graph = DependencyGraph(Params.DEPENDENCY_GRAPH_PATH, salt=salt)
+        is_stale = lambda path, inputs: dependency_graph.is_stale(path, inputs) or not output.claim(path)
+        n_pages, n_rendered = 0, 0
+
+        # Render all individual blog post pages
+        log('Generating pages for each post...')
+        for post in pagination_dict['all_posts']:
+            n_pages += 1
+            if is_stale(post_db[post]['url'], post_page_inputs(post_db, post)):
+                n_rendered += 1
+                output.write_chunks(post_db[post]['url'],
+                                    stream_from_template(Params.TEMPLATE_PATH, 'blog-post.html', **post_db[post], post_db=post_db))
+
+        if Params.SHARDED_ARCHIVES:
+            # Render a page for each topic and each year, each re-rendered only when its own posts change, and 'all-topics'
+            # and 'all-posts' pages that link to them
+            log('Generating topic and archive pages...')
+            archive_dict = build_archive_dict(post_db)
+            shards = [(topic_page_url(topic), 'all-topics.html',
+                       {'topic_posts_dict': {topic: posts}, 'page_title': topic,
+                        'page_description': f'All posts in {topic}.'}, posts)
+                      for topic, posts in topic_posts_dict.items()]
+            shards += [(archive_page_url(year), 'all-posts.html',
+                        {'newest_posts': posts, 'page_title': f'Posts from {year}',
+                         'page_description': f'All posts from {year}, newest first.'}, posts)
+                       for year, posts in archive_dict.items()]
+            for path, template, context, posts in shards:
+                n_pages += 1
+                if is_stale(path, [context['page_title'], post_list_inputs(post_db, posts)]):
+                    n_rendered += 1
+                    output.write_chunks(path, stream_from_template(Params.TEMPLATE_PATH, template, **context, post_db=post_db))
+
+            indexes = [('all-topics.html', 'topic_shards', topic_posts_dict, topic_page_url),
+                       ('all-posts.html', 'archive_shards', archive_dict, archive_page_url)]
+            for template, name, shard_dict, url in indexes:
+                n_pages += 1
+                if is_stale(Params.BLOG_PATH + template, shard_index_inputs(shard_dict, url)):
+                    n_rendered += 1
+                    links = {key: (url(key), len(posts)) for key, posts in shard_dict.items()}
+                    output.write_chunks(Params.BLOG_PATH + template,
+                                        stream_from_template(Params.TEMPLATE_PATH, template, post_db=post_db, **{name: links}))
+        else:
+            # Render 'all-topics' page, listing all topics and all posts in each
+            log('Generating "all-topics" page...')
+            n_pages += 1
+            if is_stale(Params.BLOG_PATH + 'all-topics.html', topic_page_inputs(post_db, topic_posts_dict)):
+                n_rendered += 1
+                output.write_chunks(Params.BLOG_PATH + 'all-topics.html',
+                                    stream_from_template(Params.TEMPLATE_PATH, 'all-topics.html', topic_posts_dict=topic_posts_dict, post_db=post_db))
+
+            # Render 'all-posts' page
+            log('Generating "all-posts" page...')
+            newest_posts = get_newest_posts(post_db)
+            n_pages += 1
+            if is_stale(Params.BLOG_PATH + 'all-posts.html', post_list_inputs(post_db, newest_posts)):
+                n_rendered += 1
+                output.write_chunks(Params.BLOG_PATH + 'all-posts.html',
+                                    stream_from_template(Params.TEMPLATE_PATH, 'all-posts.html', newest_posts=newest_posts, post_db=post_db))
+
+        # Render blog index
+        log('Generating blog index...')
+        for page_number in range(pagination_dict['n_pages'] + 1)[1:]:
+            n_pages += 1
+            if not is_stale(pagination_dict[page_number]['url'] + 'index.html', index_page_inputs(post_db, pagination_dict, page_number)):
+                continue
+            n_rendered += 1
+
+            # rel and prev links to add to page <head>
+            if pagination_dict['n_pages'] > 1:
+                if page_number == 1:
+                    rel_links = f'<link rel="next" href="{pagination_dict[page_number + 1]["url"]}"/>'
+                elif page_number == pagination_dict['n_pages']:
+                    rel_links = f'<link rel="prev" href="{pagination_dict[page_number - 1]["url"]}"/>'
+                else:
+                    rel_links = f'<link rel="next" href="{pagination_dict[page_number + 1]["url"]}"/>\n<link rel="prev" href="{pagination_dict[page_number - 1]["url"]}"/>'
+            else:
+                rel_links = ''
+
+            output.write_chunks(pagination_dict[page_number]['url'] + 'index.html',
+                                stream_from_template(Params.TEMPLATE_PATH, 'index.html', post_db=post_db, pagination_dict=pagination_dict, current_page=page_number, rel_links=rel_links))
+
+        log(f'{n_rendered} of {n_pages} pages re-rendered.')
+        metrics.count('pages.rendered', n_rendered)
+        metrics.count('pages.reused', n_pages - n_rendered)
+        dependency_graph.save()
+
+    # Generate sitemap (an xml sitemap is only regenerated if a url or lastmod date has changed)
+    with metrics.span('sitemap', 'stage'):
+        generate_sitemap(post_db, format=Params.SITEMAP_FORMAT, output=output)
+
+    # Generate feeds (only rewritten when one of their entries has changed)
+    with metrics.span('feeds', 'stage'):
+        feeds_written = generate_feeds(post_db, topic_posts_dict if Params.TOPIC_FEEDS else None, output=output)
+        log(f'{len(feeds_written)} feeds written.')
+
+    if minifier is not None:
+        for ext, (n_files, n_bytes, n_minified) in sorted(minifier.stats.items()):
+            log(f'{n_files} {ext} files minified: {n_bytes} -> {n_minified} bytes ({1 - n_minified / n_bytes:.1%} saved).')
+
+    # Write precompressed sidecars of text files (only for files that have changed since the previous build)
+    with metrics.span('precompress', 'stage'):
+        if Params.PRECOMPRESS_OUTPUT:
+            n_compressed, n_kept = precompress_output(output, workers=Params.COMPRESS_WORKERS)
+            log(f'{n_compressed} of {n_compressed + n_kept} precompressed files written.')
+
+    # Cache 'post_db' so that we can keep track of what has changed from build-to-build (only the records of changed posts
+    # are written, and deleted posts are removed)
+    with metrics.span('post_cache', 'stage'):
+        n_written, n_removed = post_cache.update(post_db)
+        log(f'Cached posts ({n_written} updated, {n_removed} removed).')
+
+    # Remove output files that are no longer produced, and save the output manifest
+    with metrics.span('finalize', 'stage'):
+        output.finalize()
+        log(f'{len(output.written)} output files written, {len(output.removed)} removed.')
+
+    return post_db, output
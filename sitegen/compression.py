@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# compression.py
+
+from sitegen import *
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime is fixed, so that the same file always compresses to the same bytes
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+# extension and encoder of each sidecar, at maximum compression (.br only if the brotli module is installed)
+_SIDECAR_ENCODERS: Dict[str, Callable[[bytes], bytes]] = {'.gz': _gzip}
+if brotli is not None:
+    _SIDECAR_ENCODERS['.br'] = partial(brotli.compress, quality=11)
+
+
+def compress_file(path: str, sidecar_exts: List[str]) -> Dict[str, bytes]:
+    """Compresses a file with each of the encoders of 'sidecar_exts'. This is the unit of work handed to each worker by
+    precompress_output(), so it must remain importable at module level.
+
+    Returns:
+        dict of the compressed contents of the file, keyed by sidecar extension
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    return {ext: _SIDECAR_ENCODERS[ext](data) for ext in sidecar_exts}
+
+
+def precompress_output(output: OutputTree, extensions: List[str] = Params.PRECOMPRESS_EXTENSIONS, min_size: int = Params.PRECOMPRESS_MIN_SIZE, workers: int = 1) -> Tuple[int, int]:
+    """Writes a precompressed copy (a '.gz' sidecar and, if brotli is installed, a '.br' sidecar) of each text file in
+    the output tree, so that servers can send them instead of compressing on every request. Sidecars of files whose
+    contents are unchanged since the previous build are kept as they are.
+
+    Must be run once every other file has been written, and before output.finalize(), so that sidecars are tracked by
+    the manifest (and deleted along with the files they belong to).
+
+    Args:
+        output: output tree of the build
+        extensions: extensions of the files to compress
+        min_size: minimum size of a file to compress (units: bytes)
+        workers: number of processes to use (1 disables the process pool)
+
+    Returns:
+        tuple of the number of sidecars written and kept
+    """
+    pending: Dict[str, List[str]] = {}  # path -> sidecar extensions to write
+    n_kept = 0
+
+    for key in sorted(output.manifest):
+        if (os.path.splitext(key)[1] not in extensions) or (os.path.getsize(output.full_path(key)) < min_size):
+            continue
+        is_unchanged = output.previous_manifest.get(key) == output.manifest[key]
+        for ext in _SIDECAR_ENCODERS:
+            if is_unchanged and output.claim(key + ext):
+                n_kept += 1
+            else:
+                pending.setdefault(key, []).append(ext)
+
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {key: executor.submit(compress_file, output.full_path(key), sidecar_exts)
+                       for key, sidecar_exts in pending.items()}
+            sidecars = {key: future.result() for key, future in futures.items()}
+    else:
+        sidecars = {key: compress_file(output.full_path(key), sidecar_exts) for key, sidecar_exts in pending.items()}
+
+    for key, compressed in sidecars.items():
+        for ext, data in compressed.items():
+            output.write(key + ext, data)
+
+    return sum(len(sidecar_exts) for sidecar_exts in pending.values()), n_kept
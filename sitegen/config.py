@@ -11,6 +11,22 @@ class Params:
     POSTS_PER_PAGE = 3
     DEFAULT_AUTHOR = 'This guy'
     MAX_IMAGE_WIDTH = 1024  # units: px
+    JPEG_QUALITY = 75
+    # responsive images: besides the compressed image, write a variant at each width narrower than it, and a variant at
+    # every width in each additional format (where Pillow supports it), referenced by srcset/sizes and <picture>
+    RESPONSIVE_IMAGES = False
+    RESPONSIVE_IMAGE_WIDTHS = [480, 768]  # units: px
+    RESPONSIVE_IMAGE_FORMATS = ['avif', 'webp']  # in order of preference
+    RESPONSIVE_IMAGE_SIZES = '(max-width: 1024px) 100vw, 1024px'
+    # number of processes used to ingest posts (1 disables the process pool)
+    INGEST_WORKERS = 1
+    # number of processes used to compress images, once all posts have been ingested (1 disables the process pool)
+    IMAGE_WORKERS = 1
+    # emit bootstrap classes, heading ids and checkboxes from the markdown renderer itself, only parsing the html of
+    # posts which contain custom tags (output is equivalent, but not byte-identical, to the default)
+    NATIVE_MARKUP = False
+    # number of processes used to write precompressed sidecars (1 disables the process pool)
+    COMPRESS_WORKERS = 1
     # input file paths
     POSTS_PATH = './posts/'
     IMAGE_PATH = './posts/images/'
@@ -21,17 +37,69 @@ class Params:
     BLOG_PATH = 'blog/'
     BLOG_IMAGE_PATH = 'assets/img/'
     BLOG_ADDITIONAL_FILES_PATH = 'assets/etc/'
+    # list each topic, and each year's posts, on a page of its own (at TOPIC_PAGE_PATH and ARCHIVE_PAGE_PATH, within
+    # BLOG_PATH), with the 'all-topics' and 'all-posts' pages only linking to them, rather than listing every post
+    SHARDED_ARCHIVES = False
+    TOPIC_PAGE_PATH = 'topics/{topic}.html'
+    ARCHIVE_PAGE_PATH = 'archive/{year}.html'
+    # only write output files whose contents have changed (and delete those no longer produced), rather than emptying
+    # the output directory and rewriting everything on each build
+    INCREMENTAL_OUTPUT = True
+    # pages are streamed to the output as they are rendered, and written (and hashed) in blocks of at least this many
+    # bytes (units: bytes)
+    OUTPUT_BUFFER_SIZE = 64 * 1024
+    # minify html (collapsing whitespace outside of <pre>, <code> and <textarea>, and minifying inline css and js) and css
+    # as it is written to the output
+    MINIFY_OUTPUT = False
+    # write a precompressed copy (.gz and, if brotli is installed, .br) alongside each text file in the output of at least
+    # PRECOMPRESS_MIN_SIZE bytes, for servers that can send them as they are
+    PRECOMPRESS_OUTPUT = False
+    PRECOMPRESS_EXTENSIONS = ['.html', '.css', '.js', '.txt', '.xml', '.svg', '.json']
+    PRECOMPRESS_MIN_SIZE = 1024  # units: bytes
     # sitemap paths
     BASE_URL = 'https://www.some.site/'  # only for generating sitemap (all other links are relative)
     SITEMAP_PATH = 'sitemap.txt'
+    # sitemap format: 'txt' (a list of urls, at SITEMAP_PATH) or 'xml' (with lastmod dates, at SITEMAP_XML_PATH; split
+    # into several sitemaps and a sitemap index once a sitemap would exceed SITEMAP_MAX_URLS urls or SITEMAP_MAX_BYTES)
+    SITEMAP_FORMAT = 'txt'
+    SITEMAP_XML_PATH = 'sitemap.xml'
+    SITEMAP_MAX_URLS = 50000
+    SITEMAP_MAX_BYTES = 50 * 1024 * 1024  # units: bytes
     SITEMAP_INCLUDE = ['index.html', 'about.html', 'resume.html', 'contact.html', 'blog/all-topics.html', 'blog/all-posts.html'] # in addition to posts
+    # feeds of the newest FEED_LENGTH posts, in each format ('atom', 'rss') at its path (none, if empty), and, if
+    # TOPIC_FEEDS is enabled, of the newest posts in each topic ('{topic}' is replaced by the name of the topic)
+    FEED_PATHS = {'atom': 'blog/atom.xml', 'rss': 'blog/rss.xml'}
+    TOPIC_FEEDS = False
+    TOPIC_FEED_PATHS = {'atom': 'blog/topics/{topic}.atom.xml', 'rss': 'blog/topics/{topic}.rss.xml'}
+    FEED_TITLE = 'Blog'
+    FEED_LENGTH = 20
+    # include the html of each post in feeds (rather than only its description)
+    FEED_FULL_CONTENT = False
     # cache paths
     CACHE_PATH = './.cache/'
-    IMAGE_CACHE_PATH = './.cache/images/'
+    POST_CACHE_PATH = './.cache/posts.sqlite3'  # post_db entries, one record per post
+    IMAGE_CACHE_PATH = './.cache/images/'  # compressed images, stored by a hash of their source and encode parameters
+    OUTPUT_MANIFEST_PATH = './.cache/output_manifest.json'  # path -> md5 hash of every file in the output directory
+    DEPENDENCY_GRAPH_PATH = './.cache/dependency_graph.json'  # digests of the data read by each page
+    TEMPLATE_CACHE_PATH = './.cache/templates/'  # compiled (bytecode-cached) Jinja2 templates
+    HIGHLIGHT_CACHE_PATH = './.cache/highlight/'  # syntax-highlighted code blocks
+    MINIFY_CACHE_PATH = './.cache/minify/'  # minified html and css files
+    DEPLOY_MANIFEST_PATH = './.cache/deploy_manifest.json'  # hash and headers of every object deployed to the bucket
+    SITEMAP_STATE_PATH = './.cache/sitemap.json'  # hash and lastmod of every page in the xml sitemap
+    FEED_STATE_PATH = './.cache/feeds.json'  # hash and 'updated' timestamp of every feed entry
+    # record timing spans of each build (stages, posts, transforms, images and template renders), saved along with its
+    # counters (cache hits and misses, bytes written, ...) as a report and as a Chrome trace (also enabled by --metrics)
+    BUILD_METRICS = False
+    METRICS_REPORT_PATH = './.cache/metrics.json'
+    METRICS_TRACE_PATH = './.cache/trace.json'
     # should a preview be served to localhost after build?
     PREVIEW = True
     # port to use for preview
     PREVIEW_PORT = 8000
+    # time between polls of the input directories in watch mode (units: s)
+    WATCH_INTERVAL = 0.25
     # aws s3 parameters
     BUCKET_NAME = 'some.site'
+    S3_ENDPOINT_URL = None  # url of an S3-compatible server to deploy to instead (e.g. a local moto server or MinIO)
+    DEPLOY_WORKERS = 8  # number of concurrent uploads
 
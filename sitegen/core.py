@@ -62,12 +62,8 @@ def read_post_metadata(filename: str, path: str = './posts/') -> dict:
 
     with open(path + filename, 'r') as f:
         text = f.read()
-        meta = text.split('---', 2)[-2]
-        post_meta = yaml.safe_load(meta)
 
-        post_meta['slug'] = sanitize_string(post_meta['slug'].strip().lower())
-
-    return post_meta
+    return _parse_post_metadata(text)
 
 
 def read_post_text(filename: str, path: str = './posts/', output_format: str = 'html') -> str:
@@ -88,8 +84,7 @@ def read_post_text(filename: str, path: str = './posts/', output_format: str = '
         raise MarkdownProcessingError('The input file does not have a known markdown extension.')
 
     with open(path + filename, 'r') as f:
-        text = f.read()
-        post = text.split('---', 2)[-1]
+        post = _strip_post_metadata(f.read())
 
     if output_format == 'html':
         try:
@@ -100,7 +95,58 @@ def read_post_text(filename: str, path: str = './posts/', output_format: str = '
     return post
 
 
-def build_post_db(input_dir: str, blog_dir: str, cached_post_db: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+def ingest_post(filename: str, input_dir: str, cached_hashes: Optional[Dict[str, str]] = None) -> Tuple[dict, bool]:
+    """Reads, hashes and (if it has changed since it was cached) renders a single markdown-formatted post. The file is
+    read once, and the same buffer is used for its hash, its metadata and its text. This is the unit of work handed to
+    each worker when build_post_db() is run with a process pool, so it must remain importable at module level and only
+    return picklable data.
+
+    Args:
+        filename: name of the post file to ingest
+        input_dir: directory of input markdown-formatted posts
+        cached_hashes: (optional) md5 hashes of cached posts, keyed by slug
+
+    Returns:
+        tuple of the post's post_db entry and whether it was (re)rendered; if the post is unchanged, the entry contains
+            only its metadata, hash and source stat, and the cached entry should be used instead. The entry's 'images'
+            are the image jobs of the post, which have not been run yet
+    """
+    if not is_markdown(filename):
+        raise MarkdownProcessingError('The input file does not have a known markdown extension.')
+
+    # the stat is taken from the open file, so that it describes the contents that were read
+    with open(input_dir + filename, 'rb') as f:
+        source_stat = file_stat(f.fileno())
+        data = f.read()
+    # decoded as open(..., 'r') would have (default encoding, universal newlines)
+    text = io.TextIOWrapper(io.BytesIO(data)).read()
+
+    post_db_entry = _parse_post_metadata(text)
+    post_db_entry['hash'] = hashlib.md5(data).hexdigest()
+    post_db_entry['source'] = filename
+    post_db_entry['source_stat'] = source_stat
+
+    if (cached_hashes is not None) and (cached_hashes.get(post_db_entry['slug']) == post_db_entry['hash']):
+        return post_db_entry, False
+
+    # render the post, building its TOC (and adding anchor ids to its headings) in the same pass
+    # images are only recorded here; they are compressed for all posts at once by process_images()
+    text = _strip_post_metadata(text)
+    image_jobs: List[ImageJob] = []
+    try:
+        with metrics.span('md_to_post_html', 'render'):
+            post_db_entry['post_body'], post_db_entry['toc_list'] = md_to_post_html(text, post_db_entry['post_title'],
+                                                                                    post_db_entry['slug'], image_jobs)
+    except Exception as e:
+        raise MarkdownProcessingError(f'There was an error processing the input file {filename}.') from e
+    post_db_entry['images'] = image_jobs
+    post_db_entry['render_settings'] = post_render_settings()
+    post_db_entry['fragments'] = render_post_fragments(post_db_entry)
+
+    return post_db_entry, True
+
+
+def build_post_db(input_dir: str, blog_dir: str, post_cache: Optional[PostCache] = None, workers: int = 1, post_db_memo: Optional[Dict[str, dict]] = None) -> PostDatabase:
     """Builds a nested dict of post-data for all markdown-formatted posts in 'input_dir.' The filenames (without
     extensions) of the md-formatted input posts are used as keys in the output dict, and dicts of data about each post
     are used as their corresponding values. These include: in-file specified metadata, text contents, URLs (for use once
@@ -108,41 +154,82 @@ def build_post_db(input_dir: str, blog_dir: str, cached_post_db: Optional[Dict[s
     hashes, and a list of the post's headings (h1 -> h4), which will optionally be used to construct a table of contents
     for each post.
 
+    If 'workers' is greater than 1, posts are ingested in parallel by a pool of that many processes. Either way, posts
+    are processed (and merged into post_db) in filename order, so the result does not depend on the number of workers.
+
+    Only the records of unchanged posts are loaded from 'post_cache'; posts that have been deleted are left out. Posts
+    whose source file has the same size, mtime and inode as when it was cached are taken to be unchanged without being
+    read, so a build in which no post has changed costs one stat() per post; posts whose stat has changed are read (once)
+    and hashed, and only re-rendered if their hash has changed too.
+
     Args:
         input_dir: directory of input markdown-formatted posts
         blog_dir: desired output base directory of all rendered posts
-        cached_post_db: (optional) cached version of post_db
+        post_cache: (optional) cache of post_db entries from previous builds
+        workers: number of processes used to ingest posts; if 1, posts are ingested serially in this process
+        post_db_memo: (optional) post_db of a previous build in this process (e.g. in watch mode), whose entries are
+            used for unchanged posts instead of loading them from 'post_cache'; must match what was last written to it
 
     Returns:
         post database, with {input filenames without extensions} as keys (e.g. the key for input file 'ex.md' would be
-            'ex') and dicts of their data as values
+            'ex') and dicts of their data as values, as a PostDatabase (whose index lists its posts in each order)
     """
-    if cached_post_db is not None:
-        post_db = deepcopy(cached_post_db)
+    post_db = PostDatabase()
+    posts = sorted(post for post in os.listdir(input_dir) if is_markdown(post))
+
+    # Find posts whose source files are unchanged since they were cached, from their stat alone
+    unchanged_slugs: Dict[str, str] = {}  # filename -> slug
+    if post_cache is not None:
+        cached_index = {slug: post for slug, post in post_cache.index().items() if post['settings'] == post_render_settings()}
+        cached_hashes = {slug: post['hash'] for slug, post in cached_index.items()}
+        cached_stats = {post['source']: (slug, post['stat']) for slug, post in cached_index.items()}
+        for post in posts:
+            if (post in cached_stats) and (cached_stats[post][1] == file_stat(input_dir + post)):
+                unchanged_slugs[post] = cached_stats[post][0]
     else:
-        post_db: Dict[str, dict] = {}
-
-    # Read post metadata and text, add to post_db
-    for post in os.listdir(input_dir):
-        if is_markdown(post):
+        cached_hashes = None
+    changed_posts = [post for post in posts if post not in unchanged_slugs]
+    metrics.count('posts.unchanged_stat', len(unchanged_slugs))
+
+    # Read post metadata and text (in parallel, if requested)
+    results: Dict[str, Tuple[dict, bool]] = {}
+    if workers > 1 and len(changed_posts) > 1:
+        # (the hashes of cached posts are sent to each worker once, rather than with every post)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cached_hashes,)) as executor:
+            futures = [executor.submit(_ingest_post_in_worker, post, input_dir) for post in changed_posts]
+            for post, future in zip(changed_posts, futures):
+                try:
+                    results[post], worker_highlight_stats, worker_metrics = future.result()
+                except Exception as e:
+                    raise PostDatabaseError(post) from e
+                for key, count in worker_highlight_stats.items():
+                    highlight_stats[key] += count
+                metrics.merge(worker_metrics)
+    else:
+        for post in changed_posts:
             try:
-                post_db_entry = read_post_metadata(post, input_dir)
-                post_db_entry['hash'] = md5_hash(post, input_dir)
-
-                if (cached_post_db is not None) and (post_db_entry['slug'] in cached_post_db.keys()):
-                    if post_db[post_db_entry['slug']]['hash'] == post_db_entry['hash']:
-                        post_db[post_db_entry['slug']]['date'] = datetime.strptime(post_db[post_db_entry['slug']]['date'],
-                                                                                   '%Y-%m-%d %H:%M:%S')
-                        continue
-                post_db_entry['post_body'] = read_post_text(post, input_dir, output_format='html')
-
-                post_db_entry['toc_list'] = build_toc_list(post_db_entry)
-                post_db_entry = add_toc_id_tags(post_db_entry)
-
-                post_db[post_db_entry['slug']] = post_db_entry
+                with metrics.span(post, 'post'):
+                    results[post] = ingest_post(post, input_dir, cached_hashes)
             except Exception as e:
                 raise PostDatabaseError(post) from e
 
+    # Add posts to post_db
+    load_cached = lambda slug: post_db_memo[slug] if (post_db_memo is not None) and (slug in post_db_memo) else post_cache[slug]
+    for post in posts:
+        if post in unchanged_slugs:
+            post_db[unchanged_slugs[post]] = load_cached(unchanged_slugs[post])
+            continue
+
+        post_db_entry, changed = results[post]
+        metrics.count('posts.rendered' if changed else 'posts.unchanged_hash')
+        if changed:
+            post_db[post_db_entry['slug']] = post_db_entry
+        else:
+            # same contents; the new stat is kept, so that the post is not read again next time
+            post_db[post_db_entry['slug']] = load_cached(post_db_entry['slug'])
+            post_db[post_db_entry['slug']]['source'] = post_db_entry['source']
+            post_db[post_db_entry['slug']]['source_stat'] = post_db_entry['source_stat']
+
     # Generate post URLs, add to post_db
     newest_posts = sort_posts(post_db, 'date')
     for i, post in enumerate(newest_posts):
@@ -154,8 +241,49 @@ def build_post_db(input_dir: str, blog_dir: str, cached_post_db: Optional[Dict[s
     return post_db
 
 
+def _parse_post_metadata(text: str) -> dict:
+    # metadata of a post, from the YAML header of its text
+    post_meta = yaml.safe_load(text.split('---', 2)[-2])
+    post_meta['slug'] = sanitize_string(post_meta['slug'].strip().lower())
+    return post_meta
+
+
+def _strip_post_metadata(text: str) -> str:
+    # text of a post, without its YAML header
+    return text.split('---', 2)[-1]
+
+
+_worker_cached_hashes: Optional[Dict[str, str]] = None
+
+
+def _init_worker(cached_hashes: Optional[Dict[str, str]]) -> None:
+    # keeps the hashes of cached posts in a worker process, for _ingest_post_in_worker()
+    global _worker_cached_hashes
+    _worker_cached_hashes = cached_hashes
+
+
+def _ingest_post_in_worker(filename: str, input_dir: str) -> Tuple[Tuple[dict, bool], Dict[str, int], dict]:
+    # as ingest_post() (with the cached hashes given to _init_worker()), also returning the highlighting counts and
+    # metrics of the worker process for this post, so that they can be added to those of the main process
+    counts = dict(highlight_stats)
+    snapshot = metrics.snapshot()
+    with metrics.span(filename, 'post'):
+        result = ingest_post(filename, input_dir, _worker_cached_hashes)
+    return result, {key: highlight_stats[key] - counts[key] for key in highlight_stats}, metrics.since(snapshot)
+
+
+def post_render_settings() -> list:
+    """Returns the settings that the html of a post depends on besides its source: the renderer (Params.NATIVE_MARKUP),
+    and those of its images (maximum width and responsive variants). These are cached with each post (as
+    'render_settings'), so that cached posts rendered with different settings are re-rendered, and are mixed into the
+    dependency graph's salt, so that the pages showing them are re-rendered too."""
+    return [Params.NATIVE_MARKUP, Params.MAX_IMAGE_WIDTH, Params.RESPONSIVE_IMAGES, Params.RESPONSIVE_IMAGE_WIDTHS,
+            Params.RESPONSIVE_IMAGE_FORMATS, Params.RESPONSIVE_IMAGE_SIZES]
+
+
 def build_topic_dict(post_db: dict, sort_key: str = 'date') -> dict:
-    """Returns a dict of topics and all corresponding posts, sorted by either 'date' or 'post_title'
+    """Returns a dict of topics and all corresponding posts, sorted by either 'date' or 'post_title'. If topics have
+    pages or feeds of their own, raises a TopicError if two topics would be written to the same file.
 
     Args:
         post_db: data for all posts
@@ -168,19 +296,32 @@ def build_topic_dict(post_db: dict, sort_key: str = 'date') -> dict:
     if sort_key not in valid_keys:
         raise KeyError(f'Cannot sort by that key. Valid keys: {valid_keys}')
 
-    post_list = sort_posts(post_db, sort_key)
-    topic_list = sorted(list(set([topics for post in post_list for topics in post_db[post]['topics']])))
-
-    topic_posts_dict = {topic: [] for topic in topic_list}
+    topic_posts_dict = get_post_index(post_db).topic_posts(sort_key)
 
-    for post in post_list:
-        topics = post_db[post]['topics']
-        for topic in topics:
-            topic_posts_dict[topic].append(post)
+    # topics with pages (or feeds) of their own must not share a file name, or one would overwrite the other
+    if Params.SHARDED_ARCHIVES or Params.TOPIC_FEEDS:
+        topic_names: Dict[str, str] = {}
+        for topic in topic_posts_dict:
+            name = sanitize_string(topic.lower())
+            if name in topic_names:
+                raise TopicError(f"'{topic_names[name]}' and '{topic}' would both be written as '{name}'")
+            topic_names[name] = topic
 
     return topic_posts_dict
 
 
+def build_archive_dict(post_db: dict) -> dict:
+    """Returns a dict of years and all posts from each, newest first.
+
+    Args:
+        post_db: data for all posts
+
+    Returns:
+        dict, years are keys, lists of posts are values
+    """
+    return get_post_index(post_db).year_posts()
+
+
 def build_blog_pagination_dict(post_db: dict, posts_per_page: int = 10) -> dict:
     """Creates a dict of blog page numbers and a list of the names of all posts to display on each page.
 
@@ -191,15 +332,15 @@ def build_blog_pagination_dict(post_db: dict, posts_per_page: int = 10) -> dict:
     Returns:
         dict, blog page numbers are keys, lists of posts for each page are values
     """
-    all_posts = sort_posts(post_db, 'date')
-    n_pages = math.ceil(len(all_posts) / posts_per_page)
+    post_index = get_post_index(post_db)
+    n_pages = post_index.n_pages(posts_per_page)
 
     paginated_blog = {}
-    paginated_blog['all_posts'] = all_posts.copy()
+    paginated_blog['all_posts'] = post_index.sorted('date')
     paginated_blog['n_pages'] = n_pages
     for page_number in range(n_pages + 1)[1:]:
         paginated_blog[page_number] = {}
-        paginated_blog[page_number]['posts'] = [all_posts.pop(0) for _ in range(posts_per_page) if len(all_posts) > 0]
+        paginated_blog[page_number]['posts'] = post_index.page(page_number, posts_per_page)
         paginated_blog[page_number]['url'] = '/' if (page_number == 1) else f'/{Params.BLOG_PATH}page/{page_number}/'
 
     return paginated_blog
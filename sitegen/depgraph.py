@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# depgraph.py
+
+from sitegen import *
+
+
+class DependencyGraph:
+    """Records, for each output page, a digest of the data it reads when it is rendered (saved between builds), so that
+    pages whose inputs have not changed since the previous build can be skipped.
+
+    A 'salt' (e.g. a digest of the templates) is mixed into every page's digest, so that changing it marks every page as
+    stale.
+    """
+    def __init__(self, path: str, salt: str = ''):
+        self.path = path
+        self.salt = salt
+        self.digests: Dict[str, str] = {}
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.previous_digests: Dict[str, str] = json.load(f)
+        else:
+            self.previous_digests = {}
+
+    def is_stale(self, output: str, inputs: Union[dict, list]) -> bool:
+        """Records the inputs read by an output page, and checks whether they have changed since the previous build.
+
+        Args:
+            output: output path of the page
+            inputs: everything the page reads when it is rendered; must be JSON-serializable (datetimes are converted
+                with str())
+
+        Returns:
+            True if the page must be re-rendered
+        """
+        digest = hashlib.md5((self.salt + json.dumps(inputs, sort_keys=True, default=str)).encode('utf-8')).hexdigest()
+        self.digests[output] = digest
+
+        return self.previous_digests.get(output) != digest
+
+    def save(self) -> None:
+        """Saves the digests recorded during this build, for comparison in the next build."""
+        graph_dir = os.path.dirname(self.path)
+        if graph_dir:
+            os.makedirs(graph_dir, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.digests, f, indent=0, sort_keys=True)
+
+
+def template_digest(directory: str) -> str:
+    """Returns an md5 hash of all html templates in 'directory', used to re-render every page when a template changes.
+
+    Args:
+        directory: template directory
+
+    Returns:
+        str containing 128-bit md5-hash
+    """
+    digest = hashlib.md5()
+
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith('.html'):
+                digest.update(file.encode('utf-8'))
+                with open(os.path.join(root, file), 'rb') as f:
+                    digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def post_page_inputs(post_db: dict, post: str) -> dict:
+    """Returns the data read when rendering the page of a single post: its own entry (represented by its source hash and
+    URL, and the links to its topics, which depend on whether archives are sharded) plus the titles and URLs of its
+    related posts.
+    """
+    related_posts = post_db[post]['related_posts'] or []
+
+    return {'hash': post_db[post]['hash'],
+            'url': post_db[post]['url'],
+            'topic_links': post_db[post].get('fragments', {}).get('topic_links'),
+            'related_posts': [(post_db[related_post]['post_title'], post_db[related_post]['url'])
+                              for related_post in related_posts]}
+
+
+def index_page_inputs(post_db: dict, pagination_dict: dict, page_number: int) -> dict:
+    """Returns the data read when rendering a page of the blog index: the entries listed on it, and the pagination
+    links.
+    """
+    return {'posts': [post_page_inputs(post_db, post) for post in pagination_dict[page_number]['posts']],
+            'n_pages': pagination_dict['n_pages'],
+            'pages': [pagination_dict[page]['url'] for page in (page_number - 1, page_number + 1)
+                      if page in pagination_dict]}
+
+
+def post_list_inputs(post_db: dict, posts: List[str]) -> list:
+    """Returns the data read when listing posts (e.g. on the 'all-posts' page): their titles, URLs and dates."""
+    return [(post_db[post]['post_title'], post_db[post]['url'], post_db[post]['date']) for post in posts]
+
+
+def topic_page_inputs(post_db: dict, topic_posts_dict: dict) -> dict:
+    """Returns the data read when rendering the 'all-topics' page: each topic, and the titles, URLs and dates of the
+    posts listed under it.
+    """
+    return {topic: post_list_inputs(post_db, posts) for topic, posts in topic_posts_dict.items()}
+
+
+def shard_index_inputs(shards: Dict[object, List[str]], url: Callable[[object], str]) -> list:
+    """Returns the data read when rendering an index of sharded listings (e.g. the 'all-topics' page, when archives are
+    sharded): the key, url and number of posts of each shard.
+    """
+    return [(key, url(key), len(posts)) for key, posts in shards.items()]
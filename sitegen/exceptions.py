@@ -68,3 +68,21 @@ class YoutubeEmbedError(MarkdownProcessingError):
         else:
             msg = f'{error}: {msg}'
         super().__init__(msg)
+
+class TopicError(SitegenError):
+    def __init__(self, msg=None):
+        error = 'Two or more topics would be written to the same page or feed.'
+        if msg is None:
+            msg = error
+        else:
+            msg = f'{error}: {msg}'
+        super().__init__(msg)
+
+class DeployError(SitegenError):
+    def __init__(self, msg=None):
+        error = 'An error occurred while deploying the site.'
+        if msg is None:
+            msg = error
+        else:
+            msg = f'{error}: {msg}'
+        super().__init__(msg)
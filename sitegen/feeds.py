@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# feeds.py
+
+from sitegen import *
+
+
+_ATOM_NAMESPACE = 'http://www.w3.org/2005/Atom'
+_DUBLIN_CORE_NAMESPACE = 'http://purl.org/dc/elements/1.1/'
+_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def generate_feeds(post_db: dict, topic_posts_dict: Optional[Dict[str, List[str]]] = None, output: Optional[OutputTree] = None, state_path: str = Params.FEED_STATE_PATH) -> List[str]:
+    """Writes feeds of the newest Params.FEED_LENGTH posts, in each format of Params.FEED_PATHS ('atom' and/or 'rss'),
+    and (if 'topic_posts_dict' is given) one of each for every topic, at Params.TOPIC_FEED_PATHS.
+
+    Each entry has a stable id (derived from the post's slug) and an 'updated' timestamp that only changes when the
+    entry itself does: timestamps are recorded between builds, along with a hash of each entry, so that a post is dated
+    by its post date when first published and by the build that changed it after that. Feeds are therefore
+    byte-identical from one build to the next unless an entry has changed, and are only rewritten (keeping their mtimes,
+    and so their ETags) when one has.
+
+    Args:
+        post_db: data for all posts
+        topic_posts_dict: (optional) topics and their posts (see build_topic_dict()), for per-topic feeds
+        output: (optional) OutputTree through which to write the feeds; if None, they are written directly
+        state_path: path of the hashes and timestamps of the entries of the previous build
+
+    Returns:
+        list of the paths of the feeds that were (re)written
+    """
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            state: Dict[str, List[str]] = json.load(f)  # slug -> [entry hash, updated]
+    else:
+        state = {}
+
+    feeds = [(None, get_newest_posts(post_db, Params.FEED_LENGTH), Params.FEED_PATHS)]
+    if topic_posts_dict is not None:
+        feeds += [(topic, posts[:Params.FEED_LENGTH],
+                   {format: path.format(topic=sanitize_string(topic.lower())) for format, path in Params.TOPIC_FEED_PATHS.items()})
+                  for topic, posts in topic_posts_dict.items()]
+
+    now = datetime.now(timezone.utc).strftime(_TIMESTAMP_FORMAT)
+    entries: Dict[str, dict] = {}
+    for post in {post for _, posts, _ in feeds for post in posts}:
+        entry = feed_entry(post_db[post])
+        entry_hash = hashlib.md5(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()
+        previous = state.get(post)
+        if (previous is not None) and (previous[0] == entry_hash):
+            entry['updated'] = previous[1]
+        else:
+            entry['updated'] = entry['published'] if previous is None else now
+        entries[post] = entry
+        state[post] = [entry_hash, entry['updated']]
+
+    written = []
+    for topic, posts, paths in feeds:
+        title = Params.FEED_TITLE if topic is None else f'{Params.FEED_TITLE}: {topic}'
+        for format, path in paths.items():
+            feed = _FEED_WRITERS[format](title, Params.BASE_URL + path, [entries[post] for post in posts])
+            if output is not None:
+                if output.write(path, feed):
+                    written.append(path)
+            else:
+                os.makedirs(os.path.dirname(os.path.join(Params.OUTPUT_PATH, path)), exist_ok=True)
+                with open(os.path.join(Params.OUTPUT_PATH, path), 'w') as f:
+                    f.write(feed)
+                written.append(path)
+
+    # entries of posts that are no longer in any feed are forgotten
+    state = {post: state[post] for post in entries}
+    state_dir = os.path.dirname(state_path)
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=0, sort_keys=True)
+
+    return written
+
+
+def feed_entry(post: dict) -> dict:
+    """Returns the data of the feed entry of a post (everything but its 'updated' timestamp), with its summary (the post
+    description) and, if Params.FEED_FULL_CONTENT is enabled, its html."""
+    return {'id': f'urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, Params.BASE_URL + Params.BLOG_PATH + post["slug"])}',
+            'title': post['post_title'],
+            'url': Params.BASE_URL + post['url'][1:],
+            'author': post.get('author') or Params.DEFAULT_AUTHOR,
+            'published': post['date'].strftime(_TIMESTAMP_FORMAT),
+            'topics': list(post.get('topics') or []),
+            'summary': post.get('post_description') or '',
+            'content': post['post_body'] if Params.FEED_FULL_CONTENT else None}
+
+
+def atom_feed(title: str, feed_url: str, entries: List[dict]) -> str:
+    """Renders an Atom feed of 'entries' (see feed_entry()), newest first."""
+    lines = ['<?xml version="1.0" encoding="utf-8"?>',
+             f'<feed xmlns="{_ATOM_NAMESPACE}">',
+             f'<id>urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, feed_url)}</id>',
+             f'<title>{html_escape(title)}</title>',
+             f'<link href="{html_escape(feed_url)}" rel="self" type="application/atom+xml"/>',
+             f'<link href="{html_escape(Params.BASE_URL)}" rel="alternate" type="text/html"/>',
+             f'<updated>{_feed_updated(entries)}</updated>']
+    for entry in entries:
+        lines += ['<entry>',
+                  f'<id>{entry["id"]}</id>',
+                  f'<title>{html_escape(entry["title"])}</title>',
+                  f'<link href="{html_escape(entry["url"])}" rel="alternate" type="text/html"/>',
+                  f'<published>{entry["published"]}</published>',
+                  f'<updated>{entry["updated"]}</updated>',
+                  f'<author><name>{html_escape(entry["author"])}</name></author>']
+        lines += [f'<category term="{html_escape(topic)}"/>' for topic in entry['topics']]
+        lines.append(f'<summary>{html_escape(entry["summary"])}</summary>')
+        if entry['content'] is not None:
+            lines.append(f'<content type="html" xml:base="{html_escape(entry["url"])}">{html_escape(entry["content"])}</content>')
+        lines.append('</entry>')
+    lines.append('</feed>\n')
+
+    return '\n'.join(lines)
+
+
+def rss_feed(title: str, feed_url: str, entries: List[dict]) -> str:
+    """Renders an RSS 2.0 feed of 'entries' (see feed_entry()), newest first."""
+    lines = ['<?xml version="1.0" encoding="utf-8"?>',
+             f'<rss version="2.0" xmlns:atom="{_ATOM_NAMESPACE}" xmlns:dc="{_DUBLIN_CORE_NAMESPACE}">',
+             '<channel>',
+             f'<title>{html_escape(title)}</title>',
+             f'<link>{html_escape(Params.BASE_URL)}</link>',
+             f'<description>{html_escape(title)}</description>',
+             f'<atom:link href="{html_escape(feed_url)}" rel="self" type="application/rss+xml"/>',
+             f'<lastBuildDate>{_rfc822(_feed_updated(entries))}</lastBuildDate>']
+    for entry in entries:
+        lines += ['<item>',
+                  f'<title>{html_escape(entry["title"])}</title>',
+                  f'<link>{html_escape(entry["url"])}</link>',
+                  f'<guid isPermaLink="false">{entry["id"]}</guid>',
+                  f'<pubDate>{_rfc822(entry["published"])}</pubDate>',
+                  # (<author> must be an email address)
+                  f'<dc:creator>{html_escape(entry["author"])}</dc:creator>']
+        lines += [f'<category>{html_escape(topic)}</category>' for topic in entry['topics']]
+        description = entry['summary'] if entry['content'] is None else entry['content']
+        lines += [f'<description>{html_escape(description)}</description>', '</item>']
+    lines += ['</channel>', '</rss>\n']
+
+    return '\n'.join(lines)
+
+
+_FEED_WRITERS: Dict[str, Callable[[str, str, List[dict]], str]] = {'atom': atom_feed, 'rss': rss_feed}
+
+
+def _feed_updated(entries: List[dict]) -> str:
+    # a feed is as recent as its most recently updated entry (so that it only changes when an entry does)
+    return max([entry['updated'] for entry in entries], default='1970-01-01T00:00:00Z')
+
+
+def _rfc822(timestamp: str) -> str:
+    return format_datetime(datetime.strptime(timestamp, _TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc), usegmt=True)
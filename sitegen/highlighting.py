@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# highlighting.py
+
+from sitegen import *
+
+
+# number of code blocks highlighted by this process, either read from the highlighting cache ('hits') or rendered by
+# Pygments ('misses')
+highlight_stats = {'hits': 0, 'misses': 0}
+
+# options of the formatter used for all code blocks (part of each cache key, as they change the output)
+FORMATTER_OPTIONS: Dict[str, str] = {}
+_formatter = HtmlFormatter(**FORMATTER_OPTIONS)
+
+
+@lru_cache(maxsize=None)
+def get_lexer(lang: str) -> Optional[object]:
+    """Returns the (per-process) Pygments lexer for a language, or None if there is no lexer for it."""
+    try:
+        return get_lexer_by_name(lang, stripall=True)
+    except ClassNotFound:
+        return None
+
+
+def highlight_code(code: str, lang: str, cache_dir: str = Params.HIGHLIGHT_CACHE_PATH) -> Optional[str]:
+    """Renders syntax-highlighted html from a code block. The result is cached on disk, keyed on a hash of the
+    language, the code, the formatter options and the version of Pygments, so unchanged code blocks are only ever
+    highlighted once.
+
+    Args:
+        code: text of the code block
+        lang: language of the code block
+        cache_dir: highlighting cache directory
+
+    Returns:
+        html-formatted text, or None if there is no lexer for the language
+    """
+    lexer = get_lexer(lang)
+    if lexer is None:
+        return None
+
+    key = json.dumps([lang, pygments_version, FORMATTER_OPTIONS, code], sort_keys=True)
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+    cache_path = os.path.join(cache_dir, digest[:2], f'{digest}.html')
+
+    if os.path.exists(cache_path):
+        highlight_stats['hits'] += 1
+        metrics.count('highlight.cache_hits')
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    # stored as bs4 would serialize it, so that the html is the same whether or not it has been through a bs4 object
+    highlight_stats['misses'] += 1
+    metrics.count('highlight.cache_misses')
+    html = str(BeautifulSoup(highlight(code, lexer, _formatter), features='html.parser'))
+
+    # written to a temporary file first, as posts may be rendered by several processes at once
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(tmp_path, cache_path)
+
+    return html
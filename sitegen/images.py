@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# images.py
+
+from sitegen import *
+
+
+class ImageJob(NamedTuple):
+    """A single image to be compressed (and, if wider than max_width, scaled) by process_images(). Jobs are stored in
+    the post_db entry of the post linking to the image (as lists, once cached as JSON)."""
+    source: str
+    output: str
+    max_width: Optional[int] = None
+
+
+# output extension for each input image extension
+_IMAGE_FORMATS = {'jpg': 'jpg', 'jpeg': 'jpg', 'tif': 'jpg', 'tiff': 'jpg', 'png': 'png', 'gif': 'gif'}
+# a css length (value and unit), and the width set in a style attribute
+_CSS_LENGTH = re.compile(r'(\d+(?:\.\d+)?)(px|%|vw)?')
+_STYLE_WIDTH = re.compile(r'(?:^|;)\s*width\s*:\s*([^;]+)')
+# Pillow format and mime type for each output extension
+_OUTPUT_FORMATS = {'jpg': 'JPEG', 'png': 'PNG', 'gif': 'GIF', 'webp': 'WEBP', 'avif': 'AVIF'}
+_MIME_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp', 'avif': 'image/avif'}
+_SAVE_OPTIONS = {'JPEG': {'optimize': True, 'quality': Params.JPEG_QUALITY, 'progressive': True},
+                 'PNG': {'optimize': True},
+                 'GIF': {'save_all': True, 'optimize': True, 'loop': 0},
+                 'WEBP': {'quality': 75, 'method': 4},
+                 'AVIF': {'quality': 50, 'speed': 8}}
+
+
+class ImageCache:
+    """Content-addressed store of compressed images. Each image is stored once, under a key derived from the md5 hash of
+    its source file and everything that affects how it is encoded (max width, format and save options), so a replaced
+    source or a change of parameters is always recompressed, and identical images linked from several posts (or under
+    several names) share one object.
+
+    A small JSON index records the md5 hash of each source file along with its size and mtime (so that unchanged sources
+    are not re-read), and the parameters each object was encoded with.
+    """
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.index: Dict[str, dict] = json.load(f)
+        else:
+            self.index = {'sources': {}, 'objects': {}}
+
+    def source_digest(self, source: str) -> str:
+        """Returns the md5 hash of a source file, only reading it if its size or mtime have changed."""
+        stat = os.stat(source)
+        cached = self.index['sources'].get(source)
+        if (cached is not None) and (cached[:2] == [stat.st_size, stat.st_mtime_ns]):
+            return cached[2]
+
+        with open(source, 'rb') as f:
+            digest = hashlib.md5(f.read()).hexdigest()
+        self.index['sources'][source] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        return digest
+
+    def object_path(self, job: ImageJob) -> str:
+        """Returns the path at which the compressed image of a job is (or will be) stored."""
+        ext = os.path.splitext(job.output)[1]
+        params = {'source': self.source_digest(job.source), 'ext': ext, 'max_width': job.max_width,
+                  'options': _SAVE_OPTIONS.get(_OUTPUT_FORMATS.get(ext[1:]))}
+        key = hashlib.md5(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+        return os.path.join(self.cache_dir, 'objects', f'{key}{ext}')
+
+    def record(self, job: ImageJob, object_path: str) -> None:
+        """Records the parameters with which an object was encoded."""
+        self.index['objects'][os.path.basename(object_path)] = {'source': job.source, 'max_width': job.max_width,
+                                                                'size': os.path.getsize(object_path)}
+
+    def save(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.index_path, 'w') as f:
+            json.dump(self.index, f, indent=0, sort_keys=True)
+
+
+def plan_image(input_image: str, output_dir: str, max_width: Optional[int] = None) -> ImageJob:
+    """Determines where an image will be written once compressed, without reading it.
+
+    Args:
+        input_image: input file path
+        output_dir: directory to which processed image should be saved
+        max_width: if image is wider than max_width, it will be scaled to this width;
+            if None, compress, but do not scale
+
+    Returns:
+        image job
+    """
+    assert type(input_image) is str, 'Input must be a string.'
+    assert (output_dir[-1] == '/')
+
+    filename, ext = os.path.basename(input_image).split('.')
+
+    if ext.lower() in _IMAGE_FORMATS:
+        output_image = f'{output_dir}{filename}_c.{_IMAGE_FORMATS[ext.lower()]}'
+    elif ext.lower() == 'svg':
+        output_image = f'{output_dir}{filename}_c.svg'
+    else:
+        output_image = f'{output_dir}{filename}.{ext}'
+
+    return ImageJob(input_image, output_image, max_width)
+
+
+def plan_variants(job: ImageJob, url: str, widths: List[int] = Params.RESPONSIVE_IMAGE_WIDTHS, formats: List[str] = Params.RESPONSIVE_IMAGE_FORMATS) -> Tuple[List[ImageJob], Dict[str, str]]:
+    """Plans the responsive variants of a compressed jpg or png image: a copy at each of 'widths' that is narrower than
+    the image, plus a copy at every width (its own included) in each of 'formats' that Pillow can write. Only the
+    header of the source is read, to find its width.
+
+    Args:
+        job: image job of the compressed image
+        url: url of the compressed image
+        widths: widths of the variants (units: px)
+        formats: additional formats of the variants (extensions, e.g. 'webp'), in order of preference
+
+    Returns:
+        tuple of the variants' image jobs, and a dict of the srcset of each mime type (in order of preference; the
+            srcset of the image's own format, which includes the image itself, is last)
+    """
+    base, ext = job.output.rsplit('.', 1)
+    if ext not in ['jpg', 'png']:
+        return [], {}
+
+    with Image.open(job.source) as im:
+        width = im.width if (job.max_width is None) else min(im.width, job.max_width)
+
+    Image.init()
+    variant_exts = [variant_ext for variant_ext in formats if _OUTPUT_FORMATS.get(variant_ext) in Image.SAVE] + [ext]
+    variant_widths = sorted(set(variant_width for variant_width in widths if variant_width < width)) + [width]
+
+    jobs: List[ImageJob] = []
+    srcsets: Dict[str, str] = {}
+    for variant_ext in variant_exts:
+        candidates = []
+        for variant_width in variant_widths:
+            suffix = '' if (variant_width == width) else f'-{variant_width}w'
+            if (variant_ext, suffix) != (ext, ''):
+                jobs.append(ImageJob(job.source, f'{base}{suffix}.{variant_ext}', variant_width))
+            candidates.append(f'{url.rsplit(".", 1)[0]}{suffix}.{variant_ext} {variant_width}w')
+        srcsets[_MIME_TYPES[variant_ext]] = ', '.join(candidates)
+
+    return jobs, srcsets
+
+
+def add_srcset(img: Tag, srcsets: Dict[str, str], sizes: Optional[str] = None) -> None:
+    """Adds the srcset and sizes of a responsive image (see plan_variants()) to its <img> tag, wrapping the tag in a
+    <picture> with a <source> for each additional format.
+
+    Args:
+        img: bs4 <img> tag
+        srcsets: srcset of each mime type
+        sizes: sizes attribute; if None, it is worked out from the width at which the tag is shown (see image_sizes())
+    """
+    if sizes is None:
+        sizes = image_sizes(img)
+    *source_types, img_type = srcsets
+    img['srcset'] = srcsets[img_type]
+    img['sizes'] = sizes
+
+    if source_types:
+        soup_body = img
+        while soup_body.parent is not None:
+            soup_body = soup_body.parent
+        img.wrap(soup_body.new_tag('picture'))
+        for source_type in source_types:
+            img.insert_before(soup_body.new_tag('source', attrs={'type': source_type, 'srcset': srcsets[source_type],
+                                                                 'sizes': sizes}))
+
+
+def image_sizes(img: Tag, sizes: str = Params.RESPONSIVE_IMAGE_SIZES) -> str:
+    """Returns the sizes attribute of a responsive image, from the width at which its <img> tag is shown: that of the
+    tag itself, or else of the <figure> it is in (e.g. <float-left width="50%">). Images shown at a percentage of the
+    width of the post get 'sizes' (that of a full-width image) scaled by that percentage, and images shown at a fixed
+    width (e.g. width="300") get that width; any other image (e.g. width="auto") is taken to be full-width.
+
+    Args:
+        img: bs4 <img> tag
+        sizes: sizes attribute of a full-width image
+    """
+    width = img.get('width')
+    if (width is None) and (img.parent is not None) and (img.parent.name == 'figure'):
+        match = _STYLE_WIDTH.search(img.parent.get('style', ''))
+        width = match[1] if match else None
+
+    match = _CSS_LENGTH.fullmatch(str(width or '').strip())
+    if match is None:
+        return sizes
+    if match[2] in (None, 'px', 'vw'):
+        return f'{match[1]}{match[2] or "px"}'
+
+    # a percentage of the post's width: scale the width of a full-width image in each media condition
+    fraction = float(match[1]) / 100
+    entries = []
+    for entry in sizes.split(','):
+        *condition, length = entry.split()
+        length_match = _CSS_LENGTH.fullmatch(length)
+        if (length_match is None) or (length_match[2] is None):
+            return sizes
+        entries.append(' '.join(condition + [f'{float(length_match[1]) * fraction:g}{length_match[2]}']))
+    return ', '.join(entries)
+
+
+def srcset_html(img_html: str, srcsets: Dict[str, str], sizes: str = Params.RESPONSIVE_IMAGE_SIZES) -> str:
+    """Adds the srcset and sizes of a responsive image to the markup of its (self-closing) <img> tag; as add_srcset(),
+    for markup rendered without bs4."""
+    *source_types, img_type = srcsets
+    img_html = f'{img_html[:-2]} srcset="{srcsets[img_type]}" sizes="{sizes}"/>'
+
+    if source_types:
+        sources = ''.join(f'<source sizes="{sizes}" srcset="{srcsets[source_type]}" type="{source_type}"/>'
+                          for source_type in source_types)
+        img_html = f'<picture>{sources}{img_html}</picture>'
+
+    return img_html
+
+
+def encode_image(source: str, destination: str, max_width: Optional[int] = None) -> None:
+    """Compresses (and, if wider than max_width, scales) an image, in the format given by the extension of
+    'destination'. This is the unit of work handed to each worker by process_images(), so it must remain importable at
+    module level.
+
+    Args:
+        source: input file path
+        destination: output file path
+        max_width: if image is wider than max_width, it will be scaled to this width;
+            if None, compress, but do not scale
+    """
+    with metrics.span(os.path.basename(destination), 'image', source=source, max_width=max_width):
+        _encode_image(source, destination, max_width)
+
+
+def _encode_image(source: str, destination: str, max_width: Optional[int] = None) -> None:
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+    # save to a temporary file first, so that concurrent workers never see (or copy) a partially-written image
+    tmp_path = f'{destination}.{os.getpid()}.tmp'
+    ext = destination.split('.')[-1]
+
+    if ext == 'svg':
+        subprocess.run(f'./svgcleaner/svgcleaner {source} {tmp_path}', shell=True)
+    elif ext in _OUTPUT_FORMATS:
+        image_format = _OUTPUT_FORMATS[ext]
+        with Image.open(source) as im:
+            if (max_width is not None) and (im.width > max_width):
+                im = im.resize((max_width, int((max_width / im.width) * im.height)), Image.LANCZOS)
+            if (image_format == 'JPEG') and (im.mode not in ['RGB', 'L', 'CMYK']):
+                im = im.convert('RGB')
+            im.save(tmp_path, image_format, **_SAVE_OPTIONS[image_format])
+    else:
+        # not a recognized image format; copied to output as is
+        shutil.copy(source, tmp_path)
+
+    os.replace(tmp_path, destination)
+
+
+def process_images(jobs: Iterable[ImageJob], workers: int = 1, cache_dir: str = Params.IMAGE_CACHE_PATH, output: Optional[OutputTree] = None) -> List[str]:
+    """Runs image jobs through the image cache: images not yet in the cache are compressed (in parallel, if requested),
+    then every image is copied from the cache to its output path. Jobs are de-duplicated, so an image linked from
+    several posts is only processed once, and cache hits do not open the image at all.
+
+    Args:
+        jobs: image jobs (ImageJob tuples, or lists of their fields)
+        workers: number of processes to use (1 disables the process pool)
+        cache_dir: image cache directory
+        output: (optional) output tree through which the images are written (output paths of jobs must then be within
+            its output directory)
+
+    Returns:
+        output paths of the images that had to be compressed (i.e. cache misses)
+    """
+    cache = ImageCache(cache_dir)
+    placements: Dict[str, str] = {}  # output path -> object path
+    pending: Dict[str, ImageJob] = {}  # object path -> job
+
+    for job in jobs:
+        job = ImageJob(*job)
+        if job.output in placements:
+            continue
+        try:
+            object_path = cache.object_path(job)
+        except Exception as e:
+            raise ImageProcessingError(job.source) from e
+        placements[job.output] = object_path
+        if (object_path not in pending) and not os.path.exists(object_path):
+            pending[object_path] = job
+
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {object_path: executor.submit(_encode_image_in_worker, job.source, object_path, job.max_width)
+                       for object_path, job in pending.items()}
+            for object_path, future in futures.items():
+                try:
+                    metrics.merge(future.result())
+                except Exception as e:
+                    raise ImageProcessingError(pending[object_path].source) from e
+    else:
+        for object_path, job in pending.items():
+            try:
+                encode_image(job.source, object_path, job.max_width)
+            except Exception as e:
+                raise ImageProcessingError(job.source) from e
+
+    for object_path, job in pending.items():
+        cache.record(job, object_path)
+    cache.save()
+    metrics.count('images.cache_hits', len(placements) - len(pending))
+    metrics.count('images.cache_misses', len(pending))
+
+    for output_path, object_path in placements.items():
+        if output is not None:
+            output.copy(object_path, os.path.relpath(output_path, output.output_dir))
+        else:
+            _place(object_path, output_path)
+
+    return [job.output for job in pending.values()]
+
+
+def _encode_image_in_worker(source: str, destination: str, max_width: Optional[int] = None) -> dict:
+    # as encode_image(), returning the metrics of the worker process for this image, to be merged into those of the
+    # main process
+    snapshot = metrics.snapshot()
+    encode_image(source, destination, max_width)
+    return metrics.since(snapshot)
+
+
+def _place(object_path: str, output_path: str) -> None:
+    """Copies a cached image to its output path, unless the file there is already identical."""
+    with open(object_path, 'rb') as f:
+        data = f.read()
+
+    if os.path.exists(output_path):
+        with open(output_path, 'rb') as f:
+            if f.read() == data:
+                return
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
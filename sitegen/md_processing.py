@@ -6,6 +6,21 @@
 from sitegen import *
 
 
+# extensions enabled for the misaka markdown converter
+MARKDOWN_EXTENSIONS = ('fenced-code', 'math', 'math_explicit', 'no-intra-emphasis', 'quote', 'strikethrough', 'superscript', 'tables', 'underline', 'hard-wrap',)  # removed 'autolink'
+
+# rules applied to the html rendered from each post, in the order they are registered below
+post_transformer = HtmlTransformer()
+# rules for the custom tags only, applied when the renderer emits the rest of the markup itself (Params.NATIVE_MARKUP)
+custom_tag_transformer = HtmlTransformer()
+
+# custom tags (and raw <img> tags) which can only be handled once the html has been parsed
+_SOUP_ONLY_TAGS = re.compile(r'<(?:float-center|float-left|float-right|autoscale|carousel|youtube-embed|img)\b', re.IGNORECASE)
+
+# misaka converters, reused across posts (one per renderer class)
+_converters: Dict[type, Tuple[object, object]] = {}
+
+
 def md_to_html(text: str) -> str:
     """Renders html-formatted text from markdown-formatted text.
 
@@ -15,44 +30,116 @@ def md_to_html(text: str) -> str:
     Returns:
         html-formatted text
     """
+    if Params.NATIVE_MARKUP:
+        return _native_md_to_html(text)[0]
+
+    soup, code_blocks = _md_to_soup(text)
+
+    # modify html (within bs4 object), applying every rule in a single walk of the tree
+    context = {'srcsets': {} if Params.RESPONSIVE_IMAGES else None}
+    soup = post_transformer.transform(soup, context)
+    _add_srcsets(soup, context['srcsets'])
+
+    # convert back to html
+    with metrics.span('serialize', 'markdown'):
+        html = _restore_code_blocks(str(soup), code_blocks)
+
+    return html
+
+
+def md_to_post_html(text: str, post_title: str, slug: str, image_jobs: Optional[list] = None) -> Tuple[str, List[Tuple[int, str, str]]]:
+    """Renders html-formatted text from the markdown-formatted text of a post, also building the post's table of
+    contents and adding the matching id tags to its headings. The result is the same as that of md_to_html() followed
+    by build_toc_list() and add_toc_id_tags(), but the html is only parsed and serialized once.
+
+    With Params.NATIVE_MARKUP set, the markup is emitted by the renderer instead (see NativeMarkupRenderer), and the
+    html is only parsed if the post contains custom tags.
+
+    Args:
+        text: markdown-formatted text
+        post_title: title of the post (the first entry of the table of contents)
+        slug: post slug, used as the prefix of heading anchors
+        image_jobs: (optional) if given, linked images are not compressed during rendering; their jobs are appended to
+            this list instead (to be run by process_images())
+
+    Returns:
+        tuple of html-formatted text and the post's toc_list
+    """
+    if Params.NATIVE_MARKUP:
+        return _native_md_to_html(text, post_title, slug, image_jobs)
+
+    soup, code_blocks = _md_to_soup(text)
+
+    context = {'headings': [], 'image_jobs': image_jobs, 'srcsets': {} if Params.RESPONSIVE_IMAGES else None}
+    soup = post_transformer.transform(soup, context)
+    _add_srcsets(soup, context['srcsets'])
+    toc_list = add_toc_ids(context['headings'], post_title, slug)
+
+    with metrics.span('serialize', 'markdown'):
+        html = _restore_code_blocks(str(soup), code_blocks)
+
+    return html, toc_list
+
+
+def _md_to_soup(text: str) -> Tuple[object, List[str]]:
     # modify text in md files before converting to html
     # headings are downgraded by one (e.g. h1 -> h2), so that the post title is always the only h1 heading for each post
     text = downgrade_md_headings(text)
 
     # convert md-formatted text to html
-    renderer = HighlighterRenderer()
-    converter = m.Markdown(renderer, extensions=('fenced-code', 'math', 'math_explicit', 'no-intra-emphasis', 'quote', 'strikethrough', 'superscript', 'tables', 'underline', 'hard-wrap',))  # removed 'autolink'
-    html = converter(text)
+    renderer, converter = _get_converter(HighlighterRenderer)
+    renderer.code_blocks = []
+    with metrics.span('markdown', 'markdown'):
+        html = converter(text)
 
     # create bs4 object from html for additional processing
-    soup = BeautifulSoup(html, features='html.parser')
+    with metrics.span('parse', 'markdown'):
+        return BeautifulSoup(html, features='html.parser'), renderer.code_blocks
 
-    # modify html (within bs4 object)
-    soup = add_table_tags(soup)
-    soup = set_table_col_widths(soup)
-    soup = add_blockquote_class(soup)
-    try:
-        soup = render_checkbox_list(soup)
-    except Exception as e:
-        raise CheckboxListError from e
-    try:
-        soup = compress_blog_images(soup)
-    except Exception as e:
-        raise ImageProcessingError from e
-    try:
-        soup = render_image_float_center(soup)
-        soup = render_image_float_left(soup)
-        soup = render_image_float_right(soup)
-        soup = render_image_carousels(soup)
-        #soup = make_images_clickable(soup)
-    except Exception as e:
-        raise ImageTagsError from e
-    soup = render_youtube_embeds(soup)
 
-    # convert back to html
-    html = str(soup)
+def _restore_code_blocks(html: str, code_blocks: List[str]) -> str:
+    # highlighted code blocks are kept out of the bs4 object (as none of the rules apply to them, and their many <span>
+    # tags make up most of the cost of parsing and serializing the html of posts with a lot of code)
+    if not code_blocks:
+        return html
+    return _CODE_BLOCK_PLACEHOLDER.sub(lambda match: code_blocks[int(match[1])], html)
 
-    return html
+
+def _native_md_to_html(text: str, post_title: str = '', slug: str = '', image_jobs: Optional[list] = None) -> Tuple[str, List[Tuple[int, str, str]]]:
+    renderer, converter = _get_converter(NativeMarkupRenderer)
+    renderer.reset(post_title, slug, image_jobs, {} if Params.RESPONSIVE_IMAGES else None)
+    renderer.code_blocks = []
+    with metrics.span('markdown', 'markdown'):
+        html = converter(downgrade_md_headings(text))
+    if renderer.errors:
+        raise ImageProcessingError from renderer.errors[0]
+
+    # only posts with custom tags need to be parsed
+    if renderer.needs_soup:
+        soup = BeautifulSoup(html, features='html.parser')
+        soup = custom_tag_transformer.transform(soup, {'compressed_srcs': renderer.compressed_srcs,
+                                                       'image_jobs': image_jobs, 'srcsets': renderer.srcsets})
+        _add_srcsets(soup, renderer.srcsets)
+        html = str(soup)
+
+    return _restore_code_blocks(html, renderer.code_blocks), renderer.toc_list
+
+
+def _add_srcsets(soup_body: object, srcsets: Optional[Dict[str, Dict[str, str]]]) -> None:
+    # responsive images: the tags of images replaced by custom tag rules (e.g. <float-left>) are rebuilt from their src,
+    # so srcsets are added to any tag still without one once all rules have been applied
+    if srcsets:
+        for img in soup_body.find_all('img', srcset=False):
+            if img.get('src') in srcsets:
+                add_srcset(img, srcsets[img['src']])
+
+
+def _get_converter(renderer_class: type) -> Tuple[object, object]:
+    """Returns the (renderer, converter) pair for a renderer class, creating it on first use."""
+    if renderer_class not in _converters:
+        renderer = renderer_class()
+        _converters[renderer_class] = (renderer, m.Markdown(renderer, extensions=MARKDOWN_EXTENSIONS))
+    return _converters[renderer_class]
 
 
 def downgrade_md_headings(text: str) -> str:
@@ -68,21 +155,141 @@ def downgrade_md_headings(text: str) -> str:
 
 
 class HighlighterRenderer(m.HtmlRenderer):
-    """Subclass of misaka HtmlRenderer to include syntax highlighting functionality"""
-    def blockcode(self, text, lang):
-        try:
-            lexer = get_lexer_by_name(lang, stripall=True)
-        except ClassNotFound:
-            lexer = None
+    """Subclass of misaka HtmlRenderer to include syntax highlighting functionality. If 'code_blocks' is set to a list,
+    highlighted code blocks are appended to it, and only placeholders for them are rendered (see _restore_code_blocks())
+    """
+    code_blocks: Optional[List[str]] = None
 
-        if lexer:
-            formatter = HtmlFormatter()
-            return highlight(text, lexer, formatter)
+    def blockcode(self, text, lang):
+        html = highlight_code(text, lang)
+        if html is not None:
+            if self.code_blocks is None:
+                return html
+            # trailing newlines are rendered as they are, so that the html around the code block is unchanged
+            code_block = html.rstrip('\n')
+            self.code_blocks.append(code_block)
+            return f'<pre data-highlight="{_CODE_BLOCK_TOKEN}-{len(self.code_blocks) - 1}"></pre>{html[len(code_block):]}'
 
         # default
         return f'\n<pre><code>{h.escape_html(text.strip())}</code></pre>\n'
 
 
+class NativeMarkupRenderer(HighlighterRenderer):
+    """Subclass of HighlighterRenderer which emits the markup otherwise added by post_transformer directly from the
+    renderer callbacks: bootstrap table and blockquote classes, column widths, blockquote footers, task list checkboxes,
+    compressed images, and heading ids (collecting the table of contents as it goes). Output is equivalent, but not
+    byte-identical, to that of post_transformer.
+
+    Custom tags arrive as raw html, so they are left for custom_tag_transformer; needs_soup is set for posts which
+    contain any. State is kept per post, so reset() must be called before each conversion.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset()
+
+    def reset(self, post_title: str = '', slug: str = '', image_jobs: Optional[list] = None, srcsets: Optional[dict] = None) -> None:
+        self.slug = slug
+        self.image_jobs = image_jobs
+        self.srcsets = srcsets
+        self.toc_list: List[Tuple[int, str, str]] = [(1, post_title, slug)]
+        self.compressed_srcs: set = set()
+        self.errors: List[Exception] = []
+        self.needs_soup = False
+
+    def table(self, content):
+        return f'<table class="table table-striped table-sm table-hover">\n{content}</table>\n'
+
+    def table_cell(self, content, align, is_header):
+        tag = 'th' if is_header else 'td'
+        style = f'text-align: {align}' if align else None
+
+        if is_header:
+            # a width hint, e.g. 'Name <3em>', sets the width of the column
+            match = _COL_WIDTH_HINT.search(content)
+            if match is not None:
+                style = f'{style}; width:{match[1]}' if style else f'width:{match[1]};'
+                content = content[:match.start()].strip()
+
+        style = f' style="{style}"' if style else ''
+        return f'<{tag}{style}>{content}</{tag}>\n'
+
+    def header(self, content, level):
+        if not 2 <= level <= 4:
+            return f'<h{level}>{content}</h{level}>\n'
+
+        heading_string = html_unescape(re.sub(r'<[^>]*>', '', content))
+        heading_anchor = append_toc_entry(self.toc_list, str(level), heading_string, self.slug)
+        return f'<h{level} id="{html_escape(heading_anchor)}">{content}</h{level}>\n'
+
+    def blockquote(self, content):
+        content = _BLOCKQUOTE_FOOTER.sub(r'<footer class="blockquote-footer">\1</footer>', content)
+        return f'<blockquote class="blockquote">\n{content}</blockquote>\n'
+
+    def listitem(self, content, is_ordered, is_block):
+        content = content.rstrip('\n')
+
+        match = None if is_ordered else _CHECKBOX_ITEM.match(content)
+        if match is not None:
+            checked = ' checked=""' if match[2] else ''
+            content = f'<input disabled=""{checked} type="checkbox"/>{match[1] or ""}\u2002{content[match.end():]}'
+
+        return f'<li>{content}</li>\n'
+
+    def list(self, content, is_ordered, is_block):
+        if is_ordered:
+            return f'<ol>\n{content}</ol>\n'
+        if _has_checkbox_item(content):
+            return f'<ul style="list-style-type: none; padding-left: 0.5em; margin-left: 0.25em;">\n{content}</ul>\n'
+        return f'<ul>\n{content}</ul>\n'
+
+    def image(self, link, title, alt):
+        # exceptions raised within misaka callbacks are not propagated, so they are kept until the conversion is done
+        try:
+            img_src = blog_image_src(link, image_jobs=self.image_jobs, srcsets=self.srcsets)
+        except Exception as e:
+            self.errors.append(e)
+            return ''
+        self.compressed_srcs.add(img_src)
+
+        title = f' title="{html_escape(title)}"' if title else ''
+        img_html = f'<img src="{html_escape(img_src)}" alt="{html_escape(alt)}"{title}/>'
+        if self.srcsets and (img_src in self.srcsets):
+            img_html = srcset_html(img_html, self.srcsets[img_src])
+
+        return img_html
+
+    def raw_html(self, text):
+        if _SOUP_ONLY_TAGS.search(text):
+            self.needs_soup = True
+        return text
+
+    def blockhtml(self, text):
+        if _SOUP_ONLY_TAGS.search(text):
+            self.needs_soup = True
+        return f'{text.strip()}\n'
+
+
+# placeholders carry a random token, so that raw html in a post can't be mistaken for one (and replaced with code)
+_CODE_BLOCK_TOKEN = uuid.uuid4().hex
+_CODE_BLOCK_PLACEHOLDER = re.compile(rf'<pre data-highlight="{_CODE_BLOCK_TOKEN}-([0-9]+)"></pre>')
+_COL_WIDTH_HINT = re.compile(r'\s*<([0-9][A-Za-z0-9%.]*)>\s*\Z')  # e.g. the '<3em>' in 'Name <3em>'
+_BLOCKQUOTE_FOOTER = re.compile(r'<p>(?:---? |– |— |&ndash; |&mdash; )([^<]*)</p>')
+_CHECKBOX_ITEM = re.compile(r'(<p>)?\[(?: |(x|X))?\] ')
+_LIST_TOKENS = re.compile(r'<(/?)(?:ul|ol)\b|<li><input disabled=""')
+
+
+def _has_checkbox_item(content: str) -> bool:
+    """Checks whether any of the items of a list (but not of the lists nested within it) starts with a checkbox."""
+    depth = 0
+    for match in _LIST_TOKENS.finditer(content):
+        if match[0].startswith('<li>'):
+            if depth == 0:
+                return True
+        else:
+            depth += -1 if match[1] else 1
+    return False
+
+
 def add_table_tags(soup_body: object) -> object:
     """For each table in the input bs4 object, change the class to 'table table-sm table-hover' for bootstrap formatting.
 
@@ -96,10 +303,14 @@ def add_table_tags(soup_body: object) -> object:
         raise TypeError('Input must be a bs4.BeautifulSoup object')
 
     for table in soup_body.find_all('table'):
-        table['class'] = 'table table-striped table-sm table-hover'
+        _add_table_tag(table)
     return soup_body
 
 
+def _add_table_tag(table: Tag) -> None:
+    table['class'] = 'table table-striped table-sm table-hover'
+
+
 def set_table_col_widths(soup_body: object) -> object:
     """For each table in the input bs4 object, apply column widths if specified within the header row (e.g. by adding
     <3em> to the end of the contents of a cell of the header row, that column will be set to have a width of 3em).
@@ -114,18 +325,22 @@ def set_table_col_widths(soup_body: object) -> object:
         raise TypeError('Input must be a bs4.BeautifulSoup object')
 
     for table in soup_body.find_all('table'):
-        for th in table.find_all('th'):
-            match = re.search(r'(?<=<).+(?=>)', th.string)
-            if match is not None:
-                if th.has_attr('style'):
-                    th['style'] = f'{th["style"]}; width:{match[0]}'
-                else:
-                    th['style'] = f'width:{match[0]};'
-                th.string = re.sub(r'<[A-Za-z0-9%]+>', '', th.string).strip()
+        _set_table_col_widths(table)
 
     return soup_body
 
 
+def _set_table_col_widths(table: Tag) -> None:
+    for th in table.find_all('th'):
+        match = re.search(r'(?<=<).+(?=>)', th.string)
+        if match is not None:
+            if th.has_attr('style'):
+                th['style'] = f'{th["style"]}; width:{match[0]}'
+            else:
+                th['style'] = f'width:{match[0]};'
+            th.string = re.sub(r'<[A-Za-z0-9%]+>', '', th.string).strip()
+
+
 def add_blockquote_class(soup_body: object) -> object:
     """For each blockquote in the input bs4 object, change the class to 'blockquote text-muted' so that the bootstrap
     framework blockquote styling will be applied.
@@ -140,19 +355,23 @@ def add_blockquote_class(soup_body: object) -> object:
         raise TypeError('Input must be a bs4.BeautifulSoup object')
 
     for bq in soup_body.find_all('blockquote'):
-        bq['class'] = 'blockquote'
-
-        for p in bq.find_all('p'):
-            for dash in ['-- ', '--- ', '– ', '— ', '&ndash; ', '&mdash; ']:
-                if p.string[:len(dash)] == dash:
-                    bqf = soup_body.new_tag('footer')
-                    bqf['class'] = 'blockquote-footer'
-                    bqf.string = p.string.replace(dash, '')
-                    p.replace_with(bqf)
+        _add_blockquote_class(bq, soup_body)
 
     return soup_body
 
 
+def _add_blockquote_class(bq: Tag, soup_body: object) -> None:
+    bq['class'] = 'blockquote'
+
+    for p in bq.find_all('p'):
+        for dash in ['-- ', '--- ', '– ', '— ', '&ndash; ', '&mdash; ']:
+            if p.string[:len(dash)] == dash:
+                bqf = soup_body.new_tag('footer')
+                bqf['class'] = 'blockquote-footer'
+                bqf.string = p.string.replace(dash, '')
+                p.replace_with(bqf)
+
+
 def render_checkbox_list(soup_body: object) -> object:
     """As the chosen markdown processor does not support task lists (lists with checkboxes), this function post-processes
     a bs4 object created from outputted HTML, replacing instances of '[ ]' (or '[]') at the beginning of a list item
@@ -168,25 +387,29 @@ def render_checkbox_list(soup_body: object) -> object:
         raise TypeError('Input must be a bs4.BeautifulSoup object')
 
     for ul in soup_body.find_all('ul'):
-        for li in ul.find_all('li', recursive=False):
-
-            if (li.contents[0].string[:2] == '[]') or (li.contents[0].string[:3] == '[ ]'):
-                unchecked = soup_body.new_tag("input", disabled="", type="checkbox")
-                li.contents[0].string.replace_with(li.contents[0].string.replace('[] ', u'\u2002'))
-                li.contents[0].string.replace_with(li.contents[0].string.replace('[ ] ', u'\u2002'))
-                li.contents[0].insert_before(unchecked)
-                li.find_parent('ul')['style'] = 'list-style-type: none; padding-left: 0.5em; margin-left: 0.25em;'
-
-            elif (li.contents[0].string[:3] == '[x]') or (li.contents[0].string[:3] == '[X]'):
-                checked = soup_body.new_tag("input", disabled="", checked="", type="checkbox")
-                li.contents[0].string.replace_with(li.contents[0].string.replace('[x] ', u'\u2002'))
-                li.contents[0].string.replace_with(li.contents[0].string.replace('[X] ', u'\u2002'))
-                li.contents[0].insert_before(checked)
-                li.find_parent('ul')['style'] = 'list-style-type: none; padding-left: 0.5em; margin-left: 0.25em;'
+        _render_checkbox_list(ul, soup_body)
 
     return soup_body
 
 
+def _render_checkbox_list(ul: Tag, soup_body: object) -> None:
+    for li in ul.find_all('li', recursive=False):
+
+        if (li.contents[0].string[:2] == '[]') or (li.contents[0].string[:3] == '[ ]'):
+            unchecked = soup_body.new_tag("input", disabled="", type="checkbox")
+            li.contents[0].string.replace_with(li.contents[0].string.replace('[] ', u'\u2002'))
+            li.contents[0].string.replace_with(li.contents[0].string.replace('[ ] ', u'\u2002'))
+            li.contents[0].insert_before(unchecked)
+            li.find_parent('ul')['style'] = 'list-style-type: none; padding-left: 0.5em; margin-left: 0.25em;'
+
+        elif (li.contents[0].string[:3] == '[x]') or (li.contents[0].string[:3] == '[X]'):
+            checked = soup_body.new_tag("input", disabled="", checked="", type="checkbox")
+            li.contents[0].string.replace_with(li.contents[0].string.replace('[x] ', u'\u2002'))
+            li.contents[0].string.replace_with(li.contents[0].string.replace('[X] ', u'\u2002'))
+            li.contents[0].insert_before(checked)
+            li.find_parent('ul')['style'] = 'list-style-type: none; padding-left: 0.5em; margin-left: 0.25em;'
+
+
 def render_image_autoscale(soup_body: object) -> object:
     """Makes the size of all images tagged with <autoscale> tags fluid, autoscaling their width to the container width.
     NOTE: this is now just a wrapper for render_image_float_center()
@@ -230,23 +453,8 @@ def render_image_float_center(soup_body: object) -> object:
 
     try:
         for float_center in soup_body.find_all(['float-center', 'autoscale']):
-            img_src = float_center.img['src']
-
-            if float_center.has_attr('width'):
-                img_width = float_center['width']
-            else:
-                img_width = 'auto'
-
-            if float_center.has_attr('height'):
-                img_height = float_center['height']
-            else:
-                img_height = 'auto'
-
-            if float_center.has_attr('caption'):
-                img_caption = str(float_center['caption'])
-                float_center_html = f'<figure class="figure" style="width:100%;">\n<img class="figure-img img-fluid mx-auto mb-4 d-block" height={img_height} width={img_width} src={img_src}>\n<figcaption class="figure-caption text-center m-auto" width:{img_width};">{img_caption}</figcaption>\n</figure>\n'
-            else:
-                float_center_html = f'<img class="img-fluid mx-auto mb-4 d-block" height={img_height} width={img_width} src={img_src}>\n'
+            img_src, img_width, img_height, img_caption = _float_image_attrs(float_center)
+            float_center_html = _float_center_html(img_src, img_width, img_height, img_caption)
 
             float_center.replace_with(BeautifulSoup(float_center_html, features="html.parser"))
     except:
@@ -276,23 +484,8 @@ def render_image_float_right(soup_body: object) -> object:
 
     try:
         for float_right in soup_body.find_all('float-right'):
-            img_src = float_right.img['src']
-
-            if float_right.has_attr('width'):
-                img_width = float_right['width']
-            else:
-                img_width = 'auto'
-
-            if float_right.has_attr('height'):
-                img_height = float_right['height']
-            else:
-                img_height = 'auto'
-
-            if float_right.has_attr('caption'):
-                img_caption = str(float_right['caption'])
-                float_right_html = f'<figure class="figure float-right ml-3 mb-4" style="width:{img_width}; height:{img_height};">\n<img class="figure-img img-fluid m-auto d-block" src={img_src}>\n<figcaption class="figure-caption text-center m-auto" width:{img_width};>{img_caption}</figcaption>\n</figure>\n'
-            else:
-                float_right_html = f'<img class="float-right ml-3 mb-4" height={img_height} width={img_width} src={img_src}>\n'
+            img_src, img_width, img_height, img_caption = _float_image_attrs(float_right)
+            float_right_html = _float_side_html('right', img_src, img_width, img_height, img_caption)
 
             float_right.replace_with(BeautifulSoup(float_right_html, features="html.parser"))
     except:
@@ -322,23 +515,8 @@ def render_image_float_left(soup_body: object) -> object:
 
     try:
         for float_left in soup_body.find_all('float-left'):
-            img_src = float_left.img['src']
-
-            if float_left.has_attr('width'):
-                img_width = float_left['width']
-            else:
-                img_width = 'auto'
-
-            if float_left.has_attr('height'):
-                img_height = float_left['height']
-            else:
-                img_height = 'auto'
-
-            if float_left.has_attr('caption'):
-                img_caption = str(float_left['caption'])
-                float_left_html = f'<figure class="figure float-left mr-3 mb-4" style="width:{img_width}; height:{img_height};">\n<img class="figure-img img-fluid m-auto d-block" src={img_src}>\n<figcaption class="figure-caption text-center m-auto" width:{img_width};>{img_caption}</figcaption>\n</figure>\n'
-            else:
-                float_left_html = f'<img class="float-left mr-3 mb-4" height={img_height} width={img_width} src={img_src}>\n'
+            img_src, img_width, img_height, img_caption = _float_image_attrs(float_left)
+            float_left_html = _float_side_html('left', img_src, img_width, img_height, img_caption)
 
             float_left.replace_with(BeautifulSoup(float_left_html, features="html.parser"))
     except:
@@ -362,32 +540,8 @@ def render_image_carousels(soup_body: object) -> object:
         raise TypeError('Input must be a bs4.BeautifulSoup object')
 
     for carousel in soup_body.find_all('carousel'):
-
-        # Refer to the carousel by the name of the first image contained within it
-        carousel_id = carousel.find('img')['src'].split('/')[-1].split('.')[0]
-
-        if carousel.has_attr('width'):
-            carousel_width = str(carousel['width'])
-        else:
-            carousel_width = 'auto'
-
-        carousel_html = []
-        carousel_indicators = []
-
-        for img_num, img in enumerate(carousel.find_all('img')):
-            img_src = img['src']
-
-            if img_num is 0:
-                carousel_html = f'<div class="carousel slide mx-auto mb-4" data-ride="carousel" data-interval="false" data-pause="false" id="carousel-{carousel_id}" style="width:100%;">\n<div class="carousel-inner" role="listbox">\n<div class="carousel-item active"><img class="img-fluid mx-auto mb-4 d-block" src="{img_src}" width={carousel_width} /></div>\n'
-                carousel_indicators = f'<ol class="carousel-indicators">\n<li data-target="#carousel-{carousel_id}" data-slide-to="{img_num}" class="active"></li>\n'
-            else:
-                carousel_html += f'<div class="carousel-item"><img class="img-fluid d-block mx-auto mb-4" src="{img_src}" width={carousel_width} /></div>\n'
-                carousel_indicators += f'<li data-target="#carousel-{carousel_id}" data-slide-to="{img_num}"></li>\n'
-
-        carousel_html += f'</div>\n<a href="#carousel-{carousel_id}" role="button" data-slide="prev" class="carousel-control-prev"><span aria-hidden="true" class="carousel-control-prev-icon"></span><span class="sr-only">Previous</span></a>\n<a href="#carousel-{carousel_id}" role="button" data-slide="next" class="carousel-control-next"><span aria-hidden="true" class="carousel-control-next-icon"></span><span class="sr-only">Next</span></a>\n'
-        carousel_indicators += f'</ol>\n</div>'
-
-        carousel_html += carousel_indicators
+        carousel_id, carousel_width, img_srcs = _carousel_attrs(carousel)
+        carousel_html = _carousel_html(carousel_id, carousel_width, img_srcs)
 
         carousel.replace_with(BeautifulSoup(carousel_html, features="html.parser"))
 
@@ -426,17 +580,9 @@ def render_youtube_embeds(soup_body: object) -> object:
         raise TypeError('Input must be a bs4.BeautifulSoup object')
 
     for youtube_embed in soup_body.find_all('youtube-embed'):
-        yt_src = youtube_embed_link(youtube_embed.a['href'])
-
-        if youtube_embed.has_attr('ratio'):
-            ratio = str(youtube_embed['ratio'])
-        else:
-            ratio = '16by9'
+        yt_src, ratio = _youtube_embed_attrs(youtube_embed)
+        youtube_embed_html = _youtube_embed_html(yt_src, ratio)
 
-        if ratio not in ['16by9', '4by3', '1by1', '21by9']:
-            ratio = '16by9'
-
-        youtube_embed_html = f'<div class="embed-responsive embed-responsive-{ratio}">\n<iframe class="embed-responsive-item" src="{yt_src}" allowfullscreen>\n</iframe>\n'
         youtube_embed.replace_with(BeautifulSoup(youtube_embed_html, features="html.parser"))
 
     return soup_body
@@ -460,3 +606,248 @@ def youtube_embed_link(link: str) -> str:
         return f'https://www.youtube-nocookie.com/embed/{yt_link_normal.group()}'
     else:
         raise YoutubeEmbedError
+
+
+def _float_image_attrs(float_tag: Tag) -> Tuple[str, str, str, Optional[str]]:
+    """Returns the src of the image within a float tag (e.g. <float-center>), and the width, height and caption set on
+    the tag."""
+    img_src = float_tag.img['src']
+    img_width = float_tag['width'] if float_tag.has_attr('width') else 'auto'
+    img_height = float_tag['height'] if float_tag.has_attr('height') else 'auto'
+    img_caption = str(float_tag['caption']) if float_tag.has_attr('caption') else None
+
+    return img_src, img_width, img_height, img_caption
+
+
+def _float_center_html(img_src: str, img_width: str, img_height: str, img_caption: Optional[str]) -> str:
+    if img_caption is not None:
+        return f'<figure class="figure" style="width:100%;">\n<img class="figure-img img-fluid mx-auto mb-4 d-block" height={img_height} width={img_width} src={img_src}>\n<figcaption class="figure-caption text-center m-auto" width:{img_width};">{img_caption}</figcaption>\n</figure>\n'
+    else:
+        return f'<img class="img-fluid mx-auto mb-4 d-block" height={img_height} width={img_width} src={img_src}>\n'
+
+
+def _float_side_html(side: str, img_src: str, img_width: str, img_height: str, img_caption: Optional[str]) -> str:
+    margin = 'ml-3' if (side == 'right') else 'mr-3'
+    if img_caption is not None:
+        return f'<figure class="figure float-{side} {margin} mb-4" style="width:{img_width}; height:{img_height};">\n<img class="figure-img img-fluid m-auto d-block" src={img_src}>\n<figcaption class="figure-caption text-center m-auto" width:{img_width};>{img_caption}</figcaption>\n</figure>\n'
+    else:
+        return f'<img class="float-{side} {margin} mb-4" height={img_height} width={img_width} src={img_src}>\n'
+
+
+def _carousel_attrs(carousel: Tag) -> Tuple[str, str, List[str]]:
+    """Returns the id of a carousel (the name of the first image contained within it), its width, and the src of each
+    of its images."""
+    carousel_id = carousel.find('img')['src'].split('/')[-1].split('.')[0]
+    carousel_width = str(carousel['width']) if carousel.has_attr('width') else 'auto'
+    img_srcs = [img['src'] for img in carousel.find_all('img')]
+
+    return carousel_id, carousel_width, img_srcs
+
+
+def _carousel_html(carousel_id: str, carousel_width: str, img_srcs: List[str]) -> str:
+    carousel_html = []
+    carousel_indicators = []
+
+    for img_num, img_src in enumerate(img_srcs):
+        if img_num == 0:
+            carousel_html = f'<div class="carousel slide mx-auto mb-4" data-ride="carousel" data-interval="false" data-pause="false" id="carousel-{carousel_id}" style="width:100%;">\n<div class="carousel-inner" role="listbox">\n<div class="carousel-item active"><img class="img-fluid mx-auto mb-4 d-block" src="{img_src}" width={carousel_width} /></div>\n'
+            carousel_indicators = f'<ol class="carousel-indicators">\n<li data-target="#carousel-{carousel_id}" data-slide-to="{img_num}" class="active"></li>\n'
+        else:
+            carousel_html += f'<div class="carousel-item"><img class="img-fluid d-block mx-auto mb-4" src="{img_src}" width={carousel_width} /></div>\n'
+            carousel_indicators += f'<li data-target="#carousel-{carousel_id}" data-slide-to="{img_num}"></li>\n'
+
+    carousel_html += f'</div>\n<a href="#carousel-{carousel_id}" role="button" data-slide="prev" class="carousel-control-prev"><span aria-hidden="true" class="carousel-control-prev-icon"></span><span class="sr-only">Previous</span></a>\n<a href="#carousel-{carousel_id}" role="button" data-slide="next" class="carousel-control-next"><span aria-hidden="true" class="carousel-control-next-icon"></span><span class="sr-only">Next</span></a>\n'
+    carousel_indicators += f'</ol>\n</div>'
+
+    return carousel_html + carousel_indicators
+
+
+def _youtube_embed_attrs(youtube_embed: Tag) -> Tuple[str, str]:
+    """Returns the embed link and aspect ratio of a <youtube-embed> tag."""
+    yt_src = youtube_embed_link(youtube_embed.a['href'])
+    ratio = str(youtube_embed['ratio']) if youtube_embed.has_attr('ratio') else '16by9'
+
+    if ratio not in ['16by9', '4by3', '1by1', '21by9']:
+        ratio = '16by9'
+
+    return yt_src, ratio
+
+
+def _youtube_embed_html(yt_src: str, ratio: str) -> str:
+    return f'<div class="embed-responsive embed-responsive-{ratio}">\n<iframe class="embed-responsive-item" src="{yt_src}" allowfullscreen>\n</iframe>\n'
+
+
+# The markup produced by the functions above is parsed by html.parser when it replaces a custom tag. The rules below
+# build the same nodes directly, which is only equivalent when the interpolated values survive that parse unchanged;
+# otherwise, they fall back to parsing the markup.
+_PLAIN_UNQUOTED_VALUE = re.compile(r'[A-Za-z0-9_.:;%#()+,/-]*[A-Za-z0-9_.:;%#()+,-]\Z')  # e.g. src=/assets/img/x.jpg
+_PLAIN_ATTR_NAME_PART = re.compile(r'[A-Za-z0-9_.:;%#()+,-]+\Z')  # e.g. the '50%' in width:50%;
+_PLAIN_QUOTED_VALUE = re.compile(r'[^"&]*\Z')  # e.g. style="width:50%;"
+_PLAIN_TEXT = re.compile(r'[^<&]*\Z')
+
+
+def _new_tag(soup_body: object, name: str, attrs: List[Tuple[str, str]], children: Iterable = ()) -> Tag:
+    tag = soup_body.new_tag(name, attrs=dict(attrs))
+    for child in children:
+        tag.append(NavigableString(child) if isinstance(child, str) else child)
+    return tag
+
+
+def _float_center_nodes(soup_body: object, img_src: str, img_width: str, img_height: str, img_caption: Optional[str]) -> Optional[list]:
+    if not (_PLAIN_UNQUOTED_VALUE.match(img_src) and _PLAIN_UNQUOTED_VALUE.match(img_width)
+            and _PLAIN_UNQUOTED_VALUE.match(img_height)):
+        return None
+
+    if img_caption is not None:
+        if not (_PLAIN_ATTR_NAME_PART.match(img_width) and _PLAIN_TEXT.match(img_caption)):
+            return None
+        img = _new_tag(soup_body, 'img', [('class', 'figure-img img-fluid mx-auto mb-4 d-block'), ('height', img_height), ('width', img_width), ('src', img_src)])
+        figcaption = _new_tag(soup_body, 'figcaption', [('class', 'figure-caption text-center m-auto'), (f'width:{img_width};"'.lower(), '')], [img_caption] if img_caption else [])
+        figure = _new_tag(soup_body, 'figure', [('class', 'figure'), ('style', 'width:100%;')], ['\n', img, '\n', figcaption, '\n'])
+        return [figure, NavigableString('\n')]
+    else:
+        img = _new_tag(soup_body, 'img', [('class', 'img-fluid mx-auto mb-4 d-block'), ('height', img_height), ('width', img_width), ('src', img_src)])
+        return [img, NavigableString('\n')]
+
+
+def _float_side_nodes(soup_body: object, side: str, img_src: str, img_width: str, img_height: str, img_caption: Optional[str]) -> Optional[list]:
+    margin = 'ml-3' if (side == 'right') else 'mr-3'
+
+    if img_caption is not None:
+        if not (_PLAIN_UNQUOTED_VALUE.match(img_src) and _PLAIN_ATTR_NAME_PART.match(img_width)
+                and _PLAIN_QUOTED_VALUE.match(img_height) and _PLAIN_TEXT.match(img_caption)):
+            return None
+        img = _new_tag(soup_body, 'img', [('class', 'figure-img img-fluid m-auto d-block'), ('src', img_src)])
+        figcaption = _new_tag(soup_body, 'figcaption', [('class', 'figure-caption text-center m-auto'), (f'width:{img_width};'.lower(), '')], [img_caption] if img_caption else [])
+        figure = _new_tag(soup_body, 'figure', [('class', f'figure float-{side} {margin} mb-4'), ('style', f'width:{img_width}; height:{img_height};')], ['\n', img, '\n', figcaption, '\n'])
+        return [figure, NavigableString('\n')]
+    else:
+        if not (_PLAIN_UNQUOTED_VALUE.match(img_src) and _PLAIN_UNQUOTED_VALUE.match(img_width)
+                and _PLAIN_UNQUOTED_VALUE.match(img_height)):
+            return None
+        img = _new_tag(soup_body, 'img', [('class', f'float-{side} {margin} mb-4'), ('height', img_height), ('width', img_width), ('src', img_src)])
+        return [img, NavigableString('\n')]
+
+
+def _carousel_nodes(soup_body: object, carousel_id: str, carousel_width: str, img_srcs: List[str]) -> Optional[list]:
+    if not (_PLAIN_QUOTED_VALUE.match(carousel_id) and _PLAIN_UNQUOTED_VALUE.match(carousel_width)
+            and all(_PLAIN_QUOTED_VALUE.match(img_src) for img_src in img_srcs)):
+        return None
+
+    items = ['\n']
+    indicators = ['\n']
+    for img_num, img_src in enumerate(img_srcs):
+        if img_num == 0:
+            img = _new_tag(soup_body, 'img', [('class', 'img-fluid mx-auto mb-4 d-block'), ('src', img_src), ('width', carousel_width)])
+            items += [_new_tag(soup_body, 'div', [('class', 'carousel-item active')], [img]), '\n']
+            indicators += [_new_tag(soup_body, 'li', [('data-target', f'#carousel-{carousel_id}'), ('data-slide-to', str(img_num)), ('class', 'active')]), '\n']
+        else:
+            img = _new_tag(soup_body, 'img', [('class', 'img-fluid d-block mx-auto mb-4'), ('src', img_src), ('width', carousel_width)])
+            items += [_new_tag(soup_body, 'div', [('class', 'carousel-item')], [img]), '\n']
+            indicators += [_new_tag(soup_body, 'li', [('data-target', f'#carousel-{carousel_id}'), ('data-slide-to', str(img_num))]), '\n']
+
+    controls = []
+    for direction, label in (('prev', 'Previous'), ('next', 'Next')):
+        icon = _new_tag(soup_body, 'span', [('aria-hidden', 'true'), ('class', f'carousel-control-{direction}-icon')])
+        sr_label = _new_tag(soup_body, 'span', [('class', 'sr-only')], [label])
+        controls += [_new_tag(soup_body, 'a', [('href', f'#carousel-{carousel_id}'), ('role', 'button'), ('data-slide', direction), ('class', f'carousel-control-{direction}')], [icon, sr_label]), '\n']
+
+    inner = _new_tag(soup_body, 'div', [('class', 'carousel-inner'), ('role', 'listbox')], items)
+    ol = _new_tag(soup_body, 'ol', [('class', 'carousel-indicators')], indicators)
+    carousel = _new_tag(soup_body, 'div', [('class', 'carousel slide mx-auto mb-4'), ('data-ride', 'carousel'), ('data-interval', 'false'), ('data-pause', 'false'), ('id', f'carousel-{carousel_id}'), ('style', 'width:100%;')],
+                        ['\n', inner, '\n'] + controls + [ol, '\n'])
+    return [carousel]
+
+
+def _youtube_embed_nodes(soup_body: object, yt_src: str, ratio: str) -> Optional[list]:
+    if not _PLAIN_QUOTED_VALUE.match(yt_src):
+        return None
+
+    iframe = _new_tag(soup_body, 'iframe', [('class', 'embed-responsive-item'), ('src', yt_src), ('allowfullscreen', '')], ['\n'])
+    return [_new_tag(soup_body, 'div', [('class', f'embed-responsive embed-responsive-{ratio}')], ['\n', iframe, '\n'])]
+
+
+def _replace_tag(tag: Tag, nodes: Optional[list], html: Callable[[], str]) -> None:
+    """Replaces 'tag' with 'nodes', or (if None) with the result of parsing 'html()'."""
+    if nodes is not None:
+        tag.replace_with(*nodes)
+    else:
+        tag.replace_with(BeautifulSoup(html(), features='html.parser'))
+
+
+# Rules applied by md_to_html() and md_to_post_html(). Each corresponds to one of the passes above (in the order in which
+# they used to be chained), but the tags for all of them are gathered in a single walk of the tree, and custom tags are
+# replaced with nodes built directly rather than by parsing new markup.
+@post_transformer.rule('table')
+def _table_rule(table: Tag, soup_body: object, context: dict) -> None:
+    _add_table_tag(table)
+    _set_table_col_widths(table)
+
+
+@post_transformer.rule('blockquote')
+def _blockquote_rule(bq: Tag, soup_body: object, context: dict) -> None:
+    _add_blockquote_class(bq, soup_body)
+
+
+@post_transformer.rule('ul', error=CheckboxListError)
+def _checkbox_list_rule(ul: Tag, soup_body: object, context: dict) -> None:
+    _render_checkbox_list(ul, soup_body)
+
+
+@custom_tag_transformer.rule('img', error=ImageProcessingError)
+@post_transformer.rule('img', error=ImageProcessingError)
+def _image_rule(img: Tag, soup_body: object, context: dict) -> None:
+    # images already compressed by NativeMarkupRenderer are skipped
+    if img['src'] not in context.get('compressed_srcs', ()):
+        compress_blog_image(img, image_jobs=context.get('image_jobs'), srcsets=context.get('srcsets'))
+
+
+@custom_tag_transformer.rule('float-center', 'autoscale', error=ImageTagsError)
+@post_transformer.rule('float-center', 'autoscale', error=ImageTagsError)
+def _float_center_rule(float_center: Tag, soup_body: object, context: dict) -> None:
+    img_src = None
+    try:
+        img_src, img_width, img_height, img_caption = _float_image_attrs(float_center)
+        _replace_tag(float_center, _float_center_nodes(soup_body, img_src, img_width, img_height, img_caption),
+                     lambda: _float_center_html(img_src, img_width, img_height, img_caption))
+    except:
+        print(f'It looks like there might be an issue with the float-center closing tag for "{img_src}". Check the input markdown file.')
+        raise
+
+
+def _float_side_rule(float_side: Tag, soup_body: object, context: dict) -> None:
+    side = float_side.name.split('-')[-1]
+    img_src = None
+    try:
+        img_src, img_width, img_height, img_caption = _float_image_attrs(float_side)
+        _replace_tag(float_side, _float_side_nodes(soup_body, side, img_src, img_width, img_height, img_caption),
+                     lambda: _float_side_html(side, img_src, img_width, img_height, img_caption))
+    except:
+        print(f'It looks like there might be an issue with the float-{side} closing tag for "{img_src}". Check the input markdown file.')
+        raise
+
+
+for _transformer in (post_transformer, custom_tag_transformer):
+    _transformer.rule('float-left', error=ImageTagsError)(_float_side_rule)
+    _transformer.rule('float-right', error=ImageTagsError)(_float_side_rule)
+
+
+@custom_tag_transformer.rule('carousel', error=ImageTagsError)
+@post_transformer.rule('carousel', error=ImageTagsError)
+def _carousel_rule(carousel: Tag, soup_body: object, context: dict) -> None:
+    carousel_id, carousel_width, img_srcs = _carousel_attrs(carousel)
+    _replace_tag(carousel, _carousel_nodes(soup_body, carousel_id, carousel_width, img_srcs),
+                 lambda: _carousel_html(carousel_id, carousel_width, img_srcs))
+
+
+@custom_tag_transformer.rule('youtube-embed')
+@post_transformer.rule('youtube-embed')
+def _youtube_embed_rule(youtube_embed: Tag, soup_body: object, context: dict) -> None:
+    yt_src, ratio = _youtube_embed_attrs(youtube_embed)
+    _replace_tag(youtube_embed, _youtube_embed_nodes(soup_body, yt_src, ratio), lambda: _youtube_embed_html(yt_src, ratio))
+
+
+@post_transformer.rule('h2', 'h3', 'h4')
+def _heading_rule(heading: Tag, soup_body: object, context: dict) -> None:
+    # headings are collected (in document order) for the table of contents
+    context.setdefault('headings', []).append(heading)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# metrics.py
+
+from sitegen import *
+
+
+class Span(NamedTuple):
+    """A timed section of a build (start and duration in ns, from time.perf_counter_ns(), which is comparable across the
+    processes of a build)."""
+    name: str
+    category: str
+    start: int
+    duration: int
+    pid: int
+    tid: int
+    args: dict
+
+
+class Metrics:
+    """Records where the time of a build goes: nested timing spans (build stages, posts, transforms, images, template
+    renders) and counters (cache hits and misses, bytes written, ...).
+
+    Counters are always kept (they only cost a dict update); spans are only recorded while 'enabled' is set, and are
+    otherwise free apart from the call itself. Work done in worker processes is recorded there and merged back into the
+    main process (see snapshot(), since() and merge()).
+
+    Use the 'metrics' instance of this module:
+
+        with metrics.span('render', 'page', path=path):
+            ...
+        metrics.count('cache.hits')
+
+    The results can be saved as a JSON report (totals per span name, and counters) and as a Chrome trace (which can be
+    opened in chrome://tracing or https://ui.perfetto.dev).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.spans: List[Span] = []
+        self.counters: Dict[str, int] = {}
+        self.origin = time.perf_counter_ns()
+
+    def reset(self) -> None:
+        """Forgets all spans and counters (e.g. at the start of each build in watch mode)."""
+        self.spans = []
+        self.counters = {}
+        self.origin = time.perf_counter_ns()
+
+    @contextmanager
+    def span(self, name: str, category: str = 'build', **args: object) -> Iterator[None]:
+        """Context manager recording the time spent in its body as a span (if enabled). Spans opened within the body (in
+        the same thread) are nested within it.
+
+        Args:
+            name: name of the span (e.g. a stage, or a post)
+            category: kind of span; the report totals spans by category and name
+            args: (optional) details shown with the span in the trace
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.spans.append(Span(name, category, start, time.perf_counter_ns() - start, os.getpid(),
+                                   threading.get_ident(), args))
+
+    def timed(self, category: str, name: Optional[str] = None) -> Callable:
+        """Decorator recording each call of a function as a span (named after the function, by default)."""
+        def decorate(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name or function.__name__, category):
+                    return function(*args, **kwargs)
+            return wrapper
+
+        return decorate
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Adds 'n' to a counter."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self) -> Tuple[int, Dict[str, int]]:
+        """Marks the current state, for since()."""
+        return len(self.spans), dict(self.counters)
+
+    def since(self, snapshot: Tuple[int, Dict[str, int]]) -> dict:
+        """Returns the spans recorded and counts added since 'snapshot' (e.g. by one task in a worker process), to be
+        passed to merge()."""
+        n_spans, counters = snapshot
+        return {'spans': [tuple(span) for span in self.spans[n_spans:]],
+                'counters': {name: n - counters.get(name, 0) for name, n in self.counters.items()
+                             if n != counters.get(name, 0)}}
+
+    def merge(self, recorded: dict) -> None:
+        """Adds spans and counts returned by since() (in another process) to these metrics."""
+        self.spans += [Span(*span) for span in recorded['spans']]
+        for name, n in recorded['counters'].items():
+            self.count(name, n)
+
+    def report(self) -> dict:
+        """Returns the totals of each span (by category and name: number, total, and longest duration, in s), sorted
+        from the longest total, along with the counters and every span."""
+        totals: Dict[Tuple[str, str], List[float]] = {}
+        for span in self.spans:
+            total = totals.setdefault((span.category, span.name), [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += span.duration / 1e9
+            total[2] = max(total[2], span.duration / 1e9)
+
+        return {'totals': [{'category': category, 'name': name, 'count': n, 'total_s': round(total, 6),
+                            'max_s': round(longest, 6)}
+                           for (category, name), (n, total, longest) in
+                           sorted(totals.items(), key=lambda item: -item[1][1])],
+                'counters': dict(sorted(self.counters.items())),
+                'spans': [{'name': span.name, 'category': span.category,
+                           'start_s': round((span.start - self.origin) / 1e9, 6),
+                           'duration_s': round(span.duration / 1e9, 6), 'pid': span.pid, **span.args}
+                          for span in sorted(self.spans, key=lambda span: span.start)]}
+
+    def trace(self) -> dict:
+        """Returns the spans and counters in Chrome's trace event format (complete events, in us)."""
+        events = [{'name': span.name, 'cat': span.category, 'ph': 'X', 'ts': (span.start - self.origin) / 1e3,
+                   'dur': span.duration / 1e3, 'pid': span.pid, 'tid': span.tid, 'args': span.args}
+                  for span in sorted(self.spans, key=lambda span: span.start)]
+        end = max([span.start + span.duration - self.origin for span in self.spans], default=0) / 1e3
+        events += [{'name': name, 'ph': 'C', 'ts': end, 'pid': os.getpid(), 'args': {name: n}}
+                   for name, n in sorted(self.counters.items())]
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, report_path: str = Params.METRICS_REPORT_PATH, trace_path: str = Params.METRICS_TRACE_PATH) -> None:
+        """Saves the report and the trace (see report() and trace())."""
+        for path, data in [(report_path, self.report()), (trace_path, self.trace())]:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(data, f, indent=1, default=str)
+
+
+metrics = Metrics()
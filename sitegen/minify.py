@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# minify.py
+
+from sitegen import *
+
+
+# changed whenever the output of the minifiers changes, so that cached results are not reused
+_MINIFIER_VERSION = '1'
+
+# html tokens: elements whose contents are kept as they are (other than the css or js they contain), comments, and tags
+_HTML_TOKENS = re.compile(r'(?P<raw><(?P<raw_name>pre|code|textarea|script|style)\b[^>]*>)(?P<raw_content>.*?)'
+                          r'(?P<raw_end></(?P=raw_name)\s*>)'
+                          r'|(?P<comment><!--.*?-->)'
+                          r'|(?P<tag></?(?P<tag_name>[a-z][a-z0-9]*|!doctype)\b[^>]*>)', re.IGNORECASE | re.DOTALL)
+# (only ascii whitespace is collapsed; e.g. non-breaking spaces are significant)
+_HTML_WHITESPACE = re.compile(r'[ \t\n\r\f]+')
+# elements next to which whitespace-only text is never rendered
+_BLOCK_TAGS = {'!doctype', 'html', 'head', 'body', 'title', 'meta', 'link', 'base', 'address', 'article', 'aside',
+               'blockquote', 'dd', 'details', 'dialog', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer',
+               'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hgroup', 'hr', 'li', 'main', 'nav', 'ol', 'p',
+               'pre', 'section', 'summary', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul'}
+_JS_TYPES = {'text/javascript', 'application/javascript', 'module'}
+
+# css tokens kept as they are: strings and urls; comments are removed
+_CSS_LITERALS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|\burl\([^)]*\))|/\*.*?\*/', re.DOTALL)
+
+
+def minify_html(html: str) -> str:
+    """Minifies html conservatively: runs of whitespace are collapsed to a single space, whitespace-only text next to a
+    block-level element is removed, and comments (other than conditional comments) are removed. The contents of
+    <pre>, <code> and <textarea> elements are left alone, and those of <style> and <script> elements are minified as
+    css and js.
+
+    NOTE: whitespace is assumed not to be significant outside of these elements (i.e. no 'white-space: pre' styling).
+    """
+    tokens: List[Tuple[str, str]] = []  # (tag name, or '' for text, and markup)
+    position = 0
+    for match in _HTML_TOKENS.finditer(html):
+        _append_text(tokens, html[position:match.start()])
+        position = match.end()
+
+        if match.group('raw') is not None:
+            name, content = match.group('raw_name').lower(), match.group('raw_content')
+            if name == 'style':
+                content = minify_css(content)
+            elif (name == 'script') and _is_inline_js(match.group('raw')):
+                content = minify_js(content)
+            tokens.append((name, match.group('raw') + content + match.group('raw_end')))
+        elif match.group('comment') is not None:
+            if match.group('comment').startswith('<!--[if'):
+                tokens.append(('!--', match.group('comment')))
+        else:
+            tokens.append((match.group('tag_name').lower(), match.group('tag')))
+    _append_text(tokens, html[position:])
+
+    minified = []
+    for i, (name, markup) in enumerate(tokens):
+        if name:
+            minified.append(markup)
+            continue
+        text = _HTML_WHITESPACE.sub(' ', markup)
+        # (the start and end of the document count as block-level)
+        neighbours = [tokens[j][0] if 0 <= j < len(tokens) else 'html' for j in (i - 1, i + 1)]
+        if (text == ' ') and any(neighbour in _BLOCK_TAGS for neighbour in neighbours):
+            continue
+        minified.append(text)
+
+    return ''.join(minified)
+
+
+def minify_css(css: str) -> str:
+    """Minifies css: comments are removed, whitespace is collapsed, and whitespace around braces, semicolons, commas and
+    child combinators (and after colons) is removed, as is the last semicolon of each block. Strings and urls are left
+    alone."""
+    literals: List[str] = []
+
+    def stash(match: re.Match) -> str:
+        if match.group(1) is None:
+            return ''
+        literals.append(match.group(1))
+        return f'\x00{len(literals) - 1}\x00'
+
+    css = _CSS_LITERALS.sub(stash, css)
+    css = re.sub(r'[ \t\n\r\f]+', ' ', css)
+    css = re.sub(r' ?([{};,>]) ?', r'\1', css)
+    css = css.replace(': ', ':').replace(';}', '}').strip()
+
+    return re.sub(r'\x00(\d+)\x00', lambda match: literals[int(match.group(1))], css)
+
+
+def minify_js(js: str) -> str:
+    """Minifies inline js line by line, so that automatic semicolon insertion is unaffected: indentation, blank lines and
+    whole-line // comments are removed. Scripts with template literals or line continuations (whose whitespace may be
+    part of a string) are left alone."""
+    if ('`' in js) or re.search(r'\\\r?\n', js):
+        return js
+
+    lines = [line.strip() for line in js.splitlines()]
+
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+class Minifier:
+    """Minifies html and css files as they are written to the output tree (see OutputTree's 'transform'). Minified
+    files are cached on disk, keyed on a hash of their contents, so unchanged files are only ever minified once. Files
+    that are already minified ('*.min.css') are left alone.
+
+    The number of files minified and their sizes before and after are recorded per file type, for the build report.
+    """
+    minifiers: Dict[str, Callable[[str], str]] = {'.html': minify_html, '.css': minify_css}
+
+    def __init__(self, cache_dir: str = Params.MINIFY_CACHE_PATH):
+        self.cache_dir = cache_dir
+        self.stats: Dict[str, List[int]] = {}  # extension -> [number of files, bytes before, bytes after]
+
+    def __call__(self, path: str, data: bytes) -> bytes:
+        ext = os.path.splitext(path)[1].lower()
+        if (ext not in self.minifiers) or path.lower().endswith(f'.min{ext}'):
+            return data
+
+        digest = hashlib.md5(f'{_MINIFIER_VERSION}{ext}'.encode('utf-8') + data).hexdigest()
+        cache_path = os.path.join(self.cache_dir, digest[:2], f'{digest}{ext}')
+
+        if os.path.exists(cache_path):
+            metrics.count('minify.cache_hits')
+            with open(cache_path, 'rb') as f:
+                minified = f.read()
+        else:
+            metrics.count('minify.cache_misses')
+            try:
+                minified = self.minifiers[ext](data.decode('utf-8')).encode('utf-8')
+            except UnicodeDecodeError:
+                return data
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(minified)
+            os.replace(tmp_path, cache_path)
+
+        stats = self.stats.setdefault(ext, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += len(data)
+        stats[2] += len(minified)
+
+        return minified
+
+
+def _append_text(tokens: List[Tuple[str, str]], text: str) -> None:
+    # adjacent text (e.g. either side of a removed comment) is merged, so that its whitespace is collapsed together
+    if not text:
+        return
+    if tokens and (tokens[-1][0] == ''):
+        tokens[-1] = ('', tokens[-1][1] + text)
+    else:
+        tokens.append(('', text))
+
+
+def _is_inline_js(script_tag: str) -> bool:
+    # whether a <script> tag holds js (rather than loading it, or holding e.g. json)
+    if re.search(r'\bsrc\s*=', script_tag, re.IGNORECASE):
+        return False
+    script_type = re.search(r'\btype\s*=\s*["\']?([^"\'\s>]+)', script_tag, re.IGNORECASE)
+    return (script_type is None) or (script_type.group(1).lower() in _JS_TYPES)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# output.py
+
+from sitegen import *
+
+
+class OutputTree:
+    """Writes the generated site to an output directory, keeping a manifest of every file produced (as a path -> md5
+    hash dict, saved between builds).
+
+    In incremental mode, a file is only (re)written when its contents have actually changed since the previous build, so
+    unchanged files keep their mtimes; once the build is finished, finalize() deletes any file that was produced by the
+    previous build but not by this one. Otherwise, the output directory is emptied up front and everything is written.
+
+    All paths passed to an OutputTree are relative to its output directory (a leading '/', as in post URLs, is ignored).
+
+    If given, 'transform' is called with the path and contents of every file written (or copied), and returns the
+    contents to write instead (e.g. a Minifier).
+
+    Copied files are also recorded by the stat (size, mtime and inode) of their source, saved alongside the manifest,
+    so that a file copied from an unchanged source is kept without reading or hashing the source again.
+    """
+    def __init__(self, output_dir: str, manifest_path: str, incremental: bool = True, transform: Optional[Callable[[str, bytes], bytes]] = None):
+        self.output_dir = output_dir
+        self.manifest_path = manifest_path
+        self.incremental = incremental
+        self.transform = transform
+        self.manifest: Dict[str, str] = {}
+        self.written: List[str] = []
+        self.removed: List[str] = []
+        # path -> [source, source stat, transform] of every copied file
+        self.sources_path = f'{os.path.splitext(manifest_path)[0]}_sources.json'
+        self.sources: Dict[str, list] = {}
+
+        if incremental and os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                self.previous_manifest: Dict[str, str] = json.load(f)
+        else:
+            self.previous_manifest = {}
+        if incremental and os.path.exists(self.sources_path):
+            with open(self.sources_path, 'r') as f:
+                self.previous_sources: Dict[str, list] = json.load(f)
+        else:
+            self.previous_sources = {}
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+
+        os.makedirs(output_dir, exist_ok=True)
+
+    def full_path(self, path: str) -> str:
+        """Returns the location of 'path' on disk."""
+        return os.path.join(self.output_dir, self._key(path))
+
+    def write(self, path: str, data: Union[str, bytes]) -> bool:
+        """Writes 'data' to 'path', unless the file already holds exactly these bytes.
+
+        Args:
+            path: output path of the file
+            data: file contents; str is encoded as utf-8
+
+        Returns:
+            True if the file was written, False if it was already up to date
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        key = self._key(path)
+        if self.transform is not None:
+            data = self.transform(key, data)
+        digest = hashlib.md5(data).hexdigest()
+        self.manifest[key] = digest
+
+        if self._is_current(key, digest):
+            metrics.count('output.files_unchanged')
+            return False
+
+        full_path = self.full_path(key)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(data)
+        self.written.append(key)
+        metrics.count('output.files_written')
+        metrics.count('output.bytes_written', len(data))
+
+        return True
+
+    def write_chunks(self, path: str, chunks: Iterable[Union[str, bytes]], buffer_size: int = Params.OUTPUT_BUFFER_SIZE) -> bool:
+        """As write(), for contents produced a chunk at a time (e.g. a page streamed from its template): chunks are
+        gathered into blocks of at least 'buffer_size' bytes, which are hashed and written to a temporary file as they
+        are produced, so the whole file is never held in memory, and the file is then moved into place (unless it
+        already holds exactly these bytes, in which case the temporary file is discarded). If there is a 'transform',
+        the chunks are joined and passed to write().
+
+        Args:
+            path: output path of the file
+            chunks: file contents; str is encoded as utf-8
+            buffer_size: smallest block written at a time (units: bytes)
+
+        Returns:
+            True if the file was written, False if it was already up to date
+        """
+        encode = lambda chunk: chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        if self.transform is not None:
+            return self.write(path, b''.join(encode(chunk) for chunk in chunks))
+
+        key = self._key(path)
+        full_path = self.full_path(key)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f'{full_path}.{os.getpid()}.tmp'
+
+        digest = hashlib.md5()
+        n_bytes = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                block: List[bytes] = []
+                block_size = 0
+                for chunk in chunks:
+                    block.append(encode(chunk))
+                    block_size += len(block[-1])
+                    if block_size >= buffer_size:
+                        n_bytes += self._write_block(f, digest, block)
+                        block, block_size = [], 0
+                n_bytes += self._write_block(f, digest, block)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.manifest[key] = digest.hexdigest()
+
+        if self._is_current(key, self.manifest[key]):
+            os.remove(tmp_path)
+            metrics.count('output.files_unchanged')
+            return False
+
+        os.replace(tmp_path, full_path)
+        self.written.append(key)
+        metrics.count('output.files_written')
+        metrics.count('output.bytes_written', n_bytes)
+
+        return True
+
+    def copy(self, src: str, path: str) -> bool:
+        """Copies the file 'src' to 'path', unless the file already holds exactly the same bytes. If 'src' has the same
+        stat as when it was last copied to 'path' (and is transformed the same way), the file is kept as it is without
+        reading 'src' at all.
+
+        Args:
+            src: path of the file to copy
+            path: output path of the file
+
+        Returns:
+            True if the file was written, False if it was already up to date
+        """
+        key = self._key(path)
+        stat = os.stat(src)
+        source = [src, [stat.st_size, stat.st_mtime_ns, stat.st_ino], type(self.transform).__name__]
+        self.sources[key] = source
+        if (self.previous_sources.get(key) == source) and (key in self.previous_manifest) and \
+                os.path.exists(self.full_path(key)):
+            self.manifest[key] = self.previous_manifest[key]
+            metrics.count('output.files_unchanged')
+            return False
+
+        with open(src, 'rb') as f:
+            return self.write(path, f.read())
+
+    def copy_tree(self, src_dir: str, path: str = '', ignore: Optional[List[str]] = None) -> None:
+        """Copies every file in 'src_dir' (recursively) to 'path', skipping any file or directory whose name is listed
+        in 'ignore'.
+        """
+        ignore = [] if ignore is None else ignore
+
+        for root, dirs, files in os.walk(src_dir):
+            dirs[:] = sorted(d for d in dirs if d not in ignore)
+            rel_root = os.path.relpath(root, src_dir)
+            for file in sorted(files):
+                if file not in ignore:
+                    self.copy(os.path.join(root, file), os.path.join(path, rel_root, file))
+
+    def claim(self, path: str) -> bool:
+        """Keeps a file produced by the previous build without rewriting it, if it still exists.
+
+        Returns:
+            True if the file was claimed, False if it must be (re)generated
+        """
+        key = self._key(path)
+        if (key in self.previous_manifest) and os.path.exists(self.full_path(key)):
+            self.manifest[key] = self.previous_manifest[key]
+            metrics.count('output.files_claimed')
+            return True
+
+        return False
+
+    def adopt(self, path: str) -> None:
+        """Records a file that was written directly to the output directory (rather than through this OutputTree), so
+        that it is tracked by the manifest.
+        """
+        key = self._key(path)
+        with open(self.full_path(key), 'rb') as f:
+            self.manifest[key] = hashlib.md5(f.read()).hexdigest()
+        if self.previous_manifest.get(key) != self.manifest[key]:
+            self.written.append(key)
+
+    def finalize(self) -> None:
+        """Deletes files that were produced by the previous build but not by this one (along with any directories left
+        empty), and saves the manifest for the next build.
+        """
+        for key in sorted(set(self.previous_manifest) - set(self.manifest)):
+            full_path = self.full_path(key)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+                self.removed.append(key)
+                self._remove_empty_dirs(os.path.dirname(full_path))
+
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=0, sort_keys=True)
+        with open(self.sources_path, 'w') as f:
+            json.dump({key: source for key, source in self.sources.items() if key in self.manifest}, f, indent=0,
+                      sort_keys=True)
+
+    def _is_current(self, key: str, digest: str) -> bool:
+        return (self.previous_manifest.get(key) == digest) and os.path.exists(self.full_path(key))
+
+    def _remove_empty_dirs(self, directory: str) -> None:
+        output_dir = os.path.normpath(self.output_dir)
+        directory = os.path.normpath(directory)
+        while (directory != output_dir) and directory.startswith(output_dir) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+    @staticmethod
+    def _write_block(f: io.BufferedWriter, digest: object, block: List[bytes]) -> int:
+        # writes a block of chunks (joined), adding it to the running hash 'digest'; returns the number of bytes written
+        data = b''.join(block)
+        digest.update(data)
+        return f.write(data)
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normpath(path.lstrip('/'))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# post_cache.py
+
+from sitegen import *
+
+
+class PostCache(Mapping):
+    """Post database cache, stored (as an SQLite database) with one record per post, so that posts can be loaded one at a
+    time and only the records of posts that have changed are written back.
+
+    Records are JSON, with datetimes and dates stored as tagged ISO 8601 strings, so that they are loaded as such. The
+    hash, image jobs, source filename, source stat (size, mtime and inode) and render settings of each post are also kept
+    in their own columns, so that unchanged posts can be found without loading any record, along with a digest of its
+    fragments (see add_post_fragments()), so that records whose fragments have been re-rendered are written back.
+
+    A PostCache is a read-only mapping of slugs to post_db entries; it is updated with update().
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS posts (slug TEXT PRIMARY KEY, hash TEXT NOT NULL, '
+                                'images TEXT NOT NULL, record TEXT NOT NULL)')
+        # columns added since the table was first created
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(posts)')]
+        for column in ['source', 'stat', 'settings', 'fragments']:
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE posts ADD COLUMN {column} TEXT NOT NULL DEFAULT 'null'")
+
+    def __getitem__(self, slug: str) -> dict:
+        row = self.connection.execute('SELECT record FROM posts WHERE slug = ?', (slug,)).fetchone()
+        if row is None:
+            raise KeyError(slug)
+        return json.loads(row[0], object_hook=_decode_datetime)
+
+    def __iter__(self) -> Iterable[str]:
+        return iter([row[0] for row in self.connection.execute('SELECT slug FROM posts ORDER BY slug')])
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+
+    def __contains__(self, slug: object) -> bool:
+        return self.connection.execute('SELECT 1 FROM posts WHERE slug = ?', (slug,)).fetchone() is not None
+
+    def index(self) -> Dict[str, dict]:
+        """Returns the hash, image jobs, source filename, source stat, render settings and fragments digest of every
+        cached post (without loading their records), keyed by slug."""
+        return {slug: {'hash': post_hash, 'images': json.loads(images), 'source': json.loads(source),
+                       'stat': json.loads(stat), 'settings': json.loads(settings), 'fragments': json.loads(fragments)}
+                for slug, post_hash, images, source, stat, settings, fragments
+                in self.connection.execute('SELECT slug, hash, images, source, stat, settings, fragments FROM posts')}
+
+    def update(self, post_db: Dict[str, dict]) -> Tuple[int, int]:
+        """Brings the cache in line with 'post_db': the records of posts whose hash, image jobs, source filename or stat,
+        render settings or fragments differ from those cached (or that are not cached yet) are written, and posts that are no longer in
+        'post_db' are deleted.
+
+        Returns:
+            tuple of the number of records written and deleted
+        """
+        index = self.index()
+
+        changed = []
+        for slug, post in post_db.items():
+            columns = {'hash': post['hash'], 'images': json.loads(json.dumps(post.get('images', []))),
+                       'source': post.get('source'), 'stat': post.get('source_stat'),
+                       'settings': post.get('render_settings'),
+                       'fragments': hashlib.md5(json.dumps(post.get('fragments'), sort_keys=True).encode('utf-8')).hexdigest()}
+            if index.get(slug) != columns:
+                changed.append((slug, post['hash'], json.dumps(columns['images']), json.dumps(columns['source']),
+                                json.dumps(columns['stat']), json.dumps(columns['settings']),
+                                json.dumps(columns['fragments']), json.dumps(post, default=_encode_datetime)))
+        removed = [(slug,) for slug in index if slug not in post_db]
+
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO posts (slug, hash, images, source, stat, settings, '
+                                        'fragments, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', changed)
+            self.connection.executemany('DELETE FROM posts WHERE slug = ?', removed)
+
+        return len(changed), len(removed)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _encode_datetime(obj: object) -> dict:
+    if isinstance(obj, datetime):
+        return {'$datetime': obj.isoformat()}
+    # dates without a time (e.g. a date-only 'date:' in the front matter)
+    if isinstance(obj, date):
+        return {'$date': obj.isoformat()}
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _decode_datetime(obj: dict) -> object:
+    if (len(obj) == 1) and ('$datetime' in obj):
+        return datetime.fromisoformat(obj['$datetime'])
+    if (len(obj) == 1) and ('$date' in obj):
+        return date.fromisoformat(obj['$date'])
+    return obj
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# post_index.py
+
+from sitegen import *
+
+
+class PostIndex:
+    """The orders in which posts are listed, worked out once for a post_db: slugs by date (newest first) and by title,
+    the posts of each topic in both orders and of each year, and the position of each post by date. Listings (sort_posts(),
+    get_newest_posts(), pages of the blog index, topics) are then slices of these rather than fresh sorts.
+
+    Orders are those of sort_posts() as it has always been (stable, so that posts with equal keys keep the order of
+    post_db), but sorted by typed keys (dates as datetimes) rather than by their strings.
+    """
+    sort_keys = ['date', 'post_title']
+
+    def __init__(self, post_db: dict):
+        self.orders: Dict[str, List[str]] = {'date': sorted(post_db, key=lambda post: _date_key(post_db[post]['date']), reverse=True),
+                                             'post_title': sorted(post_db, key=lambda post: str(post_db[post]['post_title']))}
+        self.positions: Dict[str, int] = {post: i for i, post in enumerate(self.orders['date'])}
+
+        # year -> posts, newest first (years in descending order)
+        self.years: Dict[int, List[str]] = {}
+        for post in self.orders['date']:
+            self.years.setdefault(post_db[post]['date'].year, []).append(post)
+
+        # topic -> posts, in each order (topics in alphabetical order)
+        topics = sorted({topic for post in post_db.values() for topic in (post['topics'] or [])})
+        self.topics: Dict[str, Dict[str, List[str]]] = {}
+        for sort_key, posts in self.orders.items():
+            self.topics[sort_key] = {topic: [] for topic in topics}
+            for post in posts:
+                for topic in post_db[post]['topics'] or []:
+                    self.topics[sort_key][topic].append(post)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def sorted(self, sort_key: str = 'date') -> List[str]:
+        """Returns all posts, newest first (by 'date') or by title ('post_title')."""
+        return list(self.orders[sort_key])
+
+    def newest(self, number: Optional[int] = None, topic_name: Optional[str] = None) -> List[str]:
+        """Returns the 'number' newest posts (or all), in all topics or in 'topic_name'."""
+        if topic_name is None:
+            return self.orders['date'][:number]
+        return self.topics['date'].get(topic_name, [])[:number]
+
+    def topic_posts(self, sort_key: str = 'date') -> Dict[str, List[str]]:
+        """Returns a dict of every topic (in alphabetical order) and its posts, in the given order."""
+        return {topic: list(posts) for topic, posts in self.topics[sort_key].items()}
+
+    def year_posts(self) -> Dict[int, List[str]]:
+        """Returns a dict of every year with posts (newest first) and its posts, newest first."""
+        return {year: list(posts) for year, posts in self.years.items()}
+
+    def n_pages(self, posts_per_page: int) -> int:
+        """Returns the number of pages needed to list all posts, 'posts_per_page' to a page."""
+        return math.ceil(len(self) / posts_per_page)
+
+    def page(self, page_number: int, posts_per_page: int) -> List[str]:
+        """Returns the posts on a page (numbered from 1) of the listing of all posts, newest first."""
+        return self.orders['date'][(page_number - 1) * posts_per_page:page_number * posts_per_page]
+
+
+class PostDatabase(dict):
+    """post_db, as returned by build_post_db(): a dict of post data keyed by slug, which keeps a PostIndex of its posts
+    (see 'index'). The index is built when first needed and dropped whenever posts are added, replaced or removed; if
+    the date, title or topics of a post are changed in place, call invalidate() so that it is rebuilt.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._index: Optional[PostIndex] = None
+
+    @property
+    def index(self) -> PostIndex:
+        if self._index is None:
+            self._index = PostIndex(self)
+        return self._index
+
+    def invalidate(self) -> None:
+        self._index = None
+
+    def __setitem__(self, key, value):
+        self._index = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._index = None
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self._index = None
+        return super().__ior__(other)
+
+    def clear(self):
+        self._index = None
+        super().clear()
+
+    def pop(self, *args):
+        self._index = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._index = None
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._index = None
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._index = None
+        super().update(*args, **kwargs)
+
+
+def get_post_index(post_db: dict) -> PostIndex:
+    """Returns the PostIndex of a post_db: its own, if it is a PostDatabase, or else a new one."""
+    if isinstance(post_db, PostDatabase):
+        return post_db.index
+    return PostIndex(post_db)
+
+
+def _date_key(date: object) -> object:
+    # dates without a time sort as midnight, so that they can be compared with datetimes
+    if (not isinstance(date, datetime)) and hasattr(date, 'year'):
+        return datetime(date.year, date.month, date.day)
+    return date
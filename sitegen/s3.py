@@ -17,9 +17,203 @@ You should also have a file at '~/.aws/config,' with the following:
 
     [default]
     region = YOUR_PREFERRED_REGION
-    
+
+Deploying requires boto3 (pip3 install boto3). To deploy to an S3-compatible stand-in (e.g. a moto server or MinIO),
+set Params.S3_ENDPOINT_URL to its url.
 """
 
 
-def sync() -> None:
-    subprocess.run(f'aws s3 sync {Params.OUTPUT_PATH} s3://{Params.BUCKET_NAME}', shell=True, capture_output=True)
+# Cache-Control of each kind of object: html is always revalidated, fingerprinted assets (whose names change whenever
+# their contents do) are cached indefinitely, and everything else is cached for an hour
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_CONTROL_HTML = 'public, max-age=0, must-revalidate'
+CACHE_CONTROL_DEFAULT = 'public, max-age=3600'
+_FINGERPRINTED = re.compile(r'[.-][0-9a-f]{8,}\.[a-z0-9]+$')
+# encodings of precompressed sidecars (see sitegen.compression), which are uploaded with the content type of the file
+# they belong to
+_SIDECAR_ENCODINGS = {'.gz': 'gzip', '.br': 'br'}
+# files of at least this size are uploaded in parts of this size (units: bytes)
+_MULTIPART_SIZE = 8 * 1024 * 1024
+
+
+def object_headers(key: str) -> Dict[str, str]:
+    """Returns the headers (content type, encoding and cache control) with which an output file is uploaded."""
+    name, ext = os.path.splitext(key)
+    headers = {}
+    if ext in _SIDECAR_ENCODINGS:
+        headers['ContentEncoding'] = _SIDECAR_ENCODINGS[ext]
+        key = name
+    headers['ContentType'] = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+    # (html is never cached as immutable, whatever its name: a page can change without being renamed)
+    if key.endswith('.html'):
+        headers['CacheControl'] = CACHE_CONTROL_HTML
+    elif _FINGERPRINTED.search(key):
+        headers['CacheControl'] = CACHE_CONTROL_IMMUTABLE
+    else:
+        headers['CacheControl'] = CACHE_CONTROL_DEFAULT
+
+    return headers
+
+
+def plan_deploy(output_dir: str, deploy_manifest: Dict[str, dict]) -> Tuple[Dict[str, dict], List[str]]:
+    """Compares the output directory with the deploy manifest (the state of the bucket as of the last deploy), without
+    contacting the bucket.
+
+    Args:
+        output_dir: output directory
+        deploy_manifest: key -> {'hash', and object headers} of every object in the bucket
+
+    Returns:
+        tuple of the manifest entries of the objects to upload (new or changed files, and files whose headers have
+            changed), keyed by key, and the keys of the objects to delete
+    """
+    # every file is hashed as it is now (rather than taken from the output manifest, which may be out of date, e.g. after
+    # a failed build or if a file in the output directory was edited by hand)
+    local: Dict[str, dict] = {}
+    for root, dirs, files in os.walk(output_dir):
+        for file in files:
+            key = os.path.relpath(os.path.join(root, file), output_dir).replace(os.sep, '/')
+            with open(os.path.join(root, file), 'rb') as f:
+                digest = hashlib.md5(f.read()).hexdigest()
+            local[key] = {'hash': digest, **object_headers(key)}
+
+    uploads = {key: entry for key, entry in sorted(local.items()) if deploy_manifest.get(key) != entry}
+    deletes = sorted(key for key in deploy_manifest if key not in local)
+
+    return uploads, deletes
+
+
+def sync(output_dir: str = Params.OUTPUT_PATH, bucket: str = Params.BUCKET_NAME, manifest_path: str = Params.DEPLOY_MANIFEST_PATH, endpoint_url: Optional[str] = Params.S3_ENDPOINT_URL, workers: int = Params.DEPLOY_WORKERS, dry_run: bool = False, client: Optional[object] = None) -> Tuple[List[str], List[str]]:
+    """Deploys the output directory to an S3 bucket, uploading only new and changed files (in parallel, with multipart
+    transfers for large files) and deleting objects whose files are gone.
+
+    What to upload and delete is worked out locally, from a deploy manifest recording the hash and headers of every
+    object deployed. If there is no manifest (e.g. on the first deploy from this machine), the bucket is listed once to
+    build one: objects whose ETag matches that of their file (its md5 hash or, for multipart uploads, the md5 hash of
+    the md5 hashes of its parts) are taken to be up to date.
+
+    The manifest is updated with every object that was uploaded or deleted, even if the deploy fails part-way, so that
+    deploying again picks up where it stopped.
+
+    Args:
+        output_dir: output directory
+        bucket: name of the bucket
+        manifest_path: path of the deploy manifest
+        endpoint_url: (optional) url of an S3-compatible server to use instead of AWS
+        workers: number of concurrent uploads (each of which may transfer up to 'workers' parts at once)
+        dry_run: if True, only print what would be uploaded and deleted
+        client: (optional) boto3 S3 client to use
+
+    Returns:
+        tuple of the keys uploaded and deleted (or to be, if 'dry_run')
+    """
+    if client is None:
+        if boto3 is None:
+            raise DeployError('boto3 is not installed.')
+        # (a connection for every part that may be in flight: 'workers' parts of each of 'workers' uploads)
+        client = boto3.client('s3', endpoint_url=endpoint_url,
+                              config=BotoConfig(max_pool_connections=max(workers * workers, 10)))
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            deploy_manifest: Dict[str, dict] = json.load(f)
+    else:
+        deploy_manifest = _manifest_from_bucket(client, bucket, output_dir)
+
+    uploads, deletes = plan_deploy(output_dir, deploy_manifest)
+    n_bytes = sum(os.path.getsize(os.path.join(output_dir, key)) for key in uploads)
+    print(f'Deploying to {bucket}: {len(uploads)} files to upload ({n_bytes / 1e6:.1f} MB), {len(deletes)} to delete.')
+    if dry_run:
+        for key in uploads:
+            print(f'  upload {key}')
+        for key in deletes:
+            print(f'  delete {key}')
+        return list(uploads), deletes
+
+    transfer_config = TransferConfig(multipart_threshold=_MULTIPART_SIZE, multipart_chunksize=_MULTIPART_SIZE,
+                                     max_concurrency=workers)
+    errors: Dict[str, Exception] = {}
+
+    def upload(key: str) -> None:
+        headers = {header: value for header, value in uploads[key].items() if header != 'hash'}
+        client.upload_file(os.path.join(output_dir, key), bucket, key, ExtraArgs=headers, Config=transfer_config)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(upload, key): key for key in uploads}
+            for i, future in enumerate(as_completed(futures)):
+                key = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[key] = e
+                    print(f'[{i + 1}/{len(uploads)}] failed: {key} ({e})')
+                    continue
+                deploy_manifest[key] = uploads[key]
+                print(f'[{i + 1}/{len(uploads)}] uploaded: {key}')
+
+        # objects are only deleted once everything has been uploaded, so that no page links to a missing object
+        if not errors:
+            for i in range(0, len(deletes), 1000):
+                batch = deletes[i:i + 1000]
+                response = client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in batch],
+                                                                        'Quiet': True})
+                failed = {error['Key']: error.get('Message') for error in response.get('Errors', [])}
+                for key in batch:
+                    if key in failed:
+                        errors[key] = DeployError(failed[key])
+                    else:
+                        deploy_manifest.pop(key, None)
+                print(f'Deleted {len(batch) - len(failed)} objects.')
+    finally:
+        _save_manifest(deploy_manifest, manifest_path)
+
+    if errors:
+        raise DeployError(f'{len(errors)} objects could not be deployed (first: {next(iter(errors))}).') \
+            from next(iter(errors.values()))
+
+    return list(uploads), deletes
+
+
+def _manifest_from_bucket(client: object, bucket: str, output_dir: str) -> Dict[str, dict]:
+    # a deploy manifest built by listing the bucket; objects whose ETag is that of their (current) file are assumed to
+    # have been uploaded with the current headers, and all other objects are recorded as out of date
+    deploy_manifest: Dict[str, dict] = {}
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            key, etag = obj['Key'], obj['ETag'].strip('"')
+            path = os.path.join(output_dir, key)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if _etag(data, multipart='-' in etag) == etag:
+                    deploy_manifest[key] = {'hash': hashlib.md5(data).hexdigest(), **object_headers(key)}
+                    continue
+            deploy_manifest[key] = {'hash': None}
+
+    return deploy_manifest
+
+
+def _etag(data: bytes, multipart: bool = False, part_size: int = _MULTIPART_SIZE) -> str:
+    # ETag of an object: the md5 hash of its contents or, if it was uploaded in parts, the md5 hash of the (binary) md5
+    # hashes of its parts, followed by '-' and the number of parts
+    if not multipart:
+        return hashlib.md5(data).hexdigest()
+    parts = [hashlib.md5(data[i:i + part_size]).digest() for i in range(0, len(data), part_size)]
+    return f'{hashlib.md5(b"".join(parts)).hexdigest()}-{len(parts)}'
+
+
+def _save_manifest(deploy_manifest: Dict[str, dict], manifest_path: str) -> None:
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(deploy_manifest, f, indent=0, sort_keys=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Deploys the output directory to Params.BUCKET_NAME.')
+    parser.add_argument('--dry-run', action='store_true', help='only print what would be uploaded and deleted')
+    sync(dry_run=parser.parse_args().dry_run)
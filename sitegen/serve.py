@@ -8,25 +8,267 @@ Use instead of `python3 -m http.server` when you need CORS.
 Derived from gist @ https://gist.github.com/acdha/925e9ffc3d74ad59c3ea
 """
 
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from email.utils import parsedate_to_datetime
+from functools import partial
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import Optional, Set, Tuple
+from urllib.parse import urlsplit
+import gzip
+import io
 import os
+import re
+import threading
+
+
+# path of the server-sent event stream over which reloads are pushed, and the script (injected into html pages) that
+# listens to it
+LIVE_RELOAD_PATH = '/__livereload'
+LIVE_RELOAD_SCRIPT = (f'<script>new EventSource("{LIVE_RELOAD_PATH}").onmessage = function () {{ location.reload(); }};'
+                      f'</script>').encode('utf-8')
+
+
+class LiveReload:
+    """Pushes a reload to every browser connected to the preview server each time notify() is called (e.g. by watch
+    mode, once a rebuild has changed the output)."""
+    def __init__(self):
+        self.generation = 0
+        self.condition = threading.Condition()
+
+    def notify(self) -> None:
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+
+    def wait(self, generation: int, timeout: float) -> int:
+        """Waits (for up to 'timeout' seconds) for a reload after 'generation', and returns the current generation."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.generation != generation, timeout)
+            return self.generation
 
 
 class CORSRequestHandler(SimpleHTTPRequestHandler):
+    cache_control = 'no-store, no-cache, must-revalidate'
+
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
+        self.send_header('Cache-Control', self.cache_control)
         return super(CORSRequestHandler, self).end_headers()
 
-def serve(directory: str = './', port: int = 8000) -> None:
-    os.chdir(directory)
 
-    httpd = HTTPServer(('localhost', port), CORSRequestHandler)
+class PreviewRequestHandler(CORSRequestHandler):
+    """As CORSRequestHandler, but cache-aware, so that the preview behaves like the production site under load:
+    connections are kept alive (HTTP/1.1), browsers may cache files as long as they revalidate them (each file has an
+    ETag and Last-Modified date, and conditional requests are answered with 304 Not Modified), single byte ranges are
+    supported, and text files are compressed for clients that accept it: precompressed sidecars (.br or .gz, see
+    sitegen.compression) are sent if there are any, and other text files are gzipped on the fly.
+    """
+    protocol_version = 'HTTP/1.1'
+    cache_control = 'no-cache'
+    # headers and body are sent separately; without TCP_NODELAY, each response on a kept-alive connection waits for the
+    # client's delayed ACK
+    disable_nagle_algorithm = True
+
+    # content types worth compressing, and the minimum size of a file to compress (units: bytes)
+    compressible_types = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+    min_compress_size = 256
+    # whether to serve precompressed sidecars (which cannot be used if files are transformed as they are served)
+    precompressed = True
+    sidecar_exts = {'br': '.br', 'gzip': '.gz'}  # in order of preference
+
+    def send_head(self) -> Optional[io.BytesIO]:
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = os.path.join(path, 'index.html')
+            if not (urlsplit(self.path).path.endswith('/') and os.path.isfile(index)):
+                # redirect (if the trailing slash is missing) or directory listing
+                return super().send_head()
+            path = index
+        if path.endswith('/') or not os.path.isfile(path):
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+
+        stat = os.stat(path)
+        content_type = self.guess_type(path)
+        encoding, sidecar = None, None
+        if content_type.startswith(self.compressible_types) and ('Range' not in self.headers):
+            accepted = _accepted_encodings(self.headers.get('Accept-Encoding', ''))
+            if self.precompressed:
+                for sidecar_encoding, sidecar_ext in self.sidecar_exts.items():
+                    # sidecars older than their file are out of date
+                    if (sidecar_encoding in accepted) and os.path.isfile(path + sidecar_ext) and \
+                            (os.stat(path + sidecar_ext).st_mtime_ns >= stat.st_mtime_ns):
+                        encoding, sidecar = sidecar_encoding, path + sidecar_ext
+                        break
+            if (encoding is None) and ('gzip' in accepted) and (stat.st_size >= self.min_compress_size):
+                encoding = 'gzip'
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"" if encoding is None else "-" + encoding}"'
+
+        if self._is_not_modified(etag, stat.st_mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        if sidecar is not None:
+            with open(sidecar, 'rb') as f:
+                body = f.read()
+        else:
+            with open(path, 'rb') as f:
+                body = self.transform(path, f.read())
+        headers = {'Content-Type': content_type, 'ETag': etag, 'Last-Modified': self.date_time_string(stat.st_mtime)}
+        if content_type.startswith(self.compressible_types):
+            headers['Vary'] = 'Accept-Encoding'
+
+        status = HTTPStatus.OK
+        if encoding is not None:
+            if sidecar is None:
+                body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = encoding
+        elif ('Range' in self.headers) and (self.headers.get('If-Range', etag) == etag):
+            byte_range = _parse_range(self.headers['Range'], len(body))
+            if byte_range is None:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+            body = body[start:end + 1]
+            status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        return io.BytesIO(body)
+
+    def transform(self, path: str, data: bytes) -> bytes:
+        """Returns the body to serve for a file; override to modify files as they are served."""
+        return data
+
+    def _is_not_modified(self, etag: str, mtime: float) -> bool:
+        if 'If-None-Match' in self.headers:
+            etags = [tag.strip() for tag in self.headers['If-None-Match'].split(',')]
+            return ('*' in etags) or (etag in etags) or (f'W/{etag}' in etags)
+        if 'If-Modified-Since' in self.headers:
+            try:
+                return int(mtime) <= parsedate_to_datetime(self.headers['If-Modified-Since']).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        return False
+
+
+class LiveReloadRequestHandler(PreviewRequestHandler):
+    """As PreviewRequestHandler, also injecting LIVE_RELOAD_SCRIPT into every html page, and streaming reloads from a
+    LiveReload to the pages at LIVE_RELOAD_PATH."""
+    precompressed = False
+
+    def __init__(self, *args, live_reload: LiveReload, **kwargs):
+        self.live_reload = live_reload
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == LIVE_RELOAD_PATH:
+            return self.send_reloads()
+        return super().do_GET()
+
+    def transform(self, path: str, data: bytes) -> bytes:
+        if not path.endswith('.html'):
+            return data
+        body_end = data.lower().rfind(b'</body>')
+        if body_end == -1:
+            body_end = len(data)
+        return data[:body_end] + LIVE_RELOAD_SCRIPT + data[body_end:]
+
+    def send_reloads(self) -> None:
+        # the stream has no length, so it ends the connection (rather than keeping it alive for another request)
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        generation = self.live_reload.generation
+        try:
+            # comments keep the connection alive (and notice when the browser has gone away) between reloads
+            self.wfile.write(b'retry: 1000\n\n')
+            self.wfile.flush()
+            while True:
+                current = self.live_reload.wait(generation, timeout=15)
+                self.wfile.write(b': keep-alive\n\n' if current == generation else b'data: reload\n\n')
+                self.wfile.flush()
+                generation = current
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class PreviewServer(ThreadingHTTPServer):
+    # the default listen backlog (5) drops connections opened at once by a browser (or a load test), which are then
+    # retried after a second
+    request_queue_size = 128
+
+
+def _accepted_encodings(accept_encoding: str) -> Set[str]:
+    # content codings allowed by an Accept-Encoding header (those not given a q-value of 0); '*' allows br and gzip
+    accepted = set()
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.strip().partition(';')
+        q = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if (q is None) or (float(q.group(1)) > 0):
+            accepted.update(['br', 'gzip'] if name.strip() == '*' else [name.strip().lower()])
+    return accepted
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    # (first, last) byte positions of a single byte range; None if it cannot be satisfied (multiple ranges are served
+    # as their first range)
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*(,.*)?', range_header)
+    if (match is None) or (match.group(1) == match.group(2) == ''):
+        return None
+    if match.group(1) == '':
+        start, end = max(size - int(match.group(2)), 0), size - 1
+    else:
+        start = int(match.group(1))
+        end = size - 1 if match.group(2) == '' else min(int(match.group(2)), size - 1)
+    if (start >= size) or (start > end):
+        return None
+    return start, end
+
+
+def serve(directory: str = './', port: int = 8000, live_reload: Optional[LiveReload] = None, block: bool = True) -> PreviewServer:
+    """Serves 'directory' to localhost:'port', from a thread per connection.
+
+    Args:
+        directory: directory to serve
+        port: port to serve on
+        live_reload: (optional) if given, pages are reloaded in the browser each time it is notified
+        block: if False, serve from a daemon thread and return immediately
+
+    Returns:
+        the server (once it has been shut down, if 'block')
+    """
+    if live_reload is None:
+        handler = partial(PreviewRequestHandler, directory=directory)
+    else:
+        handler = partial(LiveReloadRequestHandler, directory=directory, live_reload=live_reload)
+
+    httpd = PreviewServer(('localhost', port), handler)
     print(f'Serving to http://localhost:{port}')
-    print('Press CTRL+C to quit.')
-    httpd.serve_forever()
-    
+    if block:
+        print('Press CTRL+C to quit.')
+        httpd.serve_forever()
+    else:
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    return httpd
+
+
 if __name__ == '__main__':
     import sys
     serve_dir = sys.argv[1] if len(sys.argv) > 1 else './'
@@ -6,23 +6,178 @@
 from sitegen import *
 
 
-def generate_sitemap(post_db: dict, format: str = 'txt') -> None:
+_SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def generate_sitemap(post_db: dict, format: str = 'txt', output: Optional[OutputTree] = None) -> None:
     """
 
     Args:
         post_db: data for all posts
-        format: (str) sitemap format; 'txt' is currently the only format supported
+        format: (str) sitemap format; 'txt' or 'xml' (see generate_xml_sitemap())
+        output: (optional) OutputTree through which to write the sitemap; if None, it is written directly
 
     Returns:
-        nothing, but saves a sitemap to Params.SITEMAP_PATH, within Params.OUTPUT_PATH
+        nothing, but saves a sitemap to Params.SITEMAP_PATH (or, for 'xml', Params.SITEMAP_XML_PATH), within
+        Params.OUTPUT_PATH
 
     """
 
-    if format is not 'txt':
+    if format == 'xml':
+        generate_xml_sitemap(post_db, output=output)
+        return
+    if format != 'txt':
         raise NotImplementedError
 
-    with open(os.path.join(Params.OUTPUT_PATH, Params.SITEMAP_PATH), 'w+') as f:
-        for page in Params.SITEMAP_INCLUDE:
-            f.write(f'{Params.BASE_URL}{page}\n')
-        for post in post_db:
-            f.write(f'{Params.BASE_URL}{post_db[post]["url"][1:]}\n')
\ No newline at end of file
+    sitemap = ''.join([f'{Params.BASE_URL}{page}\n' for page in Params.SITEMAP_INCLUDE + archive_pages(post_db)] +
+                      [f'{Params.BASE_URL}{post_db[post]["url"][1:]}\n' for post in post_db])
+
+    if output is not None:
+        output.write(Params.SITEMAP_PATH, sitemap)
+    else:
+        with open(os.path.join(Params.OUTPUT_PATH, Params.SITEMAP_PATH), 'w+') as f:
+            f.write(sitemap)
+
+
+def archive_pages(post_db: dict) -> List[str]:
+    """Returns the pages of each topic and year (if Params.SHARDED_ARCHIVES is enabled), as paths within the site."""
+    if not Params.SHARDED_ARCHIVES:
+        return []
+    return ([topic_page_url(topic)[1:] for topic in build_topic_dict(post_db)] +
+            [archive_page_url(year)[1:] for year in build_archive_dict(post_db)])
+
+
+def generate_xml_sitemap(post_db: dict, output: Optional[OutputTree] = None, path: str = Params.SITEMAP_XML_PATH, state_path: str = Params.SITEMAP_STATE_PATH, max_urls: int = Params.SITEMAP_MAX_URLS, max_bytes: int = Params.SITEMAP_MAX_BYTES) -> bool:
+    """Writes an XML sitemap of the pages in Params.SITEMAP_INCLUDE, topic and archive pages and all posts, with the date each page last changed
+    (<lastmod>). Must be run once every page has been written.
+
+    The lastmod of a page is worked out from the hash of its output file, recorded (with its lastmod) between builds:
+    while the hash is unchanged, so is the lastmod; when it changes, the lastmod is the date of the build. Pages seen for
+    the first time get the date of their post (or, for other pages, of the build).
+
+    The sitemap is streamed to its file(s), entry by entry. If it would hold more than 'max_urls' URLs or 'max_bytes'
+    bytes, it is split into numbered sitemaps ('sitemap-1.xml', ...) listed by a sitemap index at 'path'. If no URL and
+    no lastmod has changed since the previous build, the sitemap is not regenerated at all.
+
+    Args:
+        post_db: data for all posts
+        output: (optional) OutputTree through which to write the sitemap; if None, it is written directly
+        path: output path of the sitemap (or sitemap index)
+        state_path: path of the hashes and lastmods of the previous build
+        max_urls: maximum number of URLs in each sitemap
+        max_bytes: maximum size of each sitemap (units: bytes)
+
+    Returns:
+        True if the sitemap was regenerated, False if it was unchanged
+    """
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    else:
+        state = {'pages': {}, 'digest': None, 'files': []}
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    post_dates = {post_db[post]['url'][1:]: post_db[post]['date'].strftime('%Y-%m-%d') for post in post_db}
+
+    pages: Dict[str, List[str]] = {}  # page -> [hash, lastmod]
+    for page in list(Params.SITEMAP_INCLUDE) + archive_pages(post_db) + list(post_dates):
+        page_hash = _page_hash(page, output)
+        previous = state['pages'].get(page)
+        if (previous is not None) and (previous[0] == page_hash):
+            pages[page] = previous
+        else:
+            pages[page] = [page_hash, post_dates.get(page, today) if previous is None else today]
+
+    entries = [(f'{Params.BASE_URL}{page}', lastmod) for page, (page_hash, lastmod) in pages.items()]
+    digest = hashlib.md5(json.dumps([path, max_urls, max_bytes, entries]).encode('utf-8')).hexdigest()
+
+    if (digest == state['digest']) and _keep_files(state['files'], output):
+        files = state['files']
+        regenerated = False
+    else:
+        files = _write_sitemaps(entries, path, max_urls, max_bytes, output)
+        regenerated = True
+
+    state_dir = os.path.dirname(state_path)
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+    with open(state_path, 'w') as f:
+        json.dump({'pages': pages, 'digest': digest, 'files': files}, f, indent=0, sort_keys=True)
+
+    return regenerated
+
+
+def _write_sitemaps(entries: List[Tuple[str, str]], path: str, max_urls: int, max_bytes: int, output: Optional[OutputTree]) -> List[str]:
+    # writes the sitemap (or, if the entries do not fit in one, the numbered sitemaps and the sitemap index), and returns
+    # the paths of the files written
+    header = f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{_SITEMAP_NAMESPACE}">\n'
+    footer = '</urlset>\n'
+
+    # split the entries into shards, each within both limits
+    shards: List[Tuple[int, int]] = []  # (start, end) indices into 'entries'
+    start, n_bytes = 0, len(header) + len(footer)
+    for i, entry in enumerate(entries):
+        entry_bytes = len(_url_entry(*entry).encode('utf-8'))
+        if (i > start) and ((i - start >= max_urls) or (n_bytes + entry_bytes > max_bytes)):
+            shards.append((start, i))
+            start, n_bytes = i, len(header) + len(footer)
+        n_bytes += entry_bytes
+    shards.append((start, len(entries)))
+
+    def urlset(start: int, end: int) -> Iterator[str]:
+        yield header
+        for entry in entries[start:end]:
+            yield _url_entry(*entry)
+        yield footer
+
+    if len(shards) == 1:
+        _write_chunks(path, urlset(*shards[0]), output)
+        return [path]
+
+    base, ext = os.path.splitext(path)
+    shard_paths = [f'{base}-{i + 1}{ext}' for i in range(len(shards))]
+    for shard_path, shard in zip(shard_paths, shards):
+        _write_chunks(shard_path, urlset(*shard), output)
+
+    def sitemap_index() -> Iterator[str]:
+        yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{_SITEMAP_NAMESPACE}">\n'
+        for shard_path, (start, end) in zip(shard_paths, shards):
+            lastmod = max(lastmod for _, lastmod in entries[start:end])
+            yield (f'<sitemap><loc>{html_escape(Params.BASE_URL + shard_path.lstrip("/"))}</loc>'
+                   f'<lastmod>{lastmod}</lastmod></sitemap>\n')
+        yield '</sitemapindex>\n'
+
+    _write_chunks(path, sitemap_index(), output)
+
+    return [path] + shard_paths
+
+
+def _url_entry(url: str, lastmod: str) -> str:
+    return f'<url><loc>{html_escape(url)}</loc><lastmod>{lastmod}</lastmod></url>\n'
+
+
+def _write_chunks(path: str, chunks: Iterable[str], output: Optional[OutputTree]) -> None:
+    if output is not None:
+        output.write_chunks(path, chunks)
+    else:
+        with open(os.path.join(Params.OUTPUT_PATH, path), 'w') as f:
+            f.writelines(chunks)
+
+
+def _keep_files(paths: List[str], output: Optional[OutputTree]) -> bool:
+    # keeps the sitemap files of the previous build, if they all still exist
+    if output is not None:
+        return all([output.claim(path) for path in paths])
+    return all(os.path.exists(os.path.join(Params.OUTPUT_PATH, path)) for path in paths)
+
+
+def _page_hash(page: str, output: Optional[OutputTree]) -> Optional[str]:
+    # md5 hash of the output file of a page (from the output manifest, if possible), or None if there is none
+    if (output is not None) and (os.path.normpath(page) in output.manifest):
+        return output.manifest[os.path.normpath(page)]
+
+    full_path = os.path.join(Params.OUTPUT_PATH, page)
+    if not os.path.isfile(full_path):
+        return None
+    with open(full_path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
@@ -6,24 +6,134 @@
 from sitegen import *
 
 
+# Jinja2 environments, keyed by template directory; templates are compiled once per environment and reused
+_environments: Dict[str, Environment] = {}
+
+
+def get_environment(directory: str, bytecode_cache_dir: Optional[str] = Params.TEMPLATE_CACHE_PATH) -> Environment:
+    """Returns the long-lived Jinja2 environment for a template directory, creating (and caching) it on first use. Each
+    environment keeps its compiled templates in memory and, if 'bytecode_cache_dir' is given, on disk, so that later
+    builds can also skip compiling unchanged templates.
+
+    Args:
+        directory: template directory
+        bytecode_cache_dir: directory in which to cache compiled templates; if None, templates are only cached in memory
+
+    Returns:
+        Jinja2 environment with this blog's custom filters registered
+    """
+    if directory not in _environments:
+        if bytecode_cache_dir is not None:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        else:
+            bytecode_cache = None
+
+        env = Environment(loader=FileSystemLoader(directory), bytecode_cache=bytecode_cache)
+        env.filters['get_topic_url_links'] = get_topic_url_links
+        env.filters['render_sidebar_toc'] = render_sidebar_toc
+        env.filters['get_month_name'] = get_month_name
+        env.filters['get_pretty_date'] = get_pretty_date
+        env.filters['get_newest_posts'] = get_newest_posts
+        _environments[directory] = env
+
+    return _environments[directory]
+
+
 def render_from_template(directory: str, template_name: str, **kwargs: Union[dict, str, list]) -> str:
     """Using Jinja2, fill an HTML template with data from fields defined in the provided dict."""
-    loader = FileSystemLoader(directory)
-    env = Environment(loader=loader)
-    env.filters['get_topic_url_links'] = get_topic_url_links
-    env.filters['render_sidebar_toc'] = render_sidebar_toc
-    env.filters['get_month_name'] = get_month_name
-    env.filters['get_pretty_date'] = get_pretty_date
-    env.filters['get_newest_posts'] = get_newest_posts
-    template = env.get_template(template_name)
+    template = get_environment(directory).get_template(template_name)
+
+    with metrics.span(template_name, 'template'):
+        return template.render(**kwargs)
+
+
+def stream_from_template(directory: str, template_name: str, **kwargs: Union[dict, str, list]) -> Iterator[str]:
+    """As render_from_template(), but yields the html a piece at a time, as Jinja2 renders it, so that a page can be
+    written out while it is rendered (see OutputTree.write_chunks()) without ever being held in memory whole. (The
+    'template' span of a streamed page includes the time taken to write it.)"""
+    template = get_environment(directory).get_template(template_name)
+
+    with metrics.span(template_name, 'template'):
+        yield from template.generate(**kwargs)
+
+
+def render_post_fragments(post: dict) -> Dict[str, str]:
+    """Renders the parts of a post's pages that depend only on the post itself: its sidebar table of contents (if
+    'render_toc' is set), and the pretty date and topic links of its meta line. These are rendered once, when the post
+    is rendered, and stored with it (as 'fragments'), so that every page showing the post reuses them.
+
+    Args:
+        post: a single post_db entry
+
+    Returns:
+        dict of the html of each fragment
+    """
+    return {'sidebar_toc': render_sidebar_toc(post['toc_list']) if post.get('render_toc') is True else '',
+            'pretty_date': get_pretty_date(post['date']),
+            'topic_links': ', '.join(get_topic_url_links(post['topics'])),
+            'settings': _fragment_settings()}
+
+
+def add_post_fragments(post_db: dict) -> int:
+    """Adds the fragments of every post to post_db (see render_post_fragments()), only rendering those of posts that
+    do not have them yet, along with its related-posts block ('related_posts'). As the related-posts block lists the
+    titles and urls of other posts, it is kept with those it was rendered from, and only re-rendered when they change.
+
+    Returns:
+        number of fragments rendered
+    """
+    n_rendered = 0
+    for post in post_db.values():
+        if ('fragments' not in post) or (post['fragments'].get('settings') != _fragment_settings()):
+            post['fragments'] = render_post_fragments(post)
+            n_rendered += 1
+
+        # (as lists, as they are stored with the post as json)
+        related_posts = [[post_db[related_post]['url'], post_db[related_post]['post_title']]
+                         for related_post in post['related_posts']] if post['related_posts'] is not None else None
+        if ('related_posts' not in post['fragments']) or (post['fragments'].get('related_posts_of') != related_posts):
+            post['fragments']['related_posts'] = render_related_posts(related_posts)
+            post['fragments']['related_posts_of'] = related_posts
+            n_rendered += 1
+    metrics.count('fragments.rendered', n_rendered)
+
+    return n_rendered
+
+
+def _fragment_settings() -> list:
+    # the settings that fragments depend on besides the post itself (topic links point to topic pages when archives are
+    # sharded, and the related-posts block is rendered from its template), so that the fragments of cached posts are
+    # re-rendered when they change
+    environment = get_environment(Params.TEMPLATE_PATH)
+    template_source = environment.loader.get_source(environment, 'related-posts.html')[0]
+    return [Params.BLOG_PATH, Params.SHARDED_ARCHIVES, Params.TOPIC_PAGE_PATH,
+            hashlib.md5(template_source.encode('utf-8')).hexdigest()]
+
+
+def render_related_posts(related_posts: Optional[List[List[str]]]) -> str:
+    """Renders the related-posts block of a post's sidebar (with the 'related-posts.html' template), given the url and
+    title of each related post (or nothing, if None)."""
+    return render_from_template(Params.TEMPLATE_PATH, 'related-posts.html', related_posts=related_posts)
+
+
+def topic_page_url(topic_name: str) -> str:
+    """Returns the url of the listing of a topic's posts: its own page, if Params.SHARDED_ARCHIVES is enabled, or else
+    its section of the 'all-topics' page."""
+    if Params.SHARDED_ARCHIVES:
+        return f'/{Params.BLOG_PATH}{Params.TOPIC_PAGE_PATH.format(topic=sanitize_string(topic_name.lower()))}'
+    return f'/{Params.BLOG_PATH}all-topics.html#{topic_name}'
+
 
-    return template.render(**kwargs)
+def archive_page_url(year: int) -> str:
+    """Returns the url of the page listing a year's posts (if Params.SHARDED_ARCHIVES is enabled)."""
+    return f'/{Params.BLOG_PATH}{Params.ARCHIVE_PAGE_PATH.format(year=year)}'
 
 
 def get_topic_url_links(topic_names: list) -> list:
     topic_links = []
     for topic_name in topic_names:
-        topic_url = f'/{Params.BLOG_PATH}all-topics.html#{topic_name}'
+        topic_url = topic_page_url(topic_name)
         topic_link = f'<a class="text-muted" href="{topic_url}">{topic_name}</a>'
         topic_links.append(topic_link)
     return topic_links
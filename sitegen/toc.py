@@ -18,22 +18,53 @@ def build_toc_list(post: Dict[str, Union[str, list]]) -> List[Tuple[int, str, st
     """
     soup_post = BeautifulSoup(post['post_body'], features='html.parser')
 
-    toc_list = [(1, post['post_title'], post['slug'])]
+    return build_toc_entries(soup_post.find_all(['h2', 'h3', 'h4']), post['post_title'], post['slug'])
 
-    for i, heading in enumerate(soup_post.find_all(['h2', 'h3', 'h4'])):
-        heading_level = heading.name[-1]
-        heading_string = heading.get_text()
-        heading_anchor = f'{post["slug"]}${sanitize_string(heading.get_text().lower().strip())}'
 
-        all_anchors = [toc_item[2] for toc_item in toc_list]
-        if heading_anchor in all_anchors:
-            heading_anchor = f'_{str(i)}'
+def build_toc_entries(headings: List[Tag], post_title: str, slug: str) -> List[Tuple[int, str, str]]:
+    """Given the h2 -> h4 headings of a post (as bs4 tags, in document order), returns the post's TOC as a list of
+    tuples of <heading level (i.e. 1, 2, 3, or 4)>, <heading>, and <anchor>
+
+    Args:
+        headings: h2 -> h4 heading tags of the post
+        post_title: title of the post
+        slug: post slug
+
+    Returns:
+        list of TOC entries
+    """
+    toc_list = [(1, post_title, slug)]
 
-        toc_list.append((heading_level, heading_string, heading_anchor))
+    for heading in headings:
+        append_toc_entry(toc_list, heading.name[-1], heading.get_text(), slug)
 
     return toc_list
 
 
+def append_toc_entry(toc_list: List[Tuple[int, str, str]], heading_level: str, heading_string: str, slug: str) -> str:
+    """Appends a heading to a post's toc_list (which must already contain the post title, as its first entry), giving it
+    an anchor that is unique within the post.
+
+    Args:
+        toc_list: list of TOC entries built so far
+        heading_level: heading level (i.e. '2', '3', or '4')
+        heading_string: text of the heading
+        slug: post slug
+
+    Returns:
+        the heading's anchor
+    """
+    heading_anchor = f'{slug}${sanitize_string(heading_string.lower().strip())}'
+
+    all_anchors = [toc_item[2] for toc_item in toc_list]
+    if heading_anchor in all_anchors:
+        heading_anchor = f'_{str(len(toc_list) - 1)}'
+
+    toc_list.append((heading_level, heading_string, heading_anchor))
+
+    return heading_anchor
+
+
 def build_toc_html(toc_list: List[Tuple[int, str, str]]) -> str:
     """Given a list of tuples of (heading_level, heading, anchor) for a given post, converts it to an html-formatted
     table of contents, returned as a string.
@@ -51,14 +82,19 @@ def build_toc_html(toc_list: List[Tuple[int, str, str]]) -> str:
                 raise TocError('Post title should be the only h1 heading.')
             toc_md += f'{(int(heading_level) - 1) * " "}- [{heading_string}](#{heading_anchor})\n'
 
-        converter = m.Markdown(m.HtmlRenderer(), extensions=('math', 'math_explicit', 'no-intra-emphasis', 'strikethrough', 'superscript',))
-        toc_html = converter(toc_md)
+        toc_html = _get_toc_converter()(toc_md)
     else:
         toc_html = ''
 
     return toc_html
 
 
+@lru_cache(maxsize=None)
+def _get_toc_converter() -> object:
+    # the misaka converter for tables of contents, created on first use and reused for every post
+    return m.Markdown(m.HtmlRenderer(), extensions=('math', 'math_explicit', 'no-intra-emphasis', 'strikethrough', 'superscript',))
+
+
 def render_sidebar_toc(toc_list: List[Tuple[int, str, str]]) -> str:
     """Function used within Jinja2 template to output a sidebar table of contents (using the h2 -> h4 headings as TOC
     items), given the toc_list entry for a post in post_db, with the appropriate html-formatting for this blog.
@@ -104,3 +140,24 @@ def add_toc_id_tags(post: Dict[str, Union[str, list]]) -> Dict[str, str]:
     post_copy['post_body'] = str(soup_post)
 
     return post_copy
+
+
+def add_toc_ids(headings: List[Tag], post_title: str, slug: str) -> List[Tuple[int, str, str]]:
+    """Builds the TOC of a post from its h2 -> h4 headings (as bs4 tags, in document order), adding the matching anchor
+    id to each heading in place. Equivalent to build_toc_list() followed by add_toc_id_tags(), without serializing and
+    re-parsing the post.
+
+    Args:
+        headings: h2 -> h4 heading tags of the post
+        post_title: title of the post
+        slug: post slug
+
+    Returns:
+        list of TOC entries
+    """
+    toc_list = build_toc_entries(headings, post_title, slug)
+
+    for heading, toc_item in zip(headings, toc_list[1:]):
+        heading['id'] = toc_item[2]
+
+    return toc_list
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# transforms.py
+
+from sitegen import *
+
+
+class HtmlTransformer:
+    """Applies a set of rules to a bs4 object, collecting the tags each rule is registered for in a single walk of the
+    tree (rather than one find_all() scan per rule).
+
+    Rules are applied in the order in which they were registered, each to its tags in document order, so that every rule
+    sees the tree exactly as the previous rules left it (just as if each had been run as a separate pass). Tags that an
+    earlier rule has removed from the tree are skipped. Rules only see tags that existed when the walk was made; a rule
+    that creates tags another rule is registered for must handle them itself.
+
+    Rules are functions of (tag, soup_body, context), where 'context' is a dict shared by all rules for one call to
+    transform(), and are registered with the rule() decorator:
+
+        transformer = HtmlTransformer()
+
+        @transformer.rule('table', error=SomeError)
+        def style_table(table, soup_body, context):
+            table['class'] = 'table'
+    """
+    def __init__(self):
+        self.rules: List[Tuple[Tuple[str, ...], Callable, Optional[type]]] = []
+        self.tag_names: Dict[str, List[int]] = {}
+
+    def rule(self, *tag_names: str, error: Optional[type] = None) -> Callable:
+        """Decorator registering a rule for the given tag names.
+
+        Args:
+            tag_names: names of the tags the rule applies to
+            error: (optional) exception type with which to wrap any exception raised by the rule
+        """
+        def register(function: Callable) -> Callable:
+            for tag_name in tag_names:
+                self.tag_names.setdefault(tag_name, []).append(len(self.rules))
+            self.rules.append((tag_names, function, error))
+            return function
+
+        return register
+
+    def transform(self, soup_body: object, context: Optional[dict] = None) -> object:
+        """Applies all rules to the input bs4 object.
+
+        Args:
+            soup_body: bs4 object input
+            context: (optional) dict shared by all rules; e.g. used to collect data from the tree
+
+        Returns:
+            modified bs4 object
+        """
+        if not isinstance(soup_body, BeautifulSoup):
+            raise TypeError('Input must be a bs4.BeautifulSoup object')
+
+        context = {} if context is None else context
+
+        # single walk of the tree, bucketing tags by the rules registered for them
+        matched_tags: List[List[Tag]] = [[] for _ in self.rules]
+        for node in soup_body.descendants:
+            if isinstance(node, Tag) and (node.name in self.tag_names):
+                for rule_index in self.tag_names[node.name]:
+                    matched_tags[rule_index].append(node)
+
+        for (tag_names, function, error), tags in zip(self.rules, matched_tags):
+            if not tags:
+                continue
+            with metrics.span(function.__name__, 'transform', tags=len(tags)):
+                for tag in tags:
+                    if not _is_attached(tag, soup_body):
+                        continue
+                    if error is None:
+                        function(tag, soup_body, context)
+                    else:
+                        try:
+                            function(tag, soup_body, context)
+                        except Exception as e:
+                            raise error from e
+
+        return soup_body
+
+
+def _is_attached(tag: Tag, soup_body: object) -> bool:
+    """Checks whether a tag is (still) part of the tree of 'soup_body'."""
+    while tag.parent is not None:
+        tag = tag.parent
+    return tag is soup_body
@@ -41,6 +41,16 @@ def md5_hash(filename: str, path: str) -> str:
     return hash_str
 
 
+def file_stat(file: Union[str, int]) -> List[int]:
+    """Returns the size, mtime (in ns) and inode of a file, which are taken to be unchanged only if the file is.
+
+    Args:
+        file: path or file descriptor of the file
+    """
+    stat = os.stat(file)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
 def sort_posts(post_db: dict, sort_key: str) -> list:
     """Return a sorted list of posts, given a dict of data for all posts.
 
@@ -53,12 +63,8 @@ def sort_posts(post_db: dict, sort_key: str) -> list:
     """
     valid_keys = ['date', 'post_title']
     assert sort_key in valid_keys, 'Cannot sort by that key. '
-    reverse = True if (sort_key == 'date') else False
-
-    post_list = post_db.keys()
-    sorted_posts = sorted(post_list, key=lambda post: str(post_db[post][sort_key]), reverse=reverse)
 
-    return sorted_posts
+    return get_post_index(post_db).sorted(sort_key)
 
 
 def get_newest_posts(post_db: dict, number: int = None, topic_name: Optional[str] = None) -> list:
@@ -73,12 +79,7 @@ def get_newest_posts(post_db: dict, number: int = None, topic_name: Optional[str
     Returns:
         list of newest posts
     """
-    newest_posts = sort_posts(post_db, 'date')
-
-    if topic_name is None:
-        return newest_posts[:number]
-    else:
-        return [post for post in newest_posts if topic_name in post_db[post]['topics']][:number]
+    return get_post_index(post_db).newest(number, topic_name)
 
 
 def is_markdown(filename: str) -> bool:
@@ -109,11 +110,8 @@ def make_output_dirs(post_db: dict, pagination_dict: dict, output_dir: str = './
             base directory
     """
     dirs = list(set([os.path.dirname(post['url']) for post in post_db.values()]))
-    try:
-        for dir in dirs:
-            os.makedirs(output_dir + dir)
-    except:
-        raise FileExistsError
+    for dir in dirs:
+        os.makedirs(output_dir + dir, exist_ok=True)
 
     page_dirs = list(set([os.path.dirname(pagination_dict[page]['url']) for page in pagination_dict.keys() if type(page) is int]))
 
@@ -139,21 +137,74 @@ def compress_blog_images(soup_body: object, max_width: int = Params.MAX_IMAGE_WI
     """
     assert isinstance(soup_body, BeautifulSoup), 'Input must be a bs4.BeautifulSoup object'
 
+    # with responsive images, the srcset of each image is added to its tag
+    srcsets = {} if Params.RESPONSIVE_IMAGES else None
+
     for img in soup_body.find_all('img'):
-        # retrieves path of input image from post
-        input_image = img['src']
-        # compresses image and returns the relative path
-        max_width = None if input_image.split('.')[-2][-5:] == 'large' else max_width
-        compressed_image = compress_image(posts_dir + input_image, output_dir + blog_image_dir, max_width)
-        # removes output_dir from the path to make it suitable for use as a url and replaces the url
-        img['src'] = '/' + compressed_image.replace(output_dir, '')
+        compress_blog_image(img, max_width, posts_dir, output_dir, blog_image_dir, srcsets=srcsets)
 
     return soup_body
 
 
+def compress_blog_image(img: object, max_width: int = Params.MAX_IMAGE_WIDTH, posts_dir: str = Params.POSTS_PATH, output_dir: str = Params.OUTPUT_PATH, blog_image_dir: str = Params.BLOG_IMAGE_PATH, image_jobs: Optional[list] = None, srcsets: Optional[dict] = None) -> None:
+    """Locates the file of a single <img> tag, compresses it, moves it to the output dir, and changes the tag's url to
+    reflect this change. If image filename ends with 'large,' compress but do not scale.
+
+    Args:
+        img: bs4 <img> tag
+        posts_dir: directory containing input posts with links to images
+        output_dir: directory to which blog is written
+        blog_image_dir: blog image directory
+        image_jobs: (optional) if given, the image is not compressed here; its job is appended to this list instead
+        srcsets: (optional) if given, responsive variants of the image are also written (see plan_variants()), their
+            srcsets are added to this dict (keyed by the url of the image), and to the tag
+    """
+    img['src'] = blog_image_src(img['src'], max_width, posts_dir, output_dir, blog_image_dir, image_jobs, srcsets)
+
+    if (srcsets is not None) and (img['src'] in srcsets):
+        add_srcset(img, srcsets[img['src']])
+
+
+def blog_image_src(input_image: str, max_width: int = Params.MAX_IMAGE_WIDTH, posts_dir: str = Params.POSTS_PATH, output_dir: str = Params.OUTPUT_PATH, blog_image_dir: str = Params.BLOG_IMAGE_PATH, image_jobs: Optional[list] = None, srcsets: Optional[dict] = None) -> str:
+    """Locates an image linked from a post, compresses it, moves it to the output dir, and returns its new url. If image
+    filename ends with 'large,' compress but do not scale.
+
+    Args:
+        input_image: path of the image, as linked from the post (relative to posts_dir)
+        posts_dir: directory containing input posts with links to images
+        output_dir: directory to which blog is written
+        blog_image_dir: blog image directory
+        image_jobs: (optional) if given, the image is not compressed here; its job is appended to this list instead (to
+            be run by process_images())
+        srcsets: (optional) if given, responsive variants of the image are also written (see plan_variants()), and
+            their srcsets are added to this dict (keyed by the url of the image)
+
+    Returns:
+        url of the compressed image
+    """
+    max_width = None if input_image.split('.')[-2][-5:] == 'large' else max_width
+    job = plan_image(posts_dir + input_image, output_dir + blog_image_dir, max_width)
+    # removes output_dir from the path to make it suitable for use as a url
+    img_src = '/' + job.output.replace(output_dir, '')
+
+    jobs = [job]
+    if srcsets is not None:
+        variant_jobs, image_srcsets = plan_variants(job, img_src)
+        jobs += variant_jobs
+        if image_srcsets:
+            srcsets[img_src] = image_srcsets
+
+    if image_jobs is None:
+        process_images(jobs)
+    else:
+        image_jobs.extend(jobs)
+
+    return img_src
+
+
 def compress_image(input_image: str, output_dir: str, max_width: Optional[int] = None) -> str:
-    """Scales and compresses an image. If compressed image already exists in output_dir, returns the output file path
-    but does not recompress the image.
+    """Scales and compresses an image. If the image has already been compressed with the same parameters (see
+    ImageCache), it is copied from the image cache instead.
 
     Args:
         input_image: input file path
@@ -164,53 +215,8 @@ def compress_image(input_image: str, output_dir: str, max_width: Optional[int] =
     Returns:
         output file path
     """
-    assert type(input_image) is str, 'Input must be a string.'
-    assert (output_dir[-1] == '/')
-
-    def _resize_im(image, maximum_width):
-        if (maximum_width is not None) and (image.width > maximum_width):
-            image = image.resize((maximum_width, int((maximum_width / image.width) * image.height)), Image.LANCZOS)
-        return image
-
-    if os.path.exists(output_dir) is False:
-        os.makedirs(output_dir)
-
-    filename, ext = os.path.basename(input_image).split('.')
-
-    if ext.lower() in ['jpg', 'jpeg', 'png', 'gif', 'tif', 'tiff']:
-        with Image.open(input_image) as im:
-            if im.format is 'JPEG':
-                output_image = f'{output_dir}{filename}_c.jpg'
-                if os.path.exists(output_image) is False:
-                    im = _resize_im(im, max_width)
-                    im.save(output_image, 'JPEG', optimize=True, quality=75, progressive=True)
-            elif im.format is 'PNG':
-                output_image = f'{output_dir}{filename}_c.png'
-                if os.path.exists(output_image) is False:
-                    im = _resize_im(im, max_width)
-                    im.save(output_image, 'PNG', optimize=True)
-            elif im.format is 'GIF':
-                output_image = f'{output_dir}{filename}_c.gif'
-                if os.path.exists(output_image) is False:
-                    im = _resize_im(im, max_width)
-                    im.save(output_image, 'GIF', save_all=True, optimize=True, loop=0)
-            elif im.format is 'TIFF':
-                output_image = f'{output_dir}{filename}_c.jpg'
-                if os.path.exists(output_image) is False:
-                    im = _resize_im(im, max_width)
-                    im.save(output_image, 'JPEG', optimize=True, quality=75, progressive=True)
-            else:
-                print(f'Input image "{input_image}" is not a recognized {ext} image. Moving to output without compressing or scaling.')
-                output_image = f'{output_dir}{filename}{ext}'
-                if os.path.exists(output_image) is False:
-                    shutil.move(input_image, output_image)
-    elif ext.lower() == 'svg':
-        output_image = f'{output_dir}{filename}_c.svg'
-        if os.path.exists(output_image) is False:
-            subprocess.run(f'./svgcleaner/svgcleaner {input_image} {output_image}', shell=True)
-    else:
-        output_image = f'{output_dir}{filename}{ext}'
-        if os.path.exists(output_image) is False:
-            shutil.move(input_image, output_image)
+    with metrics.span('compress_image', 'compress_image', source=input_image):
+        job = plan_image(input_image, output_dir, max_width)
+        process_images([job])
 
-    return output_image
+    return job.output
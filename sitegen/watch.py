@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# watch.py
+
+from sitegen import *
+
+
+def snapshot_files(directories: List[str]) -> Dict[str, List[int]]:
+    """Returns the stat (size, mtime and inode) of every file in 'directories' (recursively), keyed by path. Directories
+    nested within another of 'directories' are only walked once.
+    """
+    roots = [os.path.abspath(directory) for directory in directories if os.path.exists(directory)]
+    roots = [root for root in roots if not any(root.startswith(os.path.join(other, '')) for other in roots)]
+
+    files: Dict[str, List[int]] = {}
+    for root in sorted(set(roots)):
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    files[path] = file_stat(path)
+                except FileNotFoundError:
+                    # removed since the directory was listed
+                    continue
+
+    return files
+
+
+def watch_files(directories: List[str], interval: float = Params.WATCH_INTERVAL) -> Iterator[List[str]]:
+    """Polls 'directories' for changes, yielding the paths of the files that have been added, modified or removed each
+    time any have. Polling (rather than inotify or similar) keeps this dependency-free and portable; each poll costs one
+    stat() per file watched.
+
+    Args:
+        directories: directories to watch (recursively)
+        interval: time between polls (units: s)
+
+    Yields:
+        sorted list of the paths of changed files
+    """
+    previous = snapshot_files(directories)
+    while True:
+        time.sleep(interval)
+        current = snapshot_files(directories)
+        changed = sorted(path for path in set(previous) | set(current) if previous.get(path) != current.get(path))
+        previous = current
+        if changed:
+            yield changed
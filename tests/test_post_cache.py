@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# test_post_cache.py
+
+"""
+Tests of the post database cache (sitegen.post_cache). Run from the repo root:
+
+    python3 -m pytest tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitegen import *
+
+
+def make_post(post_date: object) -> dict:
+    return {'hash': hashlib.md5(str(post_date).encode('utf-8')).hexdigest(), 'post_title': 'Notes', 'date': post_date, 'images': [],
+            'source': 'notes.md', 'source_stat': [1, 2, 3], 'render_settings': post_render_settings()}
+
+
+class PostCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sitegen-test-')
+        self.cache = PostCache(os.path.join(self.directory, 'posts.db'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_datetime(self):
+        post_date = datetime(2019, 3, 2, 14, 30)
+        self.assertEqual(self.cache.update({'notes': make_post(post_date)}), (1, 0))
+        self.assertEqual(self.cache['notes']['date'], post_date)
+        self.assertIs(type(self.cache['notes']['date']), datetime)
+
+    def test_date(self):
+        # a date-only 'date:' in the front matter is loaded by yaml as a date
+        post_date = date(2019, 3, 2)
+        self.assertEqual(self.cache.update({'notes': make_post(post_date)}), (1, 0))
+        self.assertEqual(self.cache['notes']['date'], post_date)
+        self.assertIs(type(self.cache['notes']['date']), date)
+
+    def test_unchanged_posts_not_written(self):
+        post_db = {'notes': make_post(date(2019, 3, 2))}
+        self.assertEqual(self.cache.update(post_db), (1, 0))
+        self.assertEqual(self.cache.update(post_db), (0, 0))
+        self.assertEqual(self.cache.update({}), (0, 1))
+        self.assertNotIn('notes', self.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+# test_s3.py
+
+"""
+Tests of the deployer (sitegen.s3) against an in-memory S3 stand-in (moto). Run from the repo root:
+
+    python3 -m pytest tests
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sitegen import *
+from sitegen.s3 import CACHE_CONTROL_DEFAULT, CACHE_CONTROL_HTML, CACHE_CONTROL_IMMUTABLE
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+BUCKET = 'sitegen-test'
+
+
+@unittest.skipIf((boto3 is None) or (mock_aws is None), 'boto3 and moto are needed to test deploys')
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        for variable in ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY']:
+            os.environ.setdefault(variable, 'testing')
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+        self.mock = mock_aws()
+        self.mock.start()
+        self.client = boto3.client('s3', region_name='us-east-1')
+        self.client.create_bucket(Bucket=BUCKET)
+
+        self.directory = tempfile.mkdtemp(prefix='sitegen-test-')
+        self.output_dir = os.path.join(self.directory, 'output')
+        self.manifest_path = os.path.join(self.directory, 'deploy_manifest.json')
+        self.write('index.html', b'<html>index</html>')
+        self.write('blog/notes-20190302.html', b'<html>notes</html>')
+        self.write('assets/style.css', b'body {}')
+
+    def tearDown(self):
+        self.mock.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self, key: str, data: bytes) -> None:
+        path = os.path.join(self.output_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def sync(self) -> Tuple[List[str], List[str]]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync(self.output_dir, BUCKET, self.manifest_path, workers=2, client=self.client)
+
+    def test_uploads_only_changes(self):
+        uploaded, deleted = self.sync()
+        self.assertEqual(sorted(uploaded), ['assets/style.css', 'blog/notes-20190302.html', 'index.html'])
+        self.assertEqual(self.sync(), ([], []))
+
+        self.write('index.html', b'<html>index, edited</html>')
+        os.remove(os.path.join(self.output_dir, 'assets/style.css'))
+        self.assertEqual(self.sync(), (['index.html'], ['assets/style.css']))
+        self.assertEqual(self.client.get_object(Bucket=BUCKET, Key='index.html')['Body'].read(),
+                         b'<html>index, edited</html>')
+        self.assertNotIn('Contents', self.client.list_objects_v2(Bucket=BUCKET, Prefix='assets/'))
+
+    def test_stale_output_manifest(self):
+        # files changed since the output manifest was saved (e.g. by a failed build) are still uploaded
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            self.output_dir = Params.OUTPUT_PATH
+            self.sync()
+            os.makedirs(os.path.dirname(Params.OUTPUT_MANIFEST_PATH), exist_ok=True)
+            with open(Params.OUTPUT_MANIFEST_PATH, 'w') as f:
+                json.dump({'index.html': hashlib.md5(b'<html>index</html>').hexdigest()}, f)
+            self.write('index.html', b'<html>index, edited</html>')
+            self.assertEqual(self.sync(), (['index.html'], []))
+        finally:
+            os.chdir(cwd)
+
+    def test_headers(self):
+        self.sync()
+        headers = self.client.head_object(Bucket=BUCKET, Key='blog/notes-20190302.html')
+        self.assertEqual(headers['ContentType'], 'text/html')
+        self.assertEqual(headers['CacheControl'], CACHE_CONTROL_HTML)
+        self.assertEqual(self.client.head_object(Bucket=BUCKET, Key='assets/style.css')['CacheControl'],
+                         CACHE_CONTROL_DEFAULT)
+
+    def test_manifest_from_bucket(self):
+        # a file large enough to be uploaded in parts, whose ETag is not its md5 hash
+        self.write('images/large.bin', os.urandom(20 * 1024 * 1024))
+        self.sync()
+        self.assertIn('-', self.client.head_object(Bucket=BUCKET, Key='images/large.bin')['ETag'])
+
+        os.remove(self.manifest_path)
+        self.write('index.html', b'<html>index, edited</html>')
+        self.assertEqual(self.sync(), (['index.html'], []))
+
+
+class ObjectHeadersTest(unittest.TestCase):
+    def test_cache_control(self):
+        self.assertEqual(object_headers('blog/release-deadbeef.html')['CacheControl'], CACHE_CONTROL_HTML)
+        self.assertEqual(object_headers('blog/release-deadbeef.html.gz')['CacheControl'], CACHE_CONTROL_HTML)
+        self.assertEqual(object_headers('blog/release-deadbeef.html.gz')['ContentEncoding'], 'gzip')
+        self.assertEqual(object_headers('assets/app.0123abcd.js')['CacheControl'], CACHE_CONTROL_IMMUTABLE)
+        self.assertEqual(object_headers('assets/app.js')['CacheControl'], CACHE_CONTROL_DEFAULT)
+
+
+if __name__ == '__main__':
+    unittest.main()